@@ -0,0 +1,185 @@
+import argparse
+import collections
+import sys
+import time
+
+import pandas as pd
+
+from planner_core.parallel import default_workers, submit_to_process_pool
+from planner_core.profiles import SUMMARY_FIELDS, plan_profiles
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+### Reading profiles a chunk at a time ###
+# Profiles have the fields of the app's input widgets (see planner_core.profiles)
+# and an optional profile_id. Missing fields and blank cells take the app's defaults
+def read_profile_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    if path.endswith((".jsonl", ".ndjson")):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size)
+    elif path.endswith(".csv"):
+        reader = pd.read_csv(path, chunksize=chunk_size)
+    else:
+        raise ValueError(f"Profiles must be a .csv or .jsonl file, got {path}")
+
+    with reader:
+        for chunk in reader:
+            yield chunk.to_dict("records")
+
+
+### Writing results as they come in ###
+# Parquet goes through pyarrow one row group per chunk, anything else is
+# appended to a CSV file, so the output never has to be held in memory. Without
+# pyarrow a .parquet path fails here, before any profile is planned
+class TableWriter:
+    def __init__(self, path):
+        self.path = path
+        self.parquet_writer = None
+        self.rows_written = 0
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                raise ValueError(
+                    f"Writing {path} needs pyarrow (pip install pyarrow), "
+                    "or write a .csv instead"
+                ) from None
+
+    def write(self, frame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table.cast(self.parquet_writer.schema))
+        else:
+            frame.to_csv(
+                self.path,
+                mode="w" if self.rows_written == 0 else "a",
+                header=self.rows_written == 0,
+                index=False,
+            )
+        self.rows_written += len(frame)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+# The same columns and types for every chunk, whichever of its profiles failed
+def summary_frame(summaries):
+    frame = pd.DataFrame(summaries, columns=SUMMARY_FIELDS)
+    lasting_years = [field for field in SUMMARY_FIELDS if field.startswith("lasting")]
+    return frame.astype(dict(dict.fromkeys(lasting_years, "Int64"), error="string"))
+
+
+################################################
+
+
+### Plans every profile in a file ###
+# Chunks of profiles are planned in the worker processes, with at most two chunks
+# per worker in flight, and written out in input order. Profiles that fail are
+# written with their error in the error column. Returns the number of profiles,
+# how many of them failed and the time taken
+def run_batch(
+    profiles_path,
+    output_path,
+    yearly_output_path=None,
+    max_workers=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    start = time.perf_counter()
+    max_workers = max_workers or default_workers()
+    include_yearly = yearly_output_path is not None
+
+    summary_writer = TableWriter(output_path)
+    yearly_writer = TableWriter(yearly_output_path) if include_yearly else None
+    n_failed = 0
+
+    def write_results(results):
+        nonlocal n_failed
+        summaries, yearly_columns = results
+        frame = summary_frame(summaries)
+        n_failed += int(frame["error"].notna().sum())
+        summary_writer.write(frame)
+        if yearly_writer is not None and yearly_columns is not None:
+            yearly_writer.write(pd.DataFrame(yearly_columns))
+
+    try:
+        chunks = read_profile_chunks(profiles_path, chunk_size=chunk_size)
+        if max_workers <= 1:
+            for profiles in chunks:
+                write_results(plan_profiles(profiles, include_yearly=include_yearly))
+        else:
+            in_flight = collections.deque()
+            for profiles in chunks:
+                if len(in_flight) >= 2 * max_workers:
+                    write_results(in_flight.popleft().result())
+                in_flight.append(
+                    submit_to_process_pool(
+                        max_workers,
+                        plan_profiles,
+                        profiles,
+                        include_yearly=include_yearly,
+                    )
+                )
+            while in_flight:
+                write_results(in_flight.popleft().result())
+    finally:
+        summary_writer.close()
+        if yearly_writer is not None:
+            yearly_writer.close()
+
+    return summary_writer.rows_written, n_failed, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the retirement planner over a file of client profiles"
+    )
+    parser.add_argument("profiles", help="Profiles as a .csv or .jsonl file")
+    parser.add_argument(
+        "output", help="Summary per profile, .parquet or .csv (the default)"
+    )
+    parser.add_argument(
+        "--yearly-output",
+        help="Also write the year by year values of every profile to this file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="Worker processes (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Profiles sent to a worker at a time",
+    )
+    args = parser.parse_args(argv)
+
+    n_profiles, n_failed, elapsed = run_batch(
+        args.profiles,
+        args.output,
+        yearly_output_path=args.yearly_output,
+        max_workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    print(
+        f"Planned {n_profiles} profiles in {elapsed:.2f} s "
+        f"({n_profiles / elapsed:.1f} profiles/sec)",
+        file=sys.stderr,
+    )
+    if n_failed:
+        print(
+            f"{n_failed} profiles could not be planned, see the error column of "
+            f"{args.output}",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+
+from planner_core.calculations import bucket_strategy_simulator
+from planner_core.parallel import bucket_strategy_simulator_parallel, default_workers
+from planner_core.profiles import (
+    PROFILE_DEFAULTS,
+    bucket_simulator_kwargs,
+    profile_inputs,
+    specific_values,
+    yearly_values,
+)
+from planner_core.utils import (
+    calc_compound_returns,
+    calc_retirement_balances_n_expenses,
+)
+from planner_core.withdrawals import WITHDRAWAL_POLICIES
+
+DEFAULT_HISTORY = "benchmark_history.json"
+HORIZONS = (10, 30, 100)
+PATH_COUNTS = (10, 1000, 100000, 1000000)
+# Monthly investments and expenses are also timed, to keep them as quick as yearly
+MONTHLY_STEPS = 12
+# Correlations of the fund returns and inflation for the joint scenario cases
+SCENARIO_CORRELATION = (
+    (1.0, 0.3, 0.1, 0.05, 0.2),
+    (0.3, 1.0, 0.6, 0.5, 0.0),
+    (0.1, 0.6, 1.0, 0.85, -0.1),
+    (0.05, 0.5, 0.85, 1.0, -0.15),
+    (0.2, 0.0, -0.1, -0.15, 1.0),
+)
+# bucket_strategy_simulator holds every path in memory (4 returns x years x paths),
+# above this many paths the chunked simulator is timed instead
+MAX_PATHS_IN_MEMORY = 100000
+
+
+### Benchmark cases ###
+# Each case is (name, params, function to time). The memoized functions are timed
+# through __wrapped__, so the cache is not what gets measured
+def profile_for_horizon(horizon):
+    # Half of the horizon before retirement and half in retirement
+    return profile_inputs(
+        dict(
+            current_age=30,
+            retire_age=30 + horizon // 2,
+            estimated_years_retirement=horizon - horizon // 2,
+        )
+    )
+
+
+def benchmark_cases(horizons=HORIZONS, path_counts=PATH_COUNTS, max_workers=1):
+    cases = []
+    for horizon in horizons:
+        inputs = profile_for_horizon(horizon)
+        values = specific_values(inputs, cached=False)
+
+        cases += [
+            (
+                "calc_compound_returns",
+                dict(years=horizon),
+                partial(calc_compound_returns, p=1e6, r=12.0, t=horizon),
+            ),
+            (
+                "calc_retirement_balances_n_expenses",
+                dict(years=horizon),
+                partial(
+                    calc_retirement_balances_n_expenses,
+                    initial_corpus=PROFILE_DEFAULTS["assumed_retirement_corpus"],
+                    inital_expense=values["current_expenses_at_retirement"],
+                    inflation=inputs["inflation_after_retirement"],
+                    returns=inputs["net_rate_return_expected_after_retire"],
+                    n_years_in_retire=horizon,
+                ),
+            ),
+            (
+                "calc_specific_values_on_input",
+                dict(years=horizon),
+                partial(specific_values, inputs, cached=False),
+            ),
+            (
+                "calculate_yearly_values",
+                dict(years=horizon),
+                partial(yearly_values, inputs, values, cached=False),
+            ),
+            (
+                "calculate_yearly_values",
+                dict(years=horizon, steps=MONTHLY_STEPS),
+                partial(
+                    yearly_values,
+                    dict(inputs, steps_per_year=MONTHLY_STEPS),
+                    values,
+                    cached=False,
+                ),
+            ),
+        ]
+        # Withdrawal policies other than the planned expenses, here and in the
+        # simulations below
+        cases += [
+            (
+                "calc_retirement_balances_n_expenses",
+                dict(years=horizon, withdrawals=policy),
+                partial(
+                    calc_retirement_balances_n_expenses,
+                    initial_corpus=PROFILE_DEFAULTS["assumed_retirement_corpus"],
+                    inital_expense=values["current_expenses_at_retirement"],
+                    inflation=inputs["inflation_after_retirement"],
+                    returns=inputs["net_rate_return_expected_after_retire"],
+                    n_years_in_retire=horizon,
+                    withdrawal_policy=policy,
+                ),
+            )
+            for policy in WITHDRAWAL_POLICIES
+            if policy != "constant_real"
+        ]
+
+        # The simulations run over the whole horizon in retirement
+        simulator_kwargs = bucket_simulator_kwargs(
+            dict(inputs, estimated_years_retirement=horizon), values
+        )
+        simulator_kwargs["initial_corpus"] = PROFILE_DEFAULTS[
+            "assumed_retirement_corpus"
+        ]
+        for num_simulations in path_counts:
+            if num_simulations <= MAX_PATHS_IN_MEMORY:
+                cases.append(
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **simulator_kwargs,
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                )
+                cases.append(
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations, steps=MONTHLY_STEPS),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **dict(simulator_kwargs, steps_per_year=MONTHLY_STEPS),
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                )
+                cases.append(
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations, correlated=True),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **dict(
+                                simulator_kwargs,
+                                inflation_volatility=1.0,
+                                correlation=SCENARIO_CORRELATION,
+                            ),
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                )
+                cases.append(
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations, buckets="refill"),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **dict(simulator_kwargs, bucket_mode="refill"),
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                )
+                cases.append(
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations, glide=-1.0),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **dict(simulator_kwargs, equity_glide=-1.0),
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                )
+                cases += [
+                    (
+                        "bucket_strategy_simulator",
+                        dict(years=horizon, paths=num_simulations, withdrawals=policy),
+                        partial(
+                            bucket_strategy_simulator.__wrapped__,
+                            **dict(simulator_kwargs, withdrawal_policy=policy),
+                            num_simulations=num_simulations,
+                            seed=0,
+                        ),
+                    )
+                    for policy in WITHDRAWAL_POLICIES
+                    if policy != "constant_real"
+                ]
+            else:
+                cases.append(
+                    (
+                        "bucket_strategy_simulator_parallel",
+                        dict(years=horizon, paths=num_simulations, workers=max_workers),
+                        partial(
+                            bucket_strategy_simulator_parallel.__wrapped__,
+                            **simulator_kwargs,
+                            num_simulations=num_simulations,
+                            seed=0,
+                            max_workers=max_workers,
+                        ),
+                    )
+                )
+    return cases
+
+
+def case_id(name, params):
+    return name + "[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]"
+
+
+################################################
+
+
+### Timing ###
+# One untimed call warms up and sizes the run: fast cases are repeated until about
+# min_time has been spent, slow ones are timed once more
+def time_case(func, min_time=0.2, max_repeats=1000):
+    start = time.perf_counter()
+    func()
+    first = time.perf_counter() - start
+
+    repeats = int(np.clip(min_time / max(first, 1e-9), 1, max_repeats))
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings[i] = time.perf_counter() - start
+    return dict(
+        median_s=float(np.median(timings)),
+        min_s=float(timings.min()),
+        repeats=repeats,
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_benchmarks(args):
+    path_counts = PATH_COUNTS
+    if args.quick:
+        path_counts = tuple(n for n in PATH_COUNTS if n < MAX_PATHS_IN_MEMORY)
+
+    results = {}
+    for name, params, func in benchmark_cases(
+        path_counts=path_counts, max_workers=args.workers
+    ):
+        key = case_id(name, params)
+        if args.filter and args.filter not in key:
+            continue
+        results[key] = time_case(func, min_time=args.min_time)
+        # The cost of each simulated path, to compare cases across path counts
+        per_path = ""
+        if "paths" in params:
+            results[key]["per_path_us"] = (
+                results[key]["median_s"] / params["paths"] * 1e6
+            )
+            per_path = f"  {results[key]['per_path_us']:.3f} us/path"
+        print(
+            f"{key:<75} {results[key]['median_s'] * 1000:>12.3f} ms"
+            f"  (x{results[key]['repeats']}){per_path}"
+        )
+
+    save_run(args, results)
+
+
+def save_run(args, results):
+    history = load_history(args.history)
+    history.append(
+        dict(
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            commit=git_commit(),
+            label=args.label,
+            python=platform.python_version(),
+            numpy=np.__version__,
+            machine=platform.machine(),
+            results=results,
+        )
+    )
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=1)
+    print(f"Saved run {len(history) - 1} to {args.history}")
+
+
+### Cold start ###
+# Wall time of a fresh interpreter importing each set of modules, run from this
+# directory. "python" is the interpreter on its own, "app" the modules that the
+# Streamlit app imports before it draws anything
+STARTUP_IMPORTS = {
+    "python": "",
+    "planner_core": "import planner_core",
+    "planner_core.calculations": "import planner_core.calculations",
+    "planner_core.parallel": "import planner_core.parallel",
+    "app": "import streamlit, pandas, plotly.express, plotly.graph_objects; "
+    "import planner_core.calculations, planner_core.parallel, charts, profiling",
+}
+
+
+def time_startup(imports, repeats):
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", imports],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        )
+        timings[i] = time.perf_counter() - start
+    return dict(
+        median_s=float(np.median(timings)),
+        min_s=float(timings.min()),
+        repeats=repeats,
+    )
+
+
+def run_startup_benchmarks(args):
+    results = {}
+    for name, imports in STARTUP_IMPORTS.items():
+        key = case_id("startup", dict(imports=name))
+        results[key] = time_startup(imports, args.repeats)
+        print(f"{key:<75} {results[key]['median_s'] * 1000:>12.3f} ms")
+    save_run(args, results)
+
+
+### Comparing two runs from the history ###
+# Returns 1 (a failing exit status) when any case shared by both runs got slower
+# than the baseline by more than threshold
+def compare_runs(args):
+    history = load_history(args.history)
+    if len(history) < 2 and args.baseline == -2:
+        print(f"Need at least two runs in {args.history} to compare")
+        return 1
+    baseline = history[args.baseline]
+    current = history[args.current]
+
+    def describe(run):
+        return f"{run['timestamp']} {run.get('commit') or ''} {run.get('label') or ''}"
+
+    print(f"baseline: {describe(baseline)}")
+    print(f"current:  {describe(current)}")
+
+    regressions = 0
+    for key, result in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+        before = baseline["results"][key]["median_s"]
+        after = result["median_s"]
+        change = after / before - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "faster"
+        print(
+            f"{key:<75} {before * 1000:>12.3f} ms {after * 1000:>12.3f} ms"
+            f" {change:>+8.1%} {flag}"
+        )
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the calculation hot paths and track them over time"
+    )
+    parser.add_argument("--history", default=DEFAULT_HISTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument(
+        "--quick",
+        action="store_true",
+        help=f"Skip path counts of {MAX_PATHS_IN_MEMORY} and above",
+    )
+    run_parser.add_argument("--filter", help="Only run cases containing this text")
+    run_parser.add_argument("--label", help="Note stored with the run")
+    run_parser.add_argument("--min-time", type=float, default=0.2)
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="Worker processes for the chunked simulations",
+    )
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="Time cold imports of the engine and of the app"
+    )
+    startup_parser.add_argument("--repeats", type=int, default=10)
+    startup_parser.add_argument("--label", help="Note stored with the run")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two runs from the history"
+    )
+    compare_parser.add_argument(
+        "--baseline", type=int, default=-2, help="Index of the baseline run"
+    )
+    compare_parser.add_argument(
+        "--current", type=int, default=-1, help="Index of the run to check"
+    )
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Slowdown that counts as a regression (0.1 is 10%%)",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run_benchmarks(args)
+        return 0
+    if args.command == "startup":
+        run_startup_benchmarks(args)
+        return 0
+    return compare_runs(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from planner_core.simulation_stats import FAN_CHART_PERCENTILES
+from planner_core.utils import (
+    compact_inr_scales,
+    compact_inr_units,
+    format_to_inr_array,
+)
+
+
+### Amount axis labelled in crores and lakhs ###
+# Ticks at round steps (1, 2, 2.5 or 5 times a power of ten) over the plotted
+# values, with the labels formatted in one pass
+def nice_tick_values(low, high, n_ticks=6):
+    span = high - low
+    if not np.isfinite(span) or span <= 0:
+        span = abs(high) or 1.0
+    raw_step = span / n_ticks
+    magnitude = 10 ** np.floor(np.log10(raw_step))
+    step = magnitude * next(m for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    return np.arange(np.floor(low / step) * step, high + step, step)
+
+
+def set_inr_yaxis(fig, n_ticks=6):
+    values = [
+        np.asarray(trace.y, dtype=float) for trace in fig.data if trace.y is not None
+    ]
+    values = np.concatenate([v.ravel() for v in values]) if values else np.zeros(1)
+    if not np.isfinite(values).any():
+        return fig
+    tick_values = nice_tick_values(
+        min(np.nanmin(values), 0), np.nanmax(values), n_ticks=n_ticks
+    )
+    fig.update_yaxes(
+        tickvals=tick_values,
+        ticktext=format_to_inr_array(
+            tick_values, compact=True, decimals=tick_label_decimals(tick_values)
+        ),
+    )
+    return fig
+
+
+# The fewest decimals that show every tick exactly in its compact unit, so steps
+# like 2.5 read "₹ 1.25 Cr" rather than rounding to "₹ 1.2 Cr"
+def tick_label_decimals(tick_values, max_decimals=3):
+    values = np.abs(tick_values)
+    for decimals in range(1, max_decimals):
+        scaled = values / compact_inr_scales(compact_inr_units(values, decimals))
+        scaled = scaled * 10**decimals
+        if np.allclose(scaled, np.round(scaled), rtol=0, atol=1e-6):
+            return decimals
+    return max_decimals
+
+
+################################################
+
+
+### Simulated paths drawn as one WebGL trace ###
+# The paths are joined end to end with a gap (None) between them, so the size of
+# the figure depends on the number of paths shown and not on how many were run
+def sample_paths_trace(x, paths, n_paths, name="Simulated paths"):
+    paths = np.asarray(paths, dtype=float)[:n_paths]
+    n_shown, n_years = paths.shape
+    x = np.asarray(x)[:n_years]
+
+    xs = np.empty((n_shown, n_years + 1), dtype=object)
+    xs[:, :n_years] = x
+    ys = np.empty((n_shown, n_years + 1), dtype=object)
+    ys[:, :n_years] = paths
+
+    return go.Scattergl(
+        x=xs.ravel(),
+        y=ys.ravel(),
+        mode="lines",
+        line={"width": 1, "color": "rgba(100, 100, 100, 0.25)"},
+        connectgaps=False,
+        name=name,
+        hoverinfo="skip",
+    )
+
+
+### Fan chart of simulated balances ###
+# Bands between the outer and inner percentiles of FAN_CHART_PERCENTILES, computed
+# from the simulation statistics, with the median as a line
+def add_fan_chart(fig, x, percentile_values, color="0, 128, 128", name="Corpus"):
+    low, lower_mid, median, upper_mid, high = percentile_values
+    x = np.asarray(x)[: len(median)]
+
+    for lower, upper, opacity, label in [
+        (low, high, 0.15, "5th - 95th percentile"),
+        (lower_mid, upper_mid, 0.3, "25th - 75th percentile"),
+    ]:
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=upper,
+                mode="lines",
+                line={"width": 0},
+                showlegend=False,
+                hoverinfo="skip",
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=lower,
+                mode="lines",
+                line={"width": 0},
+                fill="tonexty",
+                fillcolor=f"rgba({color}, {opacity})",
+                name=f"{name} {label}",
+            )
+        )
+
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=median,
+            mode="lines+markers",
+            line={"color": f"rgb({color})"},
+            name=f"Median {name}",
+        )
+    )
+    return fig
+
+
+def simulation_fan_chart(x, stats, yearly_expenses, title, n_sample_paths=0):
+    fig = go.Figure()
+
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=np.asarray(yearly_expenses),
+            mode="lines+markers",
+            line={"color": "red"},
+            name="Expenses",
+        )
+    )
+
+    sample_paths = stats.balances
+    if n_sample_paths and sample_paths is not None and len(sample_paths):
+        fig.add_trace(sample_paths_trace(x, sample_paths, n_sample_paths))
+
+    add_fan_chart(
+        fig,
+        x,
+        stats.percentiles(FAN_CHART_PERCENTILES),
+        name="Corpus from Bucket Strategy",
+    )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title="Age",
+        yaxis_title="Amount",
+        legend_title="Legend Title",
+    )
+    return set_inr_yaxis(fig)
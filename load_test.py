@@ -0,0 +1,114 @@
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from planner_service import ENDPOINTS, make_server
+
+
+### Load test of the planner service ###
+# Profiles are varied around the defaults, with repeat_fraction of the requests
+# reusing an earlier profile so that the shared cache is exercised too
+def random_profile(rng):
+    return dict(
+        current_age=int(rng.integers(25, 50)),
+        retire_age=int(rng.integers(50, 65)),
+        estimated_years_retirement=int(rng.integers(10, 45)),
+        current_monthly_expenses=int(rng.integers(20, 200)) * 1000,
+        current_investments=int(rng.integers(0, 100)) * 1e5,
+        num_simulations=100,
+    )
+
+
+def make_requests(n_requests, endpoints, batch_size, repeat_fraction, seed=0):
+    rng = np.random.default_rng(seed)
+    profiles = []
+    requests = []
+    for i in range(n_requests):
+        batch = []
+        for _ in range(batch_size):
+            if profiles and rng.random() < repeat_fraction:
+                batch.append(profiles[rng.integers(len(profiles))])
+            else:
+                profiles.append(random_profile(rng))
+                batch.append(profiles[-1])
+        body = {"profiles": batch} if batch_size > 1 else batch[0]
+        requests.append((endpoints[i % len(endpoints)], json.dumps(body).encode()))
+    return requests
+
+
+def post(url, body):
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run_load_test(base_url, requests, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda r: post(base_url + r[0], r[1]), requests))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return dict(
+        requests=len(latencies),
+        requests_per_sec=len(latencies) / elapsed,
+        p50_ms=float(np.percentile(latencies_ms, 50)),
+        p99_ms=float(np.percentile(latencies_ms, 99)),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the planner service")
+    parser.add_argument(
+        "--url",
+        help="Base URL of a running service, otherwise one is started in process",
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--endpoint",
+        action="append",
+        choices=sorted(ENDPOINTS),
+        help="Endpoints to call in turn (default: all of them)",
+    )
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--repeat-fraction", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server = make_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    requests = make_requests(
+        args.requests,
+        args.endpoint or sorted(ENDPOINTS),
+        args.batch_size,
+        args.repeat_fraction,
+    )
+    try:
+        report = run_load_test(base_url.rstrip("/"), requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(
+        f"{report['requests']} requests: {report['requests_per_sec']:.1f} req/s, "
+        f"p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
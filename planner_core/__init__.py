@@ -0,0 +1,76 @@
+import importlib
+
+### Numerical engine of the retirement planner ###
+# Depends only on NumPy. Nothing is imported until it is first used (PEP 562), so
+# "import planner_core" is close to free and a name pulls in only its own module
+SUBMODULES = (
+    "buckets",
+    "cache",
+    "calculations",
+    "glide_paths",
+    "historical",
+    "kernels",
+    "parallel",
+    "profiles",
+    "scenarios",
+    "simulation_stats",
+    "utils",
+    "withdrawals",
+)
+LAZY_EXPORTS = {
+    "calc_compound_returns": "utils",
+    "calc_compound_returns_array": "utils",
+    "format_to_inr": "utils",
+    "format_to_inr_array": "utils",
+    "as_seed_sequence": "utils",
+    "draw_standard_normal_paths": "utils",
+    "calc_balances_in_retirement": "utils",
+    "calc_drawdown_balances": "utils",
+    "calc_retirement_balances_n_expenses_batch": "utils",
+    "calc_retirement_balances_n_expenses": "utils",
+    "calculate_yearly_values": "calculations",
+    "calc_specific_values_on_input": "calculations",
+    "simulate_bucket_growth": "calculations",
+    "simulate_bucket_scenarios": "calculations",
+    "simulate_bucket_growth_n_expenses": "calculations",
+    "bucket_strategy_simulator": "calculations",
+    "solve_min_corpus_for_success_rate": "calculations",
+    "historical_cohort_backtest": "calculations",
+    "memoize": "cache",
+    "SimulationStats": "simulation_stats",
+    "FAN_CHART_PERCENTILES": "simulation_stats",
+    "bucket_strategy_simulator_parallel": "parallel",
+    "default_workers": "parallel",
+    "SCENARIO_VARIABLES": "scenarios",
+    "draw_correlated_normals": "scenarios",
+    "BUCKETS": "buckets",
+    "BUCKET_MODES": "buckets",
+    "calc_bucket_refill_balances": "buckets",
+    "glide_path_schedule": "glide_paths",
+    "WITHDRAWAL_POLICIES": "withdrawals",
+    "calc_policy_drawdown_balances": "withdrawals",
+    "HistoricalReturns": "historical",
+    "convert_historical_csv": "historical",
+    "PROFILE_DEFAULTS": "profiles",
+    "plan_profile": "profiles",
+    "plan_profiles": "profiles",
+    "SUMMARY_FIELDS": "profiles",
+}
+
+__all__ = list(LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    if name in LAZY_EXPORTS:
+        module = importlib.import_module(f"{__name__}.{LAZY_EXPORTS[name]}")
+        value = getattr(module, name)
+        # Later lookups find it directly and skip __getattr__
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_EXPORTS) | set(SUBMODULES))
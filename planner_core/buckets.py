@@ -0,0 +1,217 @@
+import numpy as np
+
+from .withdrawals import PolicyWithdrawals, expense_inflation
+
+### Buckets of the bucket strategy ###
+# The short term bucket is the fixed deposits, the medium term one the debt and
+# hybrid funds and the long term one the large and small-mid cap funds, indexes
+# into the funds in the order of calculations.bucket_growth_parameters
+BUCKETS = ("short_term", "medium_term", "long_term")
+BUCKET_FUNDS = ((), (0, 1), (2, 3))
+
+# "rebalance" rebalances the whole portfolio to the allocations every year and
+# pays the expenses out of it. "refill" spends the buckets in turn and refills
+# them as calc_bucket_refill_balances does
+BUCKET_MODES = ("rebalance", "refill")
+
+
+# Whether bucket_mode needs the growth of each bucket rather than of the portfolio
+def refills_buckets(bucket_mode):
+    if bucket_mode not in BUCKET_MODES:
+        raise ValueError(
+            f"Unknown bucket_mode {bucket_mode!r}, expected one of "
+            f"{', '.join(BUCKET_MODES)}"
+        )
+    return bucket_mode == "refill"
+
+
+# Shares of the corpus put in each bucket at retirement (buckets,)
+def bucket_shares(alloc_fixed, allocations):
+    return np.array(
+        [alloc_fixed]
+        + [sum(allocations[fund] for fund in funds) for funds in BUCKET_FUNDS[1:]]
+    )
+
+
+# Moves from source into bucket what it lacks of target, as much as source holds
+# (nothing from a source below 0) and only on the paths of when. In place, with
+# moved a buffer the size of the buckets
+def move_between(source, bucket, target, moved, when=None):
+    np.subtract(target, bucket, out=moved)
+    np.minimum(moved, source, out=moved)
+    np.maximum(moved, 0, out=moved)
+    if when is not None:
+        moved *= when
+    source -= moved
+    bucket += moved
+
+
+################################################
+
+
+### Spending from the buckets in turn and refilling them ###
+# bucket_growth is (paths x years x buckets) of (1 + return) of each bucket, with
+# its own funds rebalanced within it. Every year, after the growth:
+# - the expenses are paid from the short term bucket, then the medium term one,
+#   then the long term one, which takes any shortfall (and goes below 0)
+# - in years the long term bucket returns refill_threshold % or more, its gains
+#   go to topping up the short term bucket and then the medium term one
+# - whatever the short term bucket still lacks is moved from the medium term one
+# A bucket is topped up to its size at retirement in years of expenses, so it
+# grows with the expenses. The branches are masks over the paths, the years are
+# looped over as in calc_drawdown_balances, whose balances these are. The yearly
+# withdrawals are those of withdrawal_policy on the whole portfolio, as in
+# calc_policy_drawdown_balances, and payment_factor (paths x years) scales what is
+# paid when it is paid monthly. Returns the balances and the withdrawals, both
+# (corpora x paths x years)
+def calc_bucket_refill_balances(
+    initial_corpora,
+    bucket_growth,
+    yearly_expenses,
+    shares,
+    refill_threshold=0.0,
+    ignore_first_year_expense=True,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+    payment_factor=None,
+):
+    n_paths, n_years_in_retire, n_buckets = bucket_growth.shape
+    initial_corpora = np.asarray(initial_corpora, dtype=float)
+    paths_shape = np.broadcast_shapes(initial_corpora.shape, (n_paths,))
+    initial_corpora = np.broadcast_to(initial_corpora, paths_shape)
+    yearly_expenses = np.broadcast_to(
+        np.asarray(yearly_expenses, dtype=float), (n_paths, n_years_in_retire)
+    )
+    paid_expenses = yearly_expenses
+    if payment_factor is not None:
+        payment_factor = np.broadcast_to(payment_factor, (n_paths, n_years_in_retire))
+        paid_expenses = yearly_expenses * payment_factor
+    yearly_withdrawals = np.broadcast_to(
+        yearly_expenses, paths_shape + (n_years_in_retire,)
+    )
+    if withdrawal_policy == "constant_real":
+        # The planned expenses are paid as they are
+        yearly_expenses = payment_factor = None
+    else:
+        yearly_withdrawals = np.empty((n_years_in_retire,) + paths_shape)
+
+    # The dozens of passes a year over the buckets are quickest on blocks of
+    # paths whose buckets stay in the CPU cache
+    yearly_balances = np.empty((n_years_in_retire,) + paths_shape)
+    for start in range(0, n_paths, REFILL_BLOCK_PATHS):
+        block = slice(start, start + REFILL_BLOCK_PATHS)
+        refill_block(
+            initial_corpora[..., block],
+            bucket_growth[block],
+            paid_expenses[block],
+            shares,
+            refill_threshold,
+            ignore_first_year_expense,
+            yearly_balances[..., block],
+            (
+                None
+                if yearly_expenses is None
+                else PolicyWithdrawals(
+                    withdrawal_policy,
+                    initial_corpora[..., block],
+                    yearly_expenses[block, 0],
+                    withdrawal_params,
+                )
+            ),
+            None if yearly_expenses is None else yearly_expenses[block],
+            None if payment_factor is None else payment_factor[block],
+            None if yearly_expenses is None else yearly_withdrawals[..., block],
+        )
+
+    yearly_balances[yearly_balances <= 0] = 0
+    if yearly_expenses is not None:
+        yearly_withdrawals = np.moveaxis(yearly_withdrawals, 0, -1)
+    return np.moveaxis(yearly_balances, 0, -1), yearly_withdrawals
+
+
+# Paths stepped through together by calc_bucket_refill_balances
+REFILL_BLOCK_PATHS = 8192
+
+
+# Fills yearly_balances (years x corpora x paths) for one block of paths. Without
+# withdrawals (a PolicyWithdrawals) the paid_expenses are withdrawn, else the
+# withdrawals on the planned_expenses, times the payment_factor, which are kept
+# in yearly_withdrawals
+def refill_block(
+    initial_corpora,
+    bucket_growth,
+    paid_expenses,
+    shares,
+    refill_threshold,
+    ignore_first_year_expense,
+    yearly_balances,
+    withdrawals=None,
+    planned_expenses=None,
+    payment_factor=None,
+    yearly_withdrawals=None,
+):
+    # Growth and expenses year-wise, one contiguous row a year
+    bucket_growth = np.ascontiguousarray(np.moveaxis(bucket_growth, 0, -1))
+    refill_years = bucket_growth[:, -1] - 1 >= refill_threshold / 100
+    expense_growth = np.divide(
+        paid_expenses,
+        paid_expenses[:, :1],
+        out=np.ones(paid_expenses.shape),
+        where=paid_expenses[:, :1] > 0,
+    ).T
+    paid_expenses = paid_expenses.T
+    if withdrawals is not None:
+        planned_expenses = planned_expenses.T
+        inflation = expense_inflation(planned_expenses)
+        start_balance, balance = np.empty((2,) + initial_corpora.shape)
+        np.copyto(start_balance, initial_corpora)
+
+    # The buckets are updated in place, with the moves between them in buffers
+    initial_buckets = [initial_corpora * share for share in shares]
+    short_term, medium_term, long_term = (bucket.copy() for bucket in initial_buckets)
+    unpaid, moved, short_term_target, medium_term_target = np.empty(
+        (4,) + initial_corpora.shape
+    )
+    for i in range(len(yearly_balances)):
+        if i == 0 and ignore_first_year_expense:
+            yearly_balances[i] = initial_corpora
+            if withdrawals is not None:
+                yearly_withdrawals[i] = planned_expenses[i]
+            continue
+        growth = bucket_growth[i]
+        short_term *= growth[0]
+        medium_term *= growth[1]
+        long_term *= growth[2]
+
+        # Withdrawals, short term bucket first
+        if withdrawals is None:
+            np.copyto(unpaid, paid_expenses[i])
+        else:
+            np.add(short_term, medium_term, out=balance)
+            balance += long_term
+            yearly_withdrawals[i] = withdrawals.withdraw(
+                balance, start_balance, planned_expenses[i], inflation[i]
+            )
+            np.copyto(unpaid, yearly_withdrawals[i])
+            if payment_factor is not None:
+                unpaid *= payment_factor[:, i]
+        np.minimum(unpaid, short_term, out=moved)
+        short_term -= moved
+        unpaid -= moved
+        np.minimum(unpaid, medium_term, out=moved)
+        medium_term -= moved
+        unpaid -= moved
+        long_term -= unpaid
+
+        # Refills from the long term bucket after its good years, then from the
+        # medium term bucket into the short term one
+        np.multiply(initial_buckets[0], expense_growth[i], out=short_term_target)
+        np.multiply(initial_buckets[1], expense_growth[i], out=medium_term_target)
+        move_between(long_term, short_term, short_term_target, moved, refill_years[i])
+        move_between(long_term, medium_term, medium_term_target, moved, refill_years[i])
+        move_between(medium_term, short_term, short_term_target, moved)
+
+        np.add(short_term, medium_term, out=yearly_balances[i])
+        yearly_balances[i] += long_term
+        if withdrawals is not None:
+            np.copyto(start_balance, yearly_balances[i])
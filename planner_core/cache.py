@@ -0,0 +1,137 @@
+import functools
+import hashlib
+import inspect
+import pickle
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize", "ttl"])
+
+
+### Canonical key from the arguments of a call ###
+# Equal inputs give the same key whether they were passed positionally or as
+# keywords, and numpy arrays are keyed on their contents
+def canonical_value(value):
+    if isinstance(value, np.ndarray):
+        return ("ndarray", value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, np.generic):
+        return canonical_value(value.item())
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(canonical_value(v) for v in value))
+    if isinstance(value, dict):
+        return (
+            "dict",
+            tuple(sorted((str(k), canonical_value(v)) for k, v in value.items())),
+        )
+    if isinstance(value, np.random.SeedSequence):
+        return (
+            "SeedSequence",
+            canonical_value(value.entropy),
+            value.spawn_key,
+            value.pool_size,
+        )
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return (type(value).__name__, value)
+    raise TypeError(f"Cannot build a cache key from a {type(value).__name__}")
+
+
+def make_cache_key(arguments):
+    canonical = tuple((name, canonical_value(v)) for name, v in arguments.items())
+    return hashlib.blake2b(
+        pickle.dumps(canonical, protocol=4), digest_size=16
+    ).hexdigest()
+
+
+################################################
+
+
+### Results handed out from the cache are shared, so arrays are made read-only ###
+def freeze_result(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            freeze_result(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            freeze_result(v)
+    return value
+
+
+class ResultCache:
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._entries), self.ttl
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+### Decorator caching a function on its arguments, like functools.lru_cache ###
+# It lives at module level so the cache survives Streamlit reruns and also
+# works when the calculations are imported without Streamlit. Calls for which
+# cache_if(arguments) is false, or whose arguments cannot be keyed, are not cached
+def memoize(maxsize=128, ttl=None, cache_if=None):
+    def decorator(func):
+        signature = inspect.signature(func)
+        cache = ResultCache(maxsize=maxsize, ttl=ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if cache_if is not None and not cache_if(bound.arguments):
+                return func(*args, **kwargs)
+            try:
+                key = make_cache_key(bound.arguments)
+            except TypeError:
+                return func(*args, **kwargs)
+
+            found, value = cache.get(key)
+            if not found:
+                value = freeze_result(func(*args, **kwargs))
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,914 @@
+import numpy as np
+
+from . import kernels
+from .buckets import (
+    BUCKET_FUNDS,
+    BUCKETS,
+    bucket_shares,
+    calc_bucket_refill_balances,
+    refills_buckets,
+)
+from .cache import memoize
+from .glide_paths import scheduled_allocations
+from .historical import DEFAULT_BLOCK_LENGTH, open_historical_returns
+from .scenarios import draw_correlated_normals
+from .utils import (
+    calc_compound_returns,
+    calc_compound_returns_array,
+    calc_drawdown_balances,
+    calc_retirement_balances_n_expenses_batch,
+    compound_growth_factors,
+    draw_standard_normal_paths,
+    in_year_payment_factor,
+)
+from .withdrawals import calc_policy_drawdown_balances, calc_years_lasted
+
+
+@memoize(maxsize=64)
+def calculate_yearly_values(
+    current_age,
+    retire_age,
+    estimated_years_retirement,
+    current_investments,
+    inflation_before_retirement,
+    inflation_after_retirement,
+    return_current_investments,
+    net_rate_return_expected,
+    net_rate_return_expected_after_retire,
+    annual_increase_investments,
+    current_safe_monthly_expense,
+    current_expenses_at_retirement,
+    total_retirement_corpus,
+    yearly_corpus,
+    steps_per_year=1,
+):
+
+    years_to_retire = round(retire_age - current_age)
+    years_till_retire = np.arange(years_to_retire)
+
+    balances_in_retirement, yearly_expenses_in_retirement = (
+        calc_retirement_balances_n_expenses_batch(
+            initial_corpora=total_retirement_corpus,
+            inital_expense=current_expenses_at_retirement,
+            inflation=inflation_after_retirement,
+            returns=net_rate_return_expected_after_retire,
+            n_years_in_retire=estimated_years_retirement,
+            steps_per_year=steps_per_year,
+        )
+    )
+    full_yearly_expenses = np.concatenate(
+        [
+            calc_compound_returns_array(
+                p=(current_safe_monthly_expense * 12),
+                r=inflation_before_retirement,
+                t=years_till_retire,
+            ),
+            yearly_expenses_in_retirement,
+        ]
+    )
+
+    amt_invested_yearly_till_retire = np.zeros(
+        years_to_retire + 1 + max(estimated_years_retirement - 1, 0)
+    )
+    amt_invested_yearly_till_retire[: years_to_retire + 1] = np.round(
+        yearly_corpus
+        * compound_growth_factors(
+            1 + annual_increase_investments / 100, np.arange(years_to_retire + 1)
+        )
+    )
+
+    # Each year's SIP value builds on the previous year's value, this is kept as
+    # a running sum so that the values match the year by year calculation exactly.
+    # A year's investment paid in monthly grows as much as this part of it paid in
+    # at the start of the year
+    sip_growth = 1 + net_rate_return_expected / 100
+    sip_payment_factor = float(in_year_payment_factor(1 / sip_growth, steps_per_year))
+    yearly_sip_values = np.empty(years_to_retire)
+    yearly_sip_value = 0
+    for i, amt_invested in enumerate(
+        amt_invested_yearly_till_retire[:years_to_retire].tolist()
+    ):
+        yearly_sip_value = (
+            yearly_sip_value + amt_invested * sip_payment_factor
+        ) * sip_growth
+        yearly_sip_values[i] = yearly_sip_value
+
+    yearly_corpus_value = np.concatenate(
+        [
+            np.round(
+                calc_compound_returns_array(
+                    p=current_investments,
+                    r=return_current_investments,
+                    t=years_till_retire,
+                )
+                + yearly_sip_values
+            ),
+            balances_in_retirement[0],
+        ]
+    )
+
+    age = np.arange(current_age, retire_age + estimated_years_retirement)
+
+    return dict(
+        age=age,
+        expenses=full_yearly_expenses,
+        investment_amount=amt_invested_yearly_till_retire,
+        retirement_corpus=yearly_corpus_value,
+    )
+
+
+@memoize(maxsize=64)
+def calc_specific_values_on_input(
+    current_age,
+    retire_age,
+    estimated_years_retirement,
+    current_monthly_expenses,
+    other_annual_expenses,
+    overestimate_expenses,
+    current_investments,
+    inflation_before_retirement,
+    inflation_after_retirement,
+    return_current_investments,
+    net_rate_return_expected,
+    net_rate_return_expected_after_retire,
+    annual_increase_investments,
+    steps_per_year=1,
+):
+    years_to_retire = round(retire_age - current_age)
+
+    current_safe_monthly_expense = round(
+        (current_monthly_expenses + (other_annual_expenses / 12))
+        * (1 + overestimate_expenses / 100)
+    )
+
+    value_of_current_investment = calc_compound_returns(
+        p=current_investments, r=return_current_investments, t=years_to_retire
+    )
+
+    current_expenses_at_retirement = calc_compound_returns(
+        p=(current_safe_monthly_expense * 12),
+        r=inflation_before_retirement,
+        t=years_to_retire,
+    )
+
+    inflation_adjusted_return = (
+        (
+            (1 + net_rate_return_expected_after_retire / 100)
+            / (1 + inflation_after_retirement / 100)
+        )
+        - 1
+    ) * 100.0
+    retirement_corpus_by_year = [
+        (
+            current_expenses_at_retirement
+            / ((1 + inflation_adjusted_return / 100) ** year)
+        )
+        for year in range(1, 1 + estimated_years_retirement)
+    ]
+    # Expenses paid monthly leave the corpus before the end of the year, when
+    # they are paid in the yearly calculation, so a little more of it is needed
+    total_retirement_corpus = round(
+        sum(retirement_corpus_by_year)
+        * float(
+            in_year_payment_factor(
+                1 + net_rate_return_expected_after_retire / 100, steps_per_year
+            )
+        )
+    )
+
+    # The below was derived by-hand
+    step_up_returns_ratio = (1 + annual_increase_investments / 100) / (
+        1 + net_rate_return_expected / 100
+    )
+
+    remaining_corpus_to_save = round(
+        total_retirement_corpus - value_of_current_investment
+    )
+
+    # Investments stepping up as fast as they grow are each worth the same at
+    # retirement, where the ratio below tends to 1 / years_to_retire
+    annuity_ratio = (
+        (step_up_returns_ratio - 1) / (step_up_returns_ratio**years_to_retire - 1)
+        if step_up_returns_ratio != 1
+        else 1 / years_to_retire
+    )
+    yearly_corpus = (
+        remaining_corpus_to_save
+        / ((1 + net_rate_return_expected / 100) ** years_to_retire)
+    ) * annuity_ratio
+    # Monthly investments spend part of the year uninvested, so a little more is needed
+    yearly_corpus = yearly_corpus / float(
+        in_year_payment_factor(1 / (1 + net_rate_return_expected / 100), steps_per_year)
+    )
+
+    return (
+        current_safe_monthly_expense,
+        value_of_current_investment,
+        current_expenses_at_retirement,
+        total_retirement_corpus,
+        remaining_corpus_to_save,
+        yearly_corpus,
+    )
+
+
+### Per-year growth of the fixed deposit part, and returns, volatility and ###
+### allocations of the four funds, in the order the simulations use them ###
+# With by_bucket each bucket of buckets.BUCKETS is a portfolio of its own, holding
+# its funds in proportion to their allocations: the fixed growth is per bucket and
+# the allocations are (buckets x funds). A bucket allocated nothing stays flat
+def bucket_growth_parameters(
+    fixed_deposit_returns,
+    debt_fund_returns,
+    debt_fund_volatility,
+    hybrid_fund_returns,
+    hybrid_fund_volatility,
+    large_cap_returns,
+    large_cap_volatility,
+    mid_cap_returns,
+    mid_cap_volatility,
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    by_bucket=False,
+):
+    fixed_deposit_returns = (
+        fixed_deposit_returns / 100
+        if fixed_deposit_returns > 1.0
+        else fixed_deposit_returns
+    )
+    fund_returns = np.array(
+        [debt_fund_returns, hybrid_fund_returns, large_cap_returns, mid_cap_returns],
+        dtype=float,
+    )
+    fund_volatility = np.array(
+        [
+            debt_fund_volatility,
+            hybrid_fund_volatility,
+            large_cap_volatility,
+            mid_cap_volatility,
+        ],
+        dtype=float,
+    )
+    # Allocations that change every year (years,) give (years x funds)
+    allocations = np.stack(
+        np.broadcast_arrays(alloc_debt, alloc_hybrid, alloc_large_cap, alloc_mid_cap),
+        axis=-1,
+    ).astype(float)
+    if by_bucket:
+        fixed_growth = np.zeros(len(BUCKETS))
+        fixed_growth[0] = 1 + fixed_deposit_returns
+        bucket_allocations = np.zeros((len(BUCKETS), len(allocations)))
+        for bucket, funds in enumerate(BUCKET_FUNDS[1:], start=1):
+            funds = list(funds)
+            bucket_total = allocations[funds].sum()
+            if bucket_total > 0:
+                bucket_allocations[bucket, funds] = allocations[funds] / bucket_total
+            else:
+                fixed_growth[bucket] = 1.0
+        return fixed_growth, fund_returns, fund_volatility, bucket_allocations
+
+    return (
+        alloc_fixed * (1 + fixed_deposit_returns),
+        fund_returns,
+        fund_volatility,
+        allocations,
+    )
+
+
+### Yearly growth of the bucket portfolio on simulated returns ###
+# (num_simulations x n_years_in_retire) of (1 + portfolio return), with the portfolio
+# rebalanced to the allocations every year. Simulations first_simulation onwards of
+# the run seeded by seed are drawn. With by_bucket it is the growth of each bucket
+# (num_simulations x n_years_in_retire x buckets), see bucket_growth_parameters
+def simulate_bucket_growth(
+    n_years_in_retire,
+    fixed_deposit_returns,
+    debt_fund_returns,
+    debt_fund_volatility,
+    hybrid_fund_returns,
+    hybrid_fund_volatility,
+    large_cap_returns,
+    large_cap_volatility,
+    mid_cap_returns,
+    mid_cap_volatility,
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    num_simulations=1,
+    seed=None,
+    first_simulation=0,
+    by_bucket=False,
+):
+    fixed_growth, fund_returns, fund_volatility, allocations = bucket_growth_parameters(
+        fixed_deposit_returns=fixed_deposit_returns,
+        debt_fund_returns=debt_fund_returns,
+        debt_fund_volatility=debt_fund_volatility,
+        hybrid_fund_returns=hybrid_fund_returns,
+        hybrid_fund_volatility=hybrid_fund_volatility,
+        large_cap_returns=large_cap_returns,
+        large_cap_volatility=large_cap_volatility,
+        mid_cap_returns=mid_cap_returns,
+        mid_cap_volatility=mid_cap_volatility,
+        alloc_fixed=alloc_fixed,
+        alloc_debt=alloc_debt,
+        alloc_hybrid=alloc_hybrid,
+        alloc_large_cap=alloc_large_cap,
+        alloc_mid_cap=alloc_mid_cap,
+        by_bucket=by_bucket,
+    )
+
+    # All the random draws for every simulation, year and fund at once,
+    # shape (num_simulations, n_years_in_retire, 4)
+    normals = draw_standard_normal_paths(
+        seed=seed,
+        first_path=first_simulation,
+        n_paths=num_simulations,
+        shape=(n_years_in_retire, 4),
+    )
+    # inflation_rates = np.random.normal(inflation, 0.1, n_years_in_retire)
+
+    # Growth of the whole portfolio in a year, after rebalancing to the allocations
+    return kernels.bucket_growth(
+        normals, fixed_growth, fund_returns, fund_volatility, allocations, by_bucket
+    )
+
+
+### Yearly growth of the bucket portfolio and inflation on joint scenarios ###
+# The fund returns and inflation are drawn together with the given correlation
+# matrix (see scenarios.SCENARIO_VARIABLES, None for independent draws), inflation
+# around its expected value with inflation_volatility (in %). Returns the yearly
+# growth as simulate_bucket_growth does and the yearly inflation as fractions,
+# both (num_simulations x n_years_in_retire)
+def simulate_bucket_scenarios(
+    n_years_in_retire,
+    inflation,
+    inflation_volatility,
+    correlation,
+    fixed_deposit_returns,
+    debt_fund_returns,
+    debt_fund_volatility,
+    hybrid_fund_returns,
+    hybrid_fund_volatility,
+    large_cap_returns,
+    large_cap_volatility,
+    mid_cap_returns,
+    mid_cap_volatility,
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    num_simulations=1,
+    seed=None,
+    first_simulation=0,
+    by_bucket=False,
+):
+    fixed_growth, fund_returns, fund_volatility, allocations = bucket_growth_parameters(
+        fixed_deposit_returns=fixed_deposit_returns,
+        debt_fund_returns=debt_fund_returns,
+        debt_fund_volatility=debt_fund_volatility,
+        hybrid_fund_returns=hybrid_fund_returns,
+        hybrid_fund_volatility=hybrid_fund_volatility,
+        large_cap_returns=large_cap_returns,
+        large_cap_volatility=large_cap_volatility,
+        mid_cap_returns=mid_cap_returns,
+        mid_cap_volatility=mid_cap_volatility,
+        alloc_fixed=alloc_fixed,
+        alloc_debt=alloc_debt,
+        alloc_hybrid=alloc_hybrid,
+        alloc_large_cap=alloc_large_cap,
+        alloc_mid_cap=alloc_mid_cap,
+        by_bucket=by_bucket,
+    )
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+
+    normals = draw_correlated_normals(
+        seed=seed,
+        first_path=first_simulation,
+        n_paths=num_simulations,
+        n_years=n_years_in_retire,
+        correlation=correlation,
+    )
+    yearly_growth = kernels.bucket_growth(
+        normals[..., :4],
+        fixed_growth,
+        fund_returns,
+        fund_volatility,
+        allocations,
+        by_bucket,
+    )
+    yearly_inflation = inflation + inflation_volatility / 100 * normals[..., 4]
+    return yearly_growth, yearly_inflation
+
+
+# Expenses of every simulation (simulations x years), starting from inital_expense
+# and growing with that simulation's inflation of the years before
+def calc_expenses_on_inflation_paths(inital_expense, yearly_inflation):
+    yearly_expenses = np.empty(yearly_inflation.shape)
+    yearly_expenses[:, :1] = inital_expense
+    yearly_expenses[:, 1:] = inital_expense * np.cumprod(
+        1 + yearly_inflation[:, :-1], axis=1
+    )
+    return np.round(yearly_expenses)
+
+
+### Simulated yearly growth of the bucket portfolio and the expenses it pays ###
+# The returns come from independent normal draws, from joint draws with inflation
+# when inflation_volatility or a correlation matrix is given (see
+# simulate_bucket_scenarios), or from blocks of the years in the historical_returns
+# file (see historical.HistoricalReturns). The expenses are per year, or per
+# simulation (simulations x years) when inflation is simulated or historical too.
+# by_bucket gives the growth of each bucket, as simulate_bucket_growth does
+def simulate_bucket_growth_n_expenses(
+    inital_expense,
+    inflation,
+    n_years_in_retire,
+    num_simulations=1,
+    seed=None,
+    first_simulation=0,
+    inflation_volatility=0.0,
+    correlation=None,
+    historical_returns=None,
+    block_length=DEFAULT_BLOCK_LENGTH,
+    by_bucket=False,
+    **fund_kwargs,
+):
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+
+    if historical_returns is not None:
+        history = open_historical_returns(historical_returns)
+        sampled_returns = (
+            history.sample(
+                seed=seed,
+                first_path=first_simulation,
+                n_paths=num_simulations,
+                n_years=n_years_in_retire,
+                block_length=block_length,
+            )
+            / 100
+        )
+        fixed_growth, _, _, allocations = bucket_growth_parameters(
+            **fund_kwargs, by_bucket=by_bucket
+        )
+        yearly_growth = kernels.portfolio_growth(
+            sampled_returns[..., :4], fixed_growth, allocations, by_bucket
+        )
+        if history.has_inflation:
+            return yearly_growth, calc_expenses_on_inflation_paths(
+                inital_expense, sampled_returns[..., 4]
+            )
+
+    elif correlation is not None or inflation_volatility > 0:
+        yearly_growth, yearly_inflation = simulate_bucket_scenarios(
+            n_years_in_retire=n_years_in_retire,
+            inflation=inflation,
+            inflation_volatility=inflation_volatility,
+            correlation=correlation,
+            num_simulations=num_simulations,
+            seed=seed,
+            first_simulation=first_simulation,
+            by_bucket=by_bucket,
+            **fund_kwargs,
+        )
+        return yearly_growth, calc_expenses_on_inflation_paths(
+            inital_expense, yearly_inflation
+        )
+
+    else:
+        yearly_growth = simulate_bucket_growth(
+            n_years_in_retire=n_years_in_retire,
+            num_simulations=num_simulations,
+            seed=seed,
+            first_simulation=first_simulation,
+            by_bucket=by_bucket,
+            **fund_kwargs,
+        )
+
+    yearly_expenses = calc_compound_returns_array(
+        p=inital_expense, r=inflation, t=np.arange(n_years_in_retire)
+    )
+    return yearly_growth, yearly_expenses
+
+
+### Drawdown of the simulated growth ###
+# yearly_growth is per bucket (paths x years x buckets) when the buckets are spent
+# in turn (by_bucket) and of the portfolio otherwise. The planned yearly_expenses
+# are withdrawn as withdrawal_policy has it, and paid as payment_factor has it,
+# see strategy_payment_factor. Several corpora are drawn down against the same
+# growth, giving balances of shape corpora x paths x years, and the years each
+# corpus lasted on each path (corpora x paths), see calc_years_lasted
+def calc_strategy_balances(
+    initial_corpora,
+    yearly_growth,
+    yearly_expenses,
+    by_bucket,
+    shares,
+    refill_threshold,
+    withdrawal_policy,
+    withdrawal_params,
+    ignore_first_year_expense,
+    payment_factor,
+):
+    withdrawals = None
+    if by_bucket:
+        balances, withdrawals = calc_bucket_refill_balances(
+            initial_corpora=initial_corpora,
+            bucket_growth=yearly_growth,
+            yearly_expenses=yearly_expenses,
+            shares=shares,
+            refill_threshold=refill_threshold,
+            ignore_first_year_expense=ignore_first_year_expense,
+            withdrawal_policy=withdrawal_policy,
+            withdrawal_params=withdrawal_params,
+            payment_factor=payment_factor,
+        )
+    elif withdrawal_policy != "constant_real":
+        balances, withdrawals = calc_policy_drawdown_balances(
+            initial_corpora=initial_corpora,
+            yearly_growth=yearly_growth,
+            yearly_expenses=yearly_expenses,
+            withdrawal_policy=withdrawal_policy,
+            withdrawal_params=withdrawal_params,
+            ignore_first_year_expense=ignore_first_year_expense,
+            payment_factor=payment_factor,
+        )
+    else:
+        paid_expenses = yearly_expenses
+        if payment_factor is not None:
+            paid_expenses = yearly_expenses * payment_factor
+        balances = calc_drawdown_balances(
+            initial_corpora=initial_corpora,
+            yearly_growth=yearly_growth,
+            yearly_expenses=paid_expenses,
+            ignore_first_year_expense=ignore_first_year_expense,
+        )
+
+    years_lasted = calc_years_lasted(
+        balances, withdrawals, yearly_expenses, withdrawal_policy, withdrawal_params
+    )
+    return balances, years_lasted
+
+
+# With steps_per_year=12 the expenses are paid monthly out of each year's growth
+# (see in_year_payment_factor), of the short term bucket when the buckets are spent
+# in turn. None when they are paid once a year
+def strategy_payment_factor(yearly_growth, steps_per_year, by_bucket):
+    if steps_per_year == 1:
+        return None
+    return in_year_payment_factor(
+        yearly_growth[..., 0] if by_bucket else yearly_growth, steps_per_year
+    )
+
+
+################################################
+
+
+# Simulation results can be large, so only a few of them are kept. Unseeded runs
+# are expected to differ every time and are never cached. The returns come from
+# the sources of simulate_bucket_growth_n_expenses, whose expenses are returned,
+# the planned ones when the withdrawal_policy withdraws otherwise, with the
+# balances and the years each corpus lasted on each path (see calc_years_lasted).
+# A historical returns file is cached on its path, give a changed file a new name
+@memoize(maxsize=8, cache_if=lambda arguments: arguments["seed"] is not None)
+def bucket_strategy_simulator(
+    initial_corpus,
+    inital_expense,
+    inflation,
+    returns,
+    n_years_in_retire,
+    fixed_deposit_returns,
+    debt_fund_returns,
+    debt_fund_volatility,
+    hybrid_fund_returns,
+    hybrid_fund_volatility,
+    large_cap_returns,
+    large_cap_volatility,
+    mid_cap_returns,
+    mid_cap_volatility,
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    num_simulations=1,
+    ignore_first_year_expense=True,
+    seed=None,
+    first_simulation=0,
+    steps_per_year=1,
+    inflation_volatility=0.0,
+    correlation=None,
+    historical_returns=None,
+    block_length=DEFAULT_BLOCK_LENGTH,
+    bucket_mode="rebalance",
+    refill_threshold=0.0,
+    allocation_schedule=None,
+    equity_glide=0.0,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+):
+
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+    by_bucket = refills_buckets(bucket_mode)
+
+    fund_kwargs = dict(
+        fixed_deposit_returns=fixed_deposit_returns,
+        debt_fund_returns=debt_fund_returns,
+        debt_fund_volatility=debt_fund_volatility,
+        hybrid_fund_returns=hybrid_fund_returns,
+        hybrid_fund_volatility=hybrid_fund_volatility,
+        large_cap_returns=large_cap_returns,
+        large_cap_volatility=large_cap_volatility,
+        mid_cap_returns=mid_cap_returns,
+        mid_cap_volatility=mid_cap_volatility,
+        alloc_fixed=alloc_fixed,
+        alloc_debt=alloc_debt,
+        alloc_hybrid=alloc_hybrid,
+        alloc_large_cap=alloc_large_cap,
+        alloc_mid_cap=alloc_mid_cap,
+    )
+    # Allocations for every year, broadcast against the simulated years
+    fund_kwargs = scheduled_allocations(
+        fund_kwargs, n_years_in_retire, allocation_schedule, equity_glide, by_bucket
+    )
+    fixed_allocations = allocation_schedule is None and equity_glide == 0
+
+    independent_normal_returns = (
+        correlation is None and inflation_volatility == 0 and historical_returns is None
+    )
+
+    if (
+        kernels.use_numba
+        and steps_per_year == 1
+        and independent_normal_returns
+        and fixed_allocations
+        and not by_bucket
+        and withdrawal_policy == "constant_real"
+    ):
+        # Growth, expenses and clamping in one compiled pass over every path, with
+        # no (simulations x years) growth matrix in between
+        yearly_expenses = calc_compound_returns_array(
+            p=inital_expense, r=inflation, t=np.arange(n_years_in_retire)
+        )
+        initial_corpora = np.asarray(initial_corpus, dtype=float).reshape(-1, 1)
+        normals = draw_standard_normal_paths(
+            seed=seed,
+            first_path=first_simulation,
+            n_paths=num_simulations,
+            shape=(n_years_in_retire, 4),
+        )
+        balances_results = np.empty(
+            (len(initial_corpora), num_simulations, n_years_in_retire)
+        )
+        kernels.compiled_kernel("bucket_drawdown_loops")(
+            np.repeat(initial_corpora, num_simulations, axis=1),
+            normals,
+            *bucket_growth_parameters(**fund_kwargs),
+            yearly_expenses,
+            ignore_first_year_expense,
+            balances_results,
+            np.empty(n_years_in_retire),
+        )
+        balances_results = balances_results.reshape(
+            np.shape(initial_corpus) + (num_simulations, n_years_in_retire)
+        )
+        return (
+            balances_results,
+            yearly_expenses,
+            np.count_nonzero(balances_results > 0, axis=-1),
+        )
+
+    yearly_growth, yearly_expenses = simulate_bucket_growth_n_expenses(
+        inital_expense=inital_expense,
+        inflation=inflation,
+        n_years_in_retire=n_years_in_retire,
+        num_simulations=num_simulations,
+        seed=seed,
+        first_simulation=first_simulation,
+        inflation_volatility=inflation_volatility,
+        correlation=correlation,
+        historical_returns=historical_returns,
+        block_length=block_length,
+        by_bucket=by_bucket,
+        **fund_kwargs,
+    )
+
+    # Several corpora are drawn down against the same simulated returns, giving
+    # balances of shape corpora x simulations x years
+    balances_results, years_lasted = calc_strategy_balances(
+        initial_corpora=np.expand_dims(initial_corpus, -1),
+        yearly_growth=yearly_growth,
+        yearly_expenses=yearly_expenses,
+        by_bucket=by_bucket,
+        shares=bucket_shares(
+            alloc_fixed, [alloc_debt, alloc_hybrid, alloc_large_cap, alloc_mid_cap]
+        ),
+        refill_threshold=refill_threshold,
+        withdrawal_policy=withdrawal_policy,
+        withdrawal_params=withdrawal_params,
+        ignore_first_year_expense=ignore_first_year_expense,
+        payment_factor=strategy_payment_factor(
+            yearly_growth, steps_per_year, by_bucket
+        ),
+    )
+
+    return balances_results, yearly_expenses, years_lasted
+
+
+### Retiring in every year of history ###
+# Each start year of the historical returns file is a cohort that retires into the
+# years that followed, with the bucket allocations. Every corpus is drawn down on
+# every cohort at once, giving (corpora x cohorts x years) balances, the expenses
+# (cohorts x years when the file has inflation) and the years each corpus lasted
+def historical_cohort_backtest(
+    initial_corpus,
+    inital_expense,
+    inflation,
+    n_years_in_retire,
+    historical_returns,
+    ignore_first_year_expense=True,
+    steps_per_year=1,
+    bucket_mode="rebalance",
+    refill_threshold=0.0,
+    allocation_schedule=None,
+    equity_glide=0.0,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+    **fund_kwargs,
+):
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+    by_bucket = refills_buckets(bucket_mode)
+    fund_kwargs = scheduled_allocations(
+        fund_kwargs, n_years_in_retire, allocation_schedule, equity_glide, by_bucket
+    )
+
+    history = open_historical_returns(historical_returns)
+    cohort_returns = history.cohort_windows(n_years_in_retire)
+    fixed_growth, _, _, allocations = bucket_growth_parameters(
+        **fund_kwargs, by_bucket=by_bucket
+    )
+    yearly_growth = kernels.portfolio_growth(
+        cohort_returns[..., :4] / 100, fixed_growth, allocations, by_bucket
+    )
+    if history.has_inflation:
+        yearly_expenses = calc_expenses_on_inflation_paths(
+            inital_expense, cohort_returns[..., 4] / 100
+        )
+    else:
+        yearly_expenses = calc_compound_returns_array(
+            p=inital_expense, r=inflation, t=np.arange(n_years_in_retire)
+        )
+
+    balances, years_lasted = calc_strategy_balances(
+        initial_corpora=np.expand_dims(initial_corpus, -1),
+        yearly_growth=yearly_growth,
+        yearly_expenses=yearly_expenses,
+        by_bucket=by_bucket,
+        shares=bucket_shares(
+            fund_kwargs["alloc_fixed"],
+            [
+                fund_kwargs[name]
+                for name in (
+                    "alloc_debt",
+                    "alloc_hybrid",
+                    "alloc_large_cap",
+                    "alloc_mid_cap",
+                )
+            ],
+        ),
+        refill_threshold=refill_threshold,
+        withdrawal_policy=withdrawal_policy,
+        withdrawal_params=withdrawal_params,
+        ignore_first_year_expense=ignore_first_year_expense,
+        payment_factor=strategy_payment_factor(
+            yearly_growth, steps_per_year, by_bucket
+        ),
+    )
+    return balances, yearly_expenses, years_lasted
+
+
+### Smallest corpus reaching a target success rate under the bucket strategy ###
+# The returns are simulated once and every probe is only a drawdown over them. The
+# success rate grows with the corpus, so the corpus is found by bisection, to within
+# tolerance rupees. Returns inf if no corpus reaches the target, e.g. 100% success
+# with paths whose portfolio is wiped out in some year. A path succeeds when it
+# lasts every year, so with a withdrawal_policy other than constant_real its
+# withdrawals must also never fall short, see calc_years_lasted
+@memoize(maxsize=32, cache_if=lambda arguments: arguments["seed"] is not None)
+def solve_min_corpus_for_success_rate(
+    target_success_rate,
+    inital_expense,
+    inflation,
+    n_years_in_retire,
+    fixed_deposit_returns,
+    debt_fund_returns,
+    debt_fund_volatility,
+    hybrid_fund_returns,
+    hybrid_fund_volatility,
+    large_cap_returns,
+    large_cap_volatility,
+    mid_cap_returns,
+    mid_cap_volatility,
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    num_simulations=1000,
+    ignore_first_year_expense=True,
+    seed=None,
+    tolerance=1000,
+    max_doublings=64,
+    steps_per_year=1,
+    inflation_volatility=0.0,
+    correlation=None,
+    historical_returns=None,
+    block_length=DEFAULT_BLOCK_LENGTH,
+    bucket_mode="rebalance",
+    refill_threshold=0.0,
+    allocation_schedule=None,
+    equity_glide=0.0,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+):
+    if n_years_in_retire == 0:
+        return 0.0
+    by_bucket = refills_buckets(bucket_mode)
+    shares = bucket_shares(
+        alloc_fixed, [alloc_debt, alloc_hybrid, alloc_large_cap, alloc_mid_cap]
+    )
+    allocations = scheduled_allocations(
+        dict(
+            alloc_fixed=alloc_fixed,
+            alloc_debt=alloc_debt,
+            alloc_hybrid=alloc_hybrid,
+            alloc_large_cap=alloc_large_cap,
+            alloc_mid_cap=alloc_mid_cap,
+        ),
+        n_years_in_retire,
+        allocation_schedule,
+        equity_glide,
+        by_bucket,
+    )
+
+    yearly_growth, yearly_expenses = simulate_bucket_growth_n_expenses(
+        inital_expense=inital_expense,
+        inflation=inflation,
+        n_years_in_retire=n_years_in_retire,
+        num_simulations=num_simulations,
+        seed=seed,
+        inflation_volatility=inflation_volatility,
+        correlation=correlation,
+        historical_returns=historical_returns,
+        block_length=block_length,
+        by_bucket=by_bucket,
+        fixed_deposit_returns=fixed_deposit_returns,
+        debt_fund_returns=debt_fund_returns,
+        debt_fund_volatility=debt_fund_volatility,
+        hybrid_fund_returns=hybrid_fund_returns,
+        hybrid_fund_volatility=hybrid_fund_volatility,
+        large_cap_returns=large_cap_returns,
+        large_cap_volatility=large_cap_volatility,
+        mid_cap_returns=mid_cap_returns,
+        mid_cap_volatility=mid_cap_volatility,
+        **allocations,
+    )
+    payment_factor = strategy_payment_factor(yearly_growth, steps_per_year, by_bucket)
+
+    def success_rate(corpus):
+        _, years_lasted = calc_strategy_balances(
+            initial_corpora=corpus,
+            yearly_growth=yearly_growth,
+            yearly_expenses=yearly_expenses,
+            by_bucket=by_bucket,
+            shares=shares,
+            refill_threshold=refill_threshold,
+            withdrawal_policy=withdrawal_policy,
+            withdrawal_params=withdrawal_params,
+            ignore_first_year_expense=ignore_first_year_expense,
+            payment_factor=payment_factor,
+        )
+        return (
+            np.count_nonzero(years_lasted == n_years_in_retire) / num_simulations * 100
+        )
+
+    # Grow the upper end until it is enough, starting from the undiscounted expenses
+    low, high = 0.0, max(float(yearly_expenses.sum(axis=-1).max()), tolerance)
+    for _ in range(max_doublings):
+        if success_rate(high) >= target_success_rate:
+            break
+        low, high = high, 2 * high
+    else:
+        return np.inf
+
+    while high - low > tolerance:
+        middle = (low + high) / 2
+        if success_rate(middle) >= target_success_rate:
+            high = middle
+        else:
+            low = middle
+
+    return high
@@ -0,0 +1,95 @@
+import numpy as np
+
+### Allocations that change over the years in retirement ###
+# An allocation schedule is (years x assets) of the shares of the corpus in each
+# asset, the columns as the alloc_ arguments of the simulations, the rows from the
+# first year of retirement on. The portfolio is rebalanced to each year's row
+ALLOCATION_ASSETS = ("fixed", "debt", "hybrid", "large_cap", "mid_cap")
+EQUITY_ASSETS = ("large_cap", "mid_cap")
+
+
+# Schedule from the allocations at retirement with the equity share changing by
+# equity_glide % of the corpus a year (-1 takes 1% out of equity every year),
+# kept between 0 and the whole allocation. What leaves or joins equity is spread
+# over the other assets in proportion to their allocations at retirement (to the
+# fixed deposits when they have none), and the equity funds keep their proportions
+def glide_path_schedule(
+    alloc_fixed,
+    alloc_debt,
+    alloc_hybrid,
+    alloc_large_cap,
+    alloc_mid_cap,
+    n_years_in_retire,
+    equity_glide,
+):
+    allocations = np.array(
+        [alloc_fixed, alloc_debt, alloc_hybrid, alloc_large_cap, alloc_mid_cap],
+        dtype=float,
+    )
+    is_equity = np.isin(ALLOCATION_ASSETS, EQUITY_ASSETS)
+    total = allocations.sum()
+    equity = allocations[is_equity].sum()
+
+    equity_path = np.clip(
+        equity + equity_glide / 100 * np.arange(n_years_in_retire), 0, total
+    )
+    equity_weights = (
+        allocations[is_equity] / equity
+        if equity > 0
+        else np.full(is_equity.sum(), 1 / is_equity.sum())
+    )
+    other_weights = (
+        allocations[~is_equity] / (total - equity)
+        if total > equity
+        else np.eye(1, (~is_equity).sum())[0]
+    )
+
+    schedule = np.empty((n_years_in_retire, len(ALLOCATION_ASSETS)))
+    schedule[:, is_equity] = np.multiply.outer(equity_path, equity_weights)
+    schedule[:, ~is_equity] = np.multiply.outer(total - equity_path, other_weights)
+    return schedule
+
+
+# The alloc_ arguments in fund_kwargs made per year (years,) from allocation_schedule,
+# or else from the glide path of equity_glide. Left as they are without either.
+# Buckets that are refilled (by_bucket) are not rebalanced, so have no schedule
+def scheduled_allocations(
+    fund_kwargs,
+    n_years_in_retire,
+    allocation_schedule=None,
+    equity_glide=0.0,
+    by_bucket=False,
+):
+    if allocation_schedule is None and equity_glide == 0:
+        return fund_kwargs
+    if by_bucket:
+        raise ValueError(
+            "Allocation schedules and glide paths rebalance the portfolio every "
+            "year, they cannot be used with refilled buckets"
+        )
+    if allocation_schedule is None:
+        allocation_schedule = glide_path_schedule(
+            **{
+                f"alloc_{asset}": fund_kwargs[f"alloc_{asset}"]
+                for asset in ALLOCATION_ASSETS
+            },
+            n_years_in_retire=n_years_in_retire,
+            equity_glide=equity_glide,
+        )
+
+    schedule = np.asarray(allocation_schedule, dtype=float)
+    if schedule.shape != (n_years_in_retire, len(ALLOCATION_ASSETS)):
+        raise ValueError(
+            f"The allocation schedule must be (years x {len(ALLOCATION_ASSETS)}) "
+            f"= ({n_years_in_retire} x {len(ALLOCATION_ASSETS)}) for the columns "
+            f"{', '.join(ALLOCATION_ASSETS)}, got {schedule.shape}"
+        )
+    if not np.isfinite(schedule).all() or (schedule < 0).any():
+        raise ValueError("Allocations in the schedule must be 0 or more")
+    return dict(
+        fund_kwargs,
+        **{
+            f"alloc_{asset}": schedule[:, column]
+            for column, asset in enumerate(ALLOCATION_ASSETS)
+        },
+    )
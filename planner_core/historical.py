@@ -0,0 +1,119 @@
+import os
+import threading
+
+import numpy as np
+
+from .scenarios import SCENARIO_VARIABLES
+from .utils import draw_uniform_paths
+
+DEFAULT_BLOCK_LENGTH = 5
+
+
+### Yearly returns from history, memory-mapped ###
+# The file is a .npy array of (years x variables) yearly returns in %, with the
+# columns of SCENARIO_VARIABLES. Inflation may be left out (4 columns). It is
+# opened read-only with mmap_mode, so worker processes opening the same file share
+# its pages through the OS and nothing is copied or pickled, only the path is sent
+class HistoricalReturns:
+    def __init__(self, path):
+        try:
+            self.modified = os.stat(path).st_mtime_ns
+            self.returns = np.load(path, mmap_mode="r", allow_pickle=False)
+        except (OSError, ValueError, EOFError) as error:
+            raise ValueError(
+                f"Cannot read historical returns {path}: {error}"
+            ) from None
+        n_variables = len(SCENARIO_VARIABLES)
+        if (
+            self.returns.ndim != 2
+            or self.returns.shape[1] not in (n_variables - 1, n_variables)
+            or len(self.returns) == 0
+        ):
+            raise ValueError(
+                f"Historical returns must be (years x {n_variables - 1} or "
+                f"{n_variables}) yearly returns, got {self.returns.shape} in {path}"
+            )
+        if not np.issubdtype(self.returns.dtype, np.floating):
+            raise ValueError(f"Historical returns must be floats in {path}")
+        self.path = path
+        self.has_inflation = self.returns.shape[1] == n_variables
+        self.year_indexes = {}
+
+    # The years of every block, (start years x block_length). Blocks wrap around
+    # from the last year to the first, so every year is equally likely to be drawn
+    def block_year_indexes(self, block_length):
+        if block_length not in self.year_indexes:
+            n_years = len(self.returns)
+            self.year_indexes[block_length] = (
+                np.arange(n_years)[:, None] + np.arange(block_length)
+            ) % n_years
+        return self.year_indexes[block_length]
+
+    ### Block bootstrap ###
+    # Each path strings together randomly chosen blocks of block_length consecutive
+    # years, which keeps the runs of good and bad years and the links between the
+    # variables within a year. Returns (n_paths x n_years x columns) in %. Only the
+    # block starts are random, drawn as the normal draws are, so path k is the
+    # same however a run is chunked; the rest is indexing into the history
+    def sample(self, seed, first_path, n_paths, n_years, block_length):
+        if block_length < 1:
+            raise ValueError("The block length must be at least 1 year")
+        n_blocks = -(-n_years // block_length)
+        block_starts = (
+            draw_uniform_paths(seed, first_path, n_paths, (n_blocks,))
+            * len(self.returns)
+        ).astype(np.intp)
+        years = self.block_year_indexes(block_length)[block_starts]
+        years = years.reshape(n_paths, n_blocks * block_length)[:, :n_years]
+        return np.asarray(self.returns[years])
+
+    ### Every run of n_years consecutive years, one per start year ###
+    # (start years x n_years x columns), a strided view into the mapped file, so
+    # nothing is copied however many start years there are
+    def cohort_windows(self, n_years):
+        if not 1 <= n_years <= len(self.returns):
+            raise ValueError(
+                f"Cannot take {n_years} year windows of {len(self.returns)} years "
+                f"of historical returns"
+            )
+        return np.lib.stride_tricks.sliding_window_view(
+            self.returns, n_years, axis=0
+        ).swapaxes(1, 2)
+
+
+# One HistoricalReturns per file and process, reopened when the file changes
+opened_histories = {}
+opened_histories_lock = threading.Lock()
+
+
+def open_historical_returns(path):
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except OSError as error:
+        raise ValueError(f"Cannot read historical returns {path}: {error}") from None
+    with opened_histories_lock:
+        history = opened_histories.get(path)
+        if history is None or history.modified != modified:
+            history = opened_histories[path] = HistoricalReturns(path)
+        return history
+
+
+################################################
+
+
+### Writing a historical returns file ###
+# From a CSV file with a header naming the columns of SCENARIO_VARIABLES (any
+# other columns, like the year, are left out) and one row of % returns a year
+def convert_historical_csv(csv_path, npy_path):
+    table = np.genfromtxt(csv_path, delimiter=",", names=True, dtype=float)
+    columns = [name for name in SCENARIO_VARIABLES if name in table.dtype.names]
+    if columns not in (list(SCENARIO_VARIABLES[:-1]), list(SCENARIO_VARIABLES)):
+        raise ValueError(
+            f"{csv_path} needs the columns {', '.join(SCENARIO_VARIABLES[:-1])} "
+            f"and optionally {SCENARIO_VARIABLES[-1]}"
+        )
+    returns = np.column_stack([np.atleast_1d(table[name]) for name in columns])
+    if not np.isfinite(returns).all():
+        raise ValueError(f"{csv_path} has missing or invalid returns")
+    np.save(npy_path, returns)
+    return returns.shape
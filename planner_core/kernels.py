@@ -0,0 +1,120 @@
+import importlib.util
+import os
+
+import numpy as np
+
+### Compiled year by year recursions ###
+# The recursions over the years are written out below as plain loops. When Numba
+# is installed they are compiled on first use and used in place of the NumPy code,
+# unless PLANNER_USE_NUMBA=0. The loops do the same floating point operations in
+# the same order as the NumPy code, so both give the same bits. Numba is only
+# imported when a kernel is first needed, importing planner_core stays cheap
+NUMBA_INSTALLED = importlib.util.find_spec("numba") is not None
+use_numba = NUMBA_INSTALLED and os.environ.get("PLANNER_USE_NUMBA", "1") != "0"
+compiled_kernels = {}
+
+
+def compiled_kernel(name):
+    if name not in compiled_kernels:
+        import numba
+
+        compiled_kernels[name] = numba.njit(cache=True, nogil=True)(globals()[name])
+    return compiled_kernels[name]
+
+
+################################################
+
+
+### Growth of the bucket portfolio from standard normal draws (NumPy) ###
+# normals is (paths x years x funds). The funds are added one at a time, in the
+# same order as bucket_drawdown_loops, rather than with a matrix product whose
+# order of summation is up to BLAS
+def bucket_growth(
+    normals, fixed_growth, fund_returns, fund_volatility, allocations, by_bucket=False
+):
+    rand_returns = (fund_returns + fund_volatility * normals) / 100
+    return portfolio_growth(rand_returns, fixed_growth, allocations, by_bucket)
+
+
+# The same from the fund returns themselves (paths x years x funds, as fractions).
+# allocations are (funds,), or (years x funds) with fixed_growth (years,) for
+# allocations that change every year, broadcast against the years of the returns.
+# With by_bucket they are (buckets x funds) with fixed_growth (buckets,), for the
+# growth of each bucket (paths x years x buckets). Funds allocated nothing are
+# left out
+def portfolio_growth(fund_returns, fixed_growth, allocations, by_bucket=False):
+    allocations = np.asarray(allocations)
+    if by_bucket:
+        growth = np.empty(fund_returns.shape[:-1] + (len(allocations),))
+        for bucket, bucket_allocations in enumerate(allocations):
+            growth[..., bucket] = portfolio_growth(
+                fund_returns, fixed_growth[bucket], bucket_allocations
+            )
+        return growth
+
+    growth = np.empty(fund_returns.shape[:-1])
+    growth[...] = fixed_growth
+    for fund in range(fund_returns.shape[-1]):
+        if np.any(allocations[..., fund]):
+            growth += (1 + fund_returns[..., fund]) * allocations[..., fund]
+    return growth
+
+
+### Drawdown of (corpora x paths) balances on (paths x years) growth and expenses ###
+# Fills balances (corpora x paths x years). Depleted balances are written as 0 but
+# carried on as they are, as in calc_drawdown_balances
+def drawdown_loops(
+    initial_corpora, yearly_growth, yearly_expenses, ignore_first_year_expense, balances
+):
+    n_corpora, n_paths = initial_corpora.shape
+    n_years = yearly_growth.shape[1]
+    for corpus in range(n_corpora):
+        for path in range(n_paths):
+            balance = initial_corpora[corpus, path]
+            for year in range(n_years):
+                if year == 0 and ignore_first_year_expense:
+                    balance = initial_corpora[corpus, path]
+                else:
+                    balance = (
+                        balance * yearly_growth[path, year]
+                        - yearly_expenses[path, year]
+                    )
+                balances[corpus, path, year] = 0.0 if balance <= 0 else balance
+
+
+### The bucket simulation in one pass ###
+# The allocation split, growth, expenses and clamping of each path are done
+# together, with growth_buffer (years) the only scratch space
+def bucket_drawdown_loops(
+    initial_corpora,
+    normals,
+    fixed_growth,
+    fund_returns,
+    fund_volatility,
+    allocations,
+    yearly_expenses,
+    ignore_first_year_expense,
+    balances,
+    growth_buffer,
+):
+    n_corpora, n_paths = initial_corpora.shape
+    n_years, n_funds = normals.shape[1], normals.shape[2]
+    for path in range(n_paths):
+        for year in range(n_years):
+            growth = fixed_growth
+            for fund in range(n_funds):
+                rand_return = (
+                    fund_returns[fund]
+                    + fund_volatility[fund] * normals[path, year, fund]
+                ) / 100
+                growth += (1 + rand_return) * allocations[fund]
+            growth_buffer[year] = growth
+
+        for corpus in range(n_corpora):
+            balance = initial_corpora[corpus, path]
+            for year in range(n_years):
+                if year == 0 and ignore_first_year_expense:
+                    balance = initial_corpora[corpus, path]
+                else:
+                    balance = balance * growth_buffer[year] - yearly_expenses[year]
+                balances[corpus, path, year] = 0.0 if balance <= 0 else balance
@@ -0,0 +1,174 @@
+import atexit
+import os
+import threading
+
+import numpy as np
+
+from .cache import memoize
+from .calculations import bucket_strategy_simulator
+from .simulation_stats import SimulationStats
+from .utils import as_seed_sequence
+
+# Below this many simulations, starting work in other processes costs more than it saves
+MIN_SIMULATIONS_FOR_POOL = 50000
+# Upper bound on the simulations held in memory at once by one process
+MAX_SIMULATIONS_PER_CHUNK = 50000
+
+
+### One process pool for the whole process ###
+# Kept at module level so the same workers are reused across Streamlit reruns and
+# by every session. The pool only grows: a caller asking for fewer workers shares
+# it and limits its own shards to max_workers, one asking for more gets a bigger
+# pool while the old one finishes the work already sent to it and exits
+process_pool = None
+process_pool_workers = None
+process_pool_lock = threading.Lock()
+
+
+def default_workers():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_process_pool(max_workers=None):
+    with process_pool_lock:
+        return current_process_pool(max_workers or default_workers())
+
+
+# Submits under the lock, so the pool cannot be replaced between getting and using it
+def submit_to_process_pool(max_workers, fn, /, *args, **kwargs):
+    with process_pool_lock:
+        pool = current_process_pool(max_workers or default_workers())
+        return pool.submit(fn, *args, **kwargs)
+
+
+# A pool with at least max_workers workers, called with process_pool_lock held
+def current_process_pool(max_workers):
+    # Imported here, only callers that start a pool pay for them
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    global process_pool, process_pool_workers
+    if process_pool is None or process_pool_workers < max_workers:
+        if process_pool is not None:
+            # Never cancels, other callers may still be waiting on its work
+            process_pool.shutdown(wait=False)
+        # Workers are spawned, not forked, as forking a threaded server is unsafe
+        process_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        process_pool_workers = max_workers
+    return process_pool
+
+
+def shutdown_process_pool():
+    global process_pool, process_pool_workers
+    with process_pool_lock:
+        if process_pool is not None:
+            process_pool.shutdown(wait=True, cancel_futures=True)
+        process_pool = None
+        process_pool_workers = None
+
+
+atexit.register(shutdown_process_pool)
+
+
+################################################
+
+
+### Statistics of one shard of simulations ###
+# The shard is simulated a chunk at a time and folded into SimulationStats, so a
+# worker never holds more than MAX_SIMULATIONS_PER_CHUNK paths unless they are kept.
+# With several initial corpora there is one SimulationStats per corpus
+def simulate_shard(
+    simulator_kwargs, seed, first_simulation, num_simulations, keep_paths=False
+):
+    n_corpora = np.size(simulator_kwargs["initial_corpus"])
+    stats = [
+        SimulationStats(
+            n_years=simulator_kwargs["n_years_in_retire"], keep_paths=keep_paths
+        )
+        for _ in range(n_corpora)
+    ]
+    for chunk_first, chunk_simulations in split_simulations(
+        num_simulations, -(-num_simulations // MAX_SIMULATIONS_PER_CHUNK)
+    ):
+        # The uncached simulator, chunks are never repeated within a worker
+        balances, _, years_lasted = bucket_strategy_simulator.__wrapped__(
+            **simulator_kwargs,
+            num_simulations=chunk_simulations,
+            seed=seed,
+            first_simulation=first_simulation + chunk_first,
+        )
+        for corpus_stats, corpus_balances, corpus_years_lasted in zip(
+            stats,
+            balances.reshape(n_corpora, chunk_simulations, -1),
+            years_lasted.reshape(n_corpora, chunk_simulations),
+        ):
+            corpus_stats.update(corpus_balances, corpus_years_lasted)
+
+    if np.ndim(simulator_kwargs["initial_corpus"]) == 0:
+        return stats[0]
+    return stats
+
+
+def split_simulations(num_simulations, n_shards):
+    bounds = np.linspace(0, num_simulations, n_shards + 1).round().astype(int)
+    return [
+        (int(first), int(last - first))
+        for first, last in zip(bounds[:-1], bounds[1:])
+        if last > first
+    ]
+
+
+################################################
+
+
+### Bucket strategy simulation sharded over a process pool ###
+# simulator_kwargs are the bucket_strategy_simulator arguments other than
+# num_simulations, seed and first_simulation. The seed is resolved once here, so
+# the paths are the same as a single bucket_strategy_simulator call with that seed.
+# Returns the merged SimulationStats of all the shards, or a list of them, one per
+# corpus, when initial_corpus is a list. All the corpora share the same scenarios
+@memoize(maxsize=8, cache_if=lambda arguments: arguments["seed"] is not None)
+def bucket_strategy_simulator_parallel(
+    num_simulations,
+    seed=None,
+    max_workers=None,
+    keep_paths=False,
+    min_simulations_for_pool=MIN_SIMULATIONS_FOR_POOL,
+    **simulator_kwargs,
+):
+    seed_seq = as_seed_sequence(seed)
+    max_workers = max_workers or default_workers()
+
+    if max_workers <= 1 or num_simulations < min_simulations_for_pool:
+        return simulate_shard(
+            simulator_kwargs, seed_seq, 0, num_simulations, keep_paths=keep_paths
+        )
+
+    futures = [
+        submit_to_process_pool(
+            max_workers,
+            simulate_shard,
+            simulator_kwargs,
+            seed_seq,
+            first_simulation,
+            shard_simulations,
+            keep_paths,
+        )
+        for first_simulation, shard_simulations in split_simulations(
+            num_simulations, max_workers
+        )
+    ]
+
+    stats = futures[0].result()
+    for future in futures[1:]:
+        if isinstance(stats, list):
+            for corpus_stats, shard_stats in zip(stats, future.result()):
+                corpus_stats.merge(shard_stats)
+        else:
+            stats.merge(future.result())
+    return stats
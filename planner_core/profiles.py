@@ -0,0 +1,353 @@
+import json
+import math
+
+import numpy as np
+
+from .calculations import (
+    bucket_strategy_simulator,
+    calc_specific_values_on_input,
+    calculate_yearly_values,
+)
+from .utils import calc_retirement_balances_n_expenses_batch
+from .withdrawals import WITHDRAWAL_DEFAULTS
+
+### Inputs of one planning profile, defaulting to the app's input widgets ###
+# Returns, volatilities and allocations are in % as they are entered in the app
+PROFILE_DEFAULTS = dict(
+    current_age=35,
+    retire_age=60,
+    estimated_years_retirement=40,
+    current_monthly_expenses=50000,
+    other_annual_expenses=100000,
+    overestimate_expenses=10.0,
+    current_investments=1e6,
+    inflation_before_retirement=7.0,
+    inflation_after_retirement=6.0,
+    return_current_investments=14.0,
+    net_rate_return_expected=12.0,
+    net_rate_return_expected_after_retire=6.0,
+    annual_increase_investments=10.0,
+    assumed_retirement_corpus=1e8,
+    fixed_deposit_returns=8.0,
+    debt_fund_returns=9.0,
+    debt_fund_volatility=3.0,
+    hybrid_fund_returns=10.0,
+    hybrid_fund_volatility=10.0,
+    large_cap_returns=12.0,
+    large_cap_volatility=20.0,
+    mid_cap_returns=15.0,
+    mid_cap_volatility=30.0,
+    alloc_fixed=50.0,
+    alloc_debt=10.0,
+    alloc_hybrid=20.0,
+    alloc_large_cap=10.0,
+    alloc_mid_cap=10.0,
+    num_simulations=10,
+    simulation_seed=0,
+    # 12 for monthly investments and expenses
+    steps_per_year=1,
+    inflation_volatility=0.0,
+    # Correlations of the fund returns and inflation, see scenarios.SCENARIO_VARIABLES
+    correlation=None,
+    # A .npy file of yearly returns to bootstrap instead, see historical.py
+    historical_returns=None,
+    block_length=5,
+    # "refill" spends the buckets in turn and refills them, see buckets.py
+    bucket_mode="rebalance",
+    refill_threshold=0.0,
+    # Change in the % allocated to equity every year, or a (years x 5) schedule of
+    # the allocations in %, see glide_paths.py
+    equity_glide=0.0,
+    allocation_schedule=None,
+    # How the yearly withdrawals follow the portfolio, see withdrawals.py. A blank
+    # withdrawal_rate (in %) withdraws at the rate of the first year's expenses
+    withdrawal_policy="constant_real",
+    **WITHDRAWAL_DEFAULTS,
+)
+INTEGER_FIELDS = (
+    "current_age",
+    "retire_age",
+    "estimated_years_retirement",
+    "num_simulations",
+    "simulation_seed",
+    "steps_per_year",
+    "block_length",
+)
+# Fields holding a matrix, as nested lists (or their JSON text in a CSV cell)
+MATRIX_FIELDS = ("correlation", "allocation_schedule")
+TEXT_FIELDS = ("historical_returns", "bucket_mode", "withdrawal_policy")
+
+
+# Fills in the defaults for missing (or blank) fields, profile_id is passed through
+def profile_inputs(profile):
+    unknown = set(profile) - set(PROFILE_DEFAULTS) - {"profile_id"}
+    if unknown:
+        raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+
+    inputs = dict(PROFILE_DEFAULTS)
+    for field, value in profile.items():
+        if field == "profile_id" or value is None:
+            continue
+        if isinstance(value, float) and math.isnan(value):
+            continue
+        if field in MATRIX_FIELDS:
+            inputs[field] = json.loads(value) if isinstance(value, str) else value
+        elif field in TEXT_FIELDS:
+            inputs[field] = str(value)
+        else:
+            inputs[field] = int(value) if field in INTEGER_FIELDS else float(value)
+            if not math.isfinite(inputs[field]):
+                raise ValueError(f"{field} must be a finite number, got {value!r}")
+
+    # What the calculations cannot work with, rather than failing inside them
+    if inputs["retire_age"] <= inputs["current_age"]:
+        raise ValueError("retire_age must be above current_age")
+    for field, minimum in MINIMUM_VALUES.items():
+        if inputs[field] < minimum:
+            raise ValueError(f"{field} must be at least {minimum}")
+    return inputs
+
+
+MINIMUM_VALUES = dict(
+    estimated_years_retirement=0,
+    num_simulations=1,
+    steps_per_year=1,
+    block_length=1,
+)
+
+
+################################################
+
+
+### The app's calculations for one profile, without Streamlit ###
+SPECIFIC_VALUE_INPUTS = (
+    "current_age",
+    "retire_age",
+    "estimated_years_retirement",
+    "current_monthly_expenses",
+    "other_annual_expenses",
+    "overestimate_expenses",
+    "current_investments",
+    "inflation_before_retirement",
+    "inflation_after_retirement",
+    "return_current_investments",
+    "net_rate_return_expected",
+    "net_rate_return_expected_after_retire",
+    "annual_increase_investments",
+    "steps_per_year",
+)
+SPECIFIC_VALUE_NAMES = (
+    "current_safe_monthly_expense",
+    "value_of_current_investment",
+    "current_expenses_at_retirement",
+    "total_retirement_corpus",
+    "remaining_corpus_to_save",
+    "yearly_corpus",
+)
+YEARLY_VALUE_INPUTS = (
+    "current_age",
+    "retire_age",
+    "estimated_years_retirement",
+    "current_investments",
+    "inflation_before_retirement",
+    "inflation_after_retirement",
+    "return_current_investments",
+    "net_rate_return_expected",
+    "net_rate_return_expected_after_retire",
+    "annual_increase_investments",
+    "steps_per_year",
+)
+FUND_INPUTS = (
+    "fixed_deposit_returns",
+    "debt_fund_returns",
+    "debt_fund_volatility",
+    "hybrid_fund_returns",
+    "hybrid_fund_volatility",
+    "large_cap_returns",
+    "large_cap_volatility",
+    "mid_cap_returns",
+    "mid_cap_volatility",
+)
+ALLOCATION_INPUTS = (
+    "alloc_fixed",
+    "alloc_debt",
+    "alloc_hybrid",
+    "alloc_large_cap",
+    "alloc_mid_cap",
+)
+
+
+# With cached=False the memoized calculations are called directly, for callers
+# like the batch planner that never see the same profile twice
+def specific_values(inputs, cached=True):
+    calc = calc_specific_values_on_input
+    if not cached:
+        calc = calc.__wrapped__
+    return dict(
+        zip(
+            SPECIFIC_VALUE_NAMES,
+            calc(**{field: inputs[field] for field in SPECIFIC_VALUE_INPUTS}),
+        )
+    )
+
+
+def yearly_values(inputs, values, cached=True):
+    calc = calculate_yearly_values if cached else calculate_yearly_values.__wrapped__
+    return calc(
+        **{field: inputs[field] for field in YEARLY_VALUE_INPUTS},
+        current_safe_monthly_expense=values["current_safe_monthly_expense"],
+        current_expenses_at_retirement=values["current_expenses_at_retirement"],
+        total_retirement_corpus=values["total_retirement_corpus"],
+        yearly_corpus=values["yearly_corpus"],
+    )
+
+
+# The entered corpus and the ones from the 3% and 4% rules, as in the app
+def retirement_corpora(inputs, values):
+    return [
+        inputs["assumed_retirement_corpus"],
+        100 / 3 * values["current_expenses_at_retirement"],
+        100 / 4 * values["current_expenses_at_retirement"],
+    ]
+
+
+# Arguments of bucket_strategy_simulator other than num_simulations and seed
+def bucket_simulator_kwargs(inputs, values):
+    return dict(
+        initial_corpus=retirement_corpora(inputs, values),
+        inital_expense=values["current_expenses_at_retirement"],
+        inflation=inputs["inflation_after_retirement"],
+        returns=inputs["net_rate_return_expected_after_retire"],
+        n_years_in_retire=inputs["estimated_years_retirement"],
+        steps_per_year=inputs["steps_per_year"],
+        inflation_volatility=inputs["inflation_volatility"],
+        correlation=inputs["correlation"],
+        historical_returns=inputs["historical_returns"],
+        block_length=inputs["block_length"],
+        bucket_mode=inputs["bucket_mode"],
+        refill_threshold=inputs["refill_threshold"],
+        equity_glide=inputs["equity_glide"],
+        allocation_schedule=(
+            None
+            if inputs["allocation_schedule"] is None
+            else np.asarray(inputs["allocation_schedule"], dtype=float) / 100
+        ),
+        withdrawal_policy=inputs["withdrawal_policy"],
+        withdrawal_params=withdrawal_params(inputs),
+        **{field: inputs[field] for field in FUND_INPUTS},
+        **{field: inputs[field] / 100 for field in ALLOCATION_INPUTS},
+    )
+
+
+# Parameters of the withdrawal_policy, in % as they are entered
+def withdrawal_params(inputs):
+    return {field: inputs[field] for field in WITHDRAWAL_DEFAULTS}
+
+
+# Returns the summary values, and the year by year table when include_yearly is set
+def plan_profile(profile, include_yearly=False):
+    inputs = profile_inputs(profile)
+    values = specific_values(inputs, cached=False)
+    corpora = retirement_corpora(inputs, values)
+
+    balances, _ = calc_retirement_balances_n_expenses_batch(
+        initial_corpora=corpora,
+        inital_expense=values["current_expenses_at_retirement"],
+        inflation=inputs["inflation_after_retirement"],
+        returns=inputs["net_rate_return_expected_after_retire"],
+        n_years_in_retire=inputs["estimated_years_retirement"],
+        steps_per_year=inputs["steps_per_year"],
+        withdrawal_policy=inputs["withdrawal_policy"],
+        withdrawal_params=withdrawal_params(inputs),
+    )
+    lasting_years = np.count_nonzero(balances > 0, axis=1)
+
+    _, _, bucket_years_lasted = bucket_strategy_simulator.__wrapped__(
+        **bucket_simulator_kwargs(inputs, values),
+        num_simulations=inputs["num_simulations"],
+        seed=inputs["simulation_seed"],
+    )
+    if inputs["estimated_years_retirement"] > 0:
+        success_rates = np.count_nonzero(
+            bucket_years_lasted == inputs["estimated_years_retirement"], axis=1
+        ) / (inputs["num_simulations"] / 100)
+    else:
+        success_rates = np.full(len(corpora), np.nan)
+
+    summary = dict(
+        profile_id=profile.get("profile_id"),
+        current_safe_monthly_expense=values["current_safe_monthly_expense"],
+        value_of_current_investment=values["value_of_current_investment"],
+        current_expenses_at_retirement=values["current_expenses_at_retirement"],
+        total_retirement_corpus=values["total_retirement_corpus"],
+        remaining_corpus_to_save=values["remaining_corpus_to_save"],
+        monthly_investment=values["yearly_corpus"] / 12,
+        retirement_corpus_3_pct_rule=corpora[1],
+        retirement_corpus_4_pct_rule=corpora[2],
+        lasting_years_assumed_corpus=int(lasting_years[0]),
+        lasting_years_3_pct_rule=int(lasting_years[1]),
+        lasting_years_4_pct_rule=int(lasting_years[2]),
+        success_rate_assumed_corpus=float(success_rates[0]),
+        success_rate_3_pct_rule=float(success_rates[1]),
+        success_rate_4_pct_rule=float(success_rates[2]),
+        error=None,
+    )
+    if not include_yearly:
+        return summary, None
+    return summary, yearly_values(inputs, values, cached=False)
+
+
+# The columns of a summary, error is None unless the profile could not be planned
+SUMMARY_FIELDS = (
+    "profile_id",
+    "current_safe_monthly_expense",
+    "value_of_current_investment",
+    "current_expenses_at_retirement",
+    "total_retirement_corpus",
+    "remaining_corpus_to_save",
+    "monthly_investment",
+    "retirement_corpus_3_pct_rule",
+    "retirement_corpus_4_pct_rule",
+    "lasting_years_assumed_corpus",
+    "lasting_years_3_pct_rule",
+    "lasting_years_4_pct_rule",
+    "success_rate_assumed_corpus",
+    "success_rate_3_pct_rule",
+    "success_rate_4_pct_rule",
+    "error",
+)
+
+
+# The summary of a profile that failed, with its error and no values
+def failed_summary(profile, error):
+    return dict(
+        dict.fromkeys(SUMMARY_FIELDS, np.nan),
+        profile_id=profile.get("profile_id"),
+        error=f"{type(error).__name__}: {error}",
+    )
+
+
+# Plans a list of profiles, in a form that is cheap to send back from a worker:
+# a list of summaries and the yearly tables stacked into columns. A profile that
+# fails gets a summary with its error and no yearly rows, the others are planned
+def plan_profiles(profiles, include_yearly=False):
+    summaries = []
+    yearly_columns = {}
+    for profile in profiles:
+        try:
+            summary, yearly = plan_profile(profile, include_yearly=include_yearly)
+        except Exception as error:
+            summaries.append(failed_summary(profile, error))
+            continue
+        summaries.append(summary)
+        if yearly is not None:
+            # With no years in retirement the investment amounts run a year past the ages
+            n_rows = len(yearly["age"])
+            yearly = dict(profile_id=[summary["profile_id"]] * n_rows, **yearly)
+            for column, values in yearly.items():
+                yearly_columns.setdefault(column, []).append(values[:n_rows])
+
+    yearly_columns = {
+        column: np.concatenate(values) for column, values in yearly_columns.items()
+    }
+    return summaries, yearly_columns or None
@@ -0,0 +1,53 @@
+import numpy as np
+
+from .utils import draw_standard_normal_paths
+
+### Jointly simulated fund returns and inflation ###
+# A correlation matrix is over these variables, in this order. A 4 x 4 matrix
+# leaves out inflation, which is then drawn independently of the funds
+SCENARIO_VARIABLES = ("debt", "hybrid", "large_cap", "mid_cap", "inflation")
+
+
+# Lower triangular L with L @ L.T == correlation, after checking that it is one
+def correlation_cholesky(correlation, n_variables=len(SCENARIO_VARIABLES)):
+    correlation = np.asarray(correlation, dtype=float)
+    if correlation.shape not in ((n_variables - 1,) * 2, (n_variables,) * 2):
+        raise ValueError(
+            f"The correlation matrix must be {n_variables - 1} x {n_variables - 1} "
+            f"or {n_variables} x {n_variables}, got {correlation.shape}"
+        )
+    if not np.allclose(correlation, correlation.T) or not np.allclose(
+        np.diag(correlation), 1
+    ):
+        raise ValueError(
+            "The correlation matrix must be symmetric with 1s on its diagonal"
+        )
+    if np.any(np.abs(correlation) > 1):
+        raise ValueError("Correlations must be between -1 and 1")
+
+    # Inflation left out of the matrix is uncorrelated with the funds
+    full_correlation = np.eye(n_variables)
+    full_correlation[: len(correlation), : len(correlation)] = correlation
+    try:
+        return np.linalg.cholesky(full_correlation)
+    except np.linalg.LinAlgError:
+        raise ValueError("The correlation matrix must be positive definite") from None
+
+
+### Correlated standard normals for every simulation, year and variable ###
+# (n_paths x n_years x variables), drawn as independent normals from the seeded
+# streams (so path k is the same however a run is chunked) and mixed with the
+# Cholesky factor in one matrix product over all the paths
+def draw_correlated_normals(seed, first_path, n_paths, n_years, correlation=None):
+    cholesky = (
+        np.eye(len(SCENARIO_VARIABLES))
+        if correlation is None
+        else correlation_cholesky(correlation)
+    )
+    normals = draw_standard_normal_paths(
+        seed=seed,
+        first_path=first_path,
+        n_paths=n_paths,
+        shape=(n_years, len(cholesky)),
+    )
+    return normals @ cholesky.T
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Percentiles of the balances shown as bands in the app and returned by the service
+FAN_CHART_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+### Running statistics over chunks of simulated balance paths ###
+# Chunks of (simulations x years) balances are folded in one at a time, so memory
+# does not grow with the number of simulations. Per year it keeps the number of
+# paths still lasting (with money left, or within the years_lasted given by the
+# simulator), the sum of balances and a log-binned histogram of the balances,
+# from which percentiles are read to within relative_accuracy (the same idea as
+# DDSketch). Histograms add up, so stats from separate chunks, shards or
+# processes merge exactly. The paths themselves are only kept when
+# keep_paths is set, either all of them (True) or only the first keep_paths.
+class SimulationStats:
+    def __init__(
+        self,
+        n_years,
+        keep_paths=False,
+        relative_accuracy=0.01,
+        min_balance=1.0,
+        max_balance=1e18,
+    ):
+        self.n_years = n_years
+        self.keep_paths = keep_paths
+        self.relative_accuracy = relative_accuracy
+        self.min_balance = min_balance
+        self.max_balance = max_balance
+
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        # Bin 0 holds the depleted (zero) balances, bin 1 everything up to min_balance
+        self.bin_offset = int(np.ceil(np.log(min_balance) / self.log_gamma)) - 1
+        self.n_bins = (
+            int(np.ceil(np.log(max_balance) / self.log_gamma)) - self.bin_offset + 1
+        )
+
+        self.num_simulations = 0
+        self.success_counts = np.zeros(n_years, dtype=np.int64)
+        self.balance_sums = np.zeros(n_years)
+        self.histogram = np.zeros((n_years, self.n_bins), dtype=np.int64)
+        self.paths = []
+
+    def balance_bins(self, balances):
+        bins = np.zeros(balances.shape, dtype=np.int64)
+        positive = balances > 0
+        bins[positive] = np.clip(
+            np.ceil(np.log(balances[positive]) / self.log_gamma) - self.bin_offset,
+            1,
+            self.n_bins - 1,
+        )
+        return bins
+
+    def update(self, balances, years_lasted=None):
+        balances = np.asarray(balances, dtype=float)
+        self.num_simulations += balances.shape[0]
+        lasted = balances > 0
+        if years_lasted is not None:
+            lasted = np.asarray(years_lasted)[:, None] > np.arange(self.n_years)
+        self.success_counts += np.count_nonzero(lasted, axis=0)
+        self.balance_sums += balances.sum(axis=0)
+
+        # Offsetting every year's bins lets one bincount fill the whole histogram
+        bins = self.balance_bins(balances) + np.arange(self.n_years) * self.n_bins
+        self.histogram += np.bincount(
+            bins.ravel(), minlength=self.n_years * self.n_bins
+        ).reshape(self.n_years, self.n_bins)
+
+        self.keep_balances(balances)
+        return self
+
+    def keep_balances(self, balances):
+        n_kept = sum(len(paths) for paths in self.paths)
+        if self.keep_paths is True:
+            self.paths.append(balances)
+        elif n_kept < self.keep_paths:
+            self.paths.append(balances[: self.keep_paths - n_kept])
+
+    def merge(self, other):
+        self.num_simulations += other.num_simulations
+        self.success_counts += other.success_counts
+        self.balance_sums += other.balance_sums
+        self.histogram += other.histogram
+        for balances in other.paths:
+            self.keep_balances(balances)
+        return self
+
+    # The kept paths, in simulation order
+    @property
+    def balances(self):
+        if not self.paths:
+            return None
+        if len(self.paths) != 1:
+            self.paths = [np.concatenate(self.paths)]
+        return self.paths[0]
+
+    @property
+    def success_rate(self):
+        return self.success_counts[-1] / self.num_simulations * 100
+
+    @property
+    def mean_balances(self):
+        return self.balance_sums / self.num_simulations
+
+    # Percentiles (0-100) of the balances in every year, shape (len(q), n_years).
+    # Exact when all the paths were kept, otherwise read off the histogram
+    def percentiles(self, q):
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        balances = self.balances
+        if balances is not None and len(balances) == self.num_simulations:
+            return np.percentile(balances, q, axis=0)
+
+        ranks = q[:, None, None] / 100 * (self.num_simulations - 1)
+        cumulative_counts = np.cumsum(self.histogram, axis=1)
+        bins = np.argmax(cumulative_counts[None, :, :] > ranks, axis=2)
+
+        # The middle of each bin, in the relative sense
+        values = (
+            2 * self.gamma ** (bins + self.bin_offset).astype(float) / (self.gamma + 1)
+        )
+        return np.where(bins == 0, 0.0, values)
+
+    def median(self):
+        return self.percentiles(50)[0]
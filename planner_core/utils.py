@@ -0,0 +1,387 @@
+import numpy as np
+
+from . import kernels
+from .withdrawals import calc_policy_drawdown_balances
+
+
+### Helper function to calculate returns using CI ###
+def calc_compound_returns(p, r, t, n=1):
+    r = r / 100 if r > 1.0 else r
+    value = p * ((1 + r / n) ** (n * t))
+    return round(value)
+
+
+### Same as above, evaluated for a whole array of time periods at once ###
+def calc_compound_returns_array(p, r, t, n=1):
+    r = r / 100 if r > 1.0 else r
+    value = p * compound_growth_factors(1 + r / n, n * np.asarray(t))
+    return np.round(value)
+
+
+# base ** periods with Python's pow, one period at a time. NumPy's power can be an
+# ulp away from it, which at a half rupee rounds to a different rupee than the
+# scalar calculation
+def compound_growth_factors(base, periods):
+    periods = np.asarray(periods)
+    base = float(base)
+    return np.array(
+        [base**period for period in periods.ravel().tolist()], dtype=float
+    ).reshape(periods.shape)
+
+
+##############################################
+
+
+### Helper function to format Indian system ###
+def format_to_inr(number):
+    number = float(number)
+    number = round(number, 2)
+    is_negative = number < 0
+    number = abs(number)
+    s, *d = str(number).partition(".")
+    r = ",".join([s[x - 2 : x] for x in range(-3, -len(s), -2)][::-1] + [s[-3:]])
+    value = "".join([r] + d)
+    if is_negative:
+        value = "-" + value
+    return "₹ " + value
+
+
+### Same as above for a whole array of numbers at once ###
+# Every string is put together as a row of character codes with integer arithmetic,
+# so there is no Python call per number. Rounding to the paisa is done by NumPy, so
+# an exact half paisa may round the other way from format_to_inr. With compact=True
+# amounts are shortened to crores, lakhs or thousands, e.g. "₹ 1.2 Cr", with the
+# unit chosen after rounding to decimals, so 99,999 is "₹ 1 L" and not "₹ 100 K"
+COMPACT_INR_UNITS = ((1e3, " K"), (1e5, " L"), (1e7, " Cr"))
+# Above this str(float) switches to exponents, such amounts are formatted as such
+MAX_GROUPED_INR = 1e16
+
+
+def format_to_inr_array(numbers, compact=False, decimals=1):
+    numbers = np.asarray(numbers, dtype=float)
+    grouped = np.isfinite(numbers) & (np.abs(numbers) < MAX_GROUPED_INR)
+    values = np.abs(np.where(grouped, numbers, 0.0))
+
+    suffixes = np.zeros(values.shape, dtype=np.int64)
+    if compact:
+        suffixes = compact_inr_units(values, decimals)
+        values = values / compact_inr_scales(suffixes)
+    else:
+        decimals = 2
+
+    total = np.round(values * 10**decimals).astype(np.int64)
+    whole, fraction = np.divmod(total, 10**decimals)
+    negative = (numbers < 0) & (total > 0)
+
+    # Trailing zeros of the decimals are dropped, but like str(float) the full
+    # format keeps at least one ("1,000.0")
+    shown_decimals = np.zeros(values.shape, dtype=np.int64)
+    for n_decimals in range(1, decimals + 1):
+        shown_decimals[fraction % 10 ** (decimals - n_decimals + 1) != 0] = n_decimals
+    if not compact:
+        shown_decimals = np.maximum(shown_decimals, 1)
+
+    columns = [
+        np.full(values.shape, ord("₹")),
+        np.full(values.shape, ord(" ")),
+        np.where(negative, ord("-"), 0),
+        *inr_digit_columns(whole),
+        np.where(shown_decimals > 0, ord("."), 0),
+    ]
+    for position in range(decimals):
+        digit = fraction // 10 ** (decimals - 1 - position) % 10
+        columns.append(np.where(position < shown_decimals, ord("0") + digit, 0))
+    suffix_codes = np.zeros((len(COMPACT_INR_UNITS) + 1, 3), dtype=np.int64)
+    for i, (_, unit) in enumerate(COMPACT_INR_UNITS, start=1):
+        suffix_codes[i, : len(unit)] = [ord(c) for c in unit]
+    columns.extend(np.moveaxis(suffix_codes[suffixes], -1, 0))
+
+    codes = np.stack(columns, axis=-1).astype(np.uint32)
+    # Unused places are 0, moving them to the end leaves NumPy's own padding
+    codes = np.take_along_axis(
+        codes, np.argsort(codes == 0, axis=-1, kind="stable"), -1
+    )
+    formatted = np.ascontiguousarray(codes).view(f"U{codes.shape[-1]}")[..., 0]
+
+    if not grouped.all():
+        formatted = formatted.astype(f"U{max(codes.shape[-1], 32)}")
+        formatted[~grouped] = np.char.add("₹ ", numbers[~grouped].astype(str))
+    return formatted
+
+
+# Index of the unit in COMPACT_INR_UNITS, plus one (0 for none), of every amount
+# (not negative) shown with decimals, taking the next unit up when the amount
+# rounds up to it
+def compact_inr_units(values, decimals):
+    units = np.zeros(np.shape(values), dtype=np.int64)
+    previous_unit_value = 1.0
+    for i, (unit_value, _) in enumerate(COMPACT_INR_UNITS, start=1):
+        rounded = np.round(values / previous_unit_value, decimals)
+        units[rounded >= unit_value / previous_unit_value] = i
+        previous_unit_value = unit_value
+    return units
+
+
+def compact_inr_scales(units):
+    return np.array([1.0] + [unit_value for unit_value, _ in COMPACT_INR_UNITS])[units]
+
+
+# Character codes of the whole numbers, one array per place from the left, with
+# the commas before the last three digits and then after every two
+def inr_digit_columns(whole):
+    n_digits = np.ones(whole.shape, dtype=np.int64)
+    for power in range(1, 19):
+        n_digits += whole >= 10**power
+    max_digits = int(n_digits.max(initial=1))
+
+    columns = []
+    digit = 0
+    for place in range(max_digits + max(max_digits - 2, 0) // 2):
+        if place >= 3 and place % 3 == 0:
+            # A comma when there is a digit to its left
+            columns.append(np.where(n_digits > digit, ord(","), 0))
+            continue
+        columns.append(
+            np.where(n_digits > digit, ord("0") + whole // 10**digit % 10, 0)
+        )
+        digit += 1
+    return columns[::-1]
+
+
+################################################
+
+
+### Reproducible random numbers for simulations ###
+# Simulation paths are drawn in blocks of PATHS_PER_STREAM, each block from its
+# own stream spawned off one root SeedSequence. A path always comes from the same
+# row of the same stream, so path k is identical however a run is chunked
+PATHS_PER_STREAM = 256
+
+
+def as_seed_sequence(seed=None):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        # Takes fresh entropy from the generator, so its state moves on
+        return np.random.SeedSequence(seed.integers(2**63, size=4))
+    return np.random.SeedSequence(seed)
+
+
+# distribution is the name of the Generator method drawing the numbers
+def draw_stream_paths(seed, first_path, n_paths, shape, distribution):
+    seed_seq = as_seed_sequence(seed)
+    shape = tuple(shape)
+    last_path = first_path + n_paths
+
+    draws = np.empty((n_paths,) + shape)
+    for stream_index in range(
+        first_path // PATHS_PER_STREAM, -(-last_path // PATHS_PER_STREAM)
+    ):
+        stream_first_path = stream_index * PATHS_PER_STREAM
+        start = max(first_path, stream_first_path)
+        stop = min(last_path, stream_first_path + PATHS_PER_STREAM)
+
+        # Same stream as seed_seq.spawn() would hand out as its child stream_index
+        stream = np.random.default_rng(
+            np.random.SeedSequence(
+                entropy=seed_seq.entropy,
+                spawn_key=seed_seq.spawn_key + (stream_index,),
+                pool_size=seed_seq.pool_size,
+            )
+        )
+        stream_draws = getattr(stream, distribution)(
+            (stop - stream_first_path,) + shape
+        )
+        draws[start - first_path : stop - first_path] = stream_draws[
+            start - stream_first_path :
+        ]
+
+    return draws
+
+
+def draw_standard_normal_paths(seed, first_path, n_paths, shape):
+    return draw_stream_paths(seed, first_path, n_paths, shape, "standard_normal")
+
+
+# Uniform on [0, 1)
+def draw_uniform_paths(seed, first_path, n_paths, shape):
+    return draw_stream_paths(seed, first_path, n_paths, shape, "random")
+
+
+################################################
+
+
+### Cash flows paid monthly (steps_per_year times a year) ###
+# The growth of a year is earned evenly over its steps, so that the yearly rows
+# stay exact without stepping through the months. Paying out a yearly amount in
+# equal parts after the growth of each step leaves as much as paying out
+# in_year_payment_factor times the amount at the end of the year. Paying in a yearly
+# amount in equal parts at the start of each step ends the year as much as paying
+# in_year_payment_factor(1 / growth) times the amount at its start. Both are 1 for
+# one step a year
+def in_year_payment_factor(yearly_growth, steps_per_year=1):
+    # A year that loses everything (growth <= 0) has no growth in any of its steps
+    step_growth = np.maximum(yearly_growth, 0.0) ** (1 / steps_per_year)
+    factor = np.zeros_like(step_growth)
+    for _ in range(steps_per_year):
+        factor = factor * step_growth + 1
+    return factor / steps_per_year
+
+
+def calc_balances_in_retirement(initial_balance, expenses, time_period, rate_of_return):
+    balances_in_retirement = [initial_balance]
+    for i in range(time_period):
+        # balance_in_retirement = balance_in_retirement-full_yearly_expenses[i+years_to_retire]
+        if i > 0:
+            balance_in_retirement = (
+                balance_in_retirement * (1 + rate_of_return / 100)
+            ) - expenses[i]
+        balances_in_retirement.append(round(balance_in_retirement))
+    return balances_in_retirement
+
+
+### Year by year drawdown of many corpora at once ###
+# yearly_growth is (paths x years) of (1 + return), balances that run out are shown as 0.
+# initial_corpora broadcasts against the paths, so a column of corpora (corpora x 1)
+# is drawn down on every path and gives (corpora x paths x years) balances.
+# yearly_expenses are per year, or (paths x years) when they differ between paths
+def calc_drawdown_balances(
+    initial_corpora, yearly_growth, yearly_expenses, ignore_first_year_expense=True
+):
+    n_paths, n_years_in_retire = yearly_growth.shape
+    initial_corpora = np.asarray(initial_corpora, dtype=float)
+    paths_shape = np.broadcast_shapes(initial_corpora.shape, (n_paths,))
+    initial_corpora = np.broadcast_to(initial_corpora, paths_shape)
+
+    yearly_expenses = np.asarray(yearly_expenses, dtype=float)
+
+    single_path = initial_corpora.size == 1
+    if not single_path and kernels.use_numba:
+        initial_corpora = np.ascontiguousarray(initial_corpora.reshape(-1, n_paths))
+        yearly_balances = np.empty(initial_corpora.shape + (n_years_in_retire,))
+        kernels.compiled_kernel("drawdown_loops")(
+            initial_corpora,
+            np.ascontiguousarray(yearly_growth, dtype=float),
+            np.ascontiguousarray(
+                np.broadcast_to(yearly_expenses, (n_paths, n_years_in_retire))
+            ),
+            ignore_first_year_expense,
+            yearly_balances,
+        )
+        return yearly_balances.reshape(paths_shape + (n_years_in_retire,))
+
+    if single_path:
+        # A single path is quicker to step through as plain floats
+        initial_corpora = initial_corpora.item()
+        yearly_growth = yearly_growth[0].tolist()
+        yearly_expenses = yearly_expenses.reshape(-1).tolist()
+    else:
+        yearly_growth = yearly_growth.T
+        yearly_expenses = (
+            yearly_expenses.T if yearly_expenses.ndim > 1 else yearly_expenses.tolist()
+        )
+
+    # Filled year-wise (years x paths) so that every year writes one contiguous row
+    yearly_balances = np.empty((n_years_in_retire,) + paths_shape)
+    balances_in_retirement = initial_corpora
+    for i, (growth, expense) in enumerate(zip(yearly_growth, yearly_expenses)):
+        balances_in_retirement = balances_in_retirement * growth - expense
+        if i == 0 and ignore_first_year_expense:
+            balances_in_retirement = initial_corpora
+
+        yearly_balances[i] = balances_in_retirement
+
+    yearly_balances[yearly_balances <= 0] = 0
+    return np.moveaxis(yearly_balances, 0, -1)
+
+
+### Drawdown of many corpora over many return paths at once ###
+# returns are a single rate, a rate per year or a (paths x years) matrix. Every one
+# of the initial_corpora is drawn down on every path, giving (corpora x paths x
+# years) balances, or (corpora x years) when there is a single path. The expenses
+# are per year, or withdrawals shaped as the balances with a withdrawal_policy
+def calc_retirement_balances_n_expenses_batch(
+    initial_corpora,
+    inital_expense,
+    inflation,
+    returns,
+    n_years_in_retire,
+    ignore_first_year_expense=True,
+    steps_per_year=1,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+):
+    # A column of corpora, broadcast against the paths
+    initial_corpora = np.asarray(initial_corpora, dtype=float).reshape(-1, 1)
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+
+    returns = np.asarray(returns, dtype=float)
+    single_path = returns.ndim < 2
+    returns = np.atleast_2d(returns)
+    returns = np.where(returns > 1.0, returns / 100, returns)
+    n_paths = returns.shape[0]
+    yearly_growth = np.broadcast_to(1 + returns, (n_paths, n_years_in_retire))
+
+    yearly_expenses = calc_compound_returns_array(
+        p=inital_expense, r=inflation, t=np.arange(n_years_in_retire)
+    )
+    # The expenses are still reported per year when they are paid monthly
+    payment_factor = None
+    if steps_per_year > 1:
+        payment_factor = in_year_payment_factor(yearly_growth, steps_per_year)
+    if withdrawal_policy != "constant_real":
+        # The withdrawals differ between the paths, and are returned in place of
+        # the planned expenses
+        yearly_balances, yearly_withdrawals = calc_policy_drawdown_balances(
+            initial_corpora=initial_corpora,
+            yearly_growth=yearly_growth,
+            yearly_expenses=yearly_expenses,
+            withdrawal_policy=withdrawal_policy,
+            withdrawal_params=withdrawal_params,
+            ignore_first_year_expense=ignore_first_year_expense,
+            payment_factor=payment_factor,
+        )
+        if single_path:
+            return yearly_balances[:, 0], yearly_withdrawals[:, 0]
+        return yearly_balances, yearly_withdrawals
+    paid_expenses = yearly_expenses
+    if payment_factor is not None:
+        paid_expenses = yearly_expenses * payment_factor
+    yearly_balances = calc_drawdown_balances(
+        initial_corpora=initial_corpora,
+        yearly_growth=yearly_growth,
+        yearly_expenses=paid_expenses,
+        ignore_first_year_expense=ignore_first_year_expense,
+    )
+    if single_path:
+        yearly_balances = yearly_balances[:, 0]
+
+    return yearly_balances, yearly_expenses
+
+
+def calc_retirement_balances_n_expenses(
+    initial_corpus,
+    inital_expense,
+    inflation,
+    returns,
+    n_years_in_retire,
+    ignore_first_year_expense=True,
+    steps_per_year=1,
+    withdrawal_policy="constant_real",
+    withdrawal_params=None,
+):
+    yearly_balances, yearly_expenses = calc_retirement_balances_n_expenses_batch(
+        initial_corpora=initial_corpus,
+        inital_expense=inital_expense,
+        inflation=inflation,
+        returns=returns,
+        n_years_in_retire=n_years_in_retire,
+        ignore_first_year_expense=ignore_first_year_expense,
+        steps_per_year=steps_per_year,
+        withdrawal_policy=withdrawal_policy,
+        withdrawal_params=withdrawal_params,
+    )
+    if yearly_expenses.ndim > 1:
+        yearly_expenses = yearly_expenses[0]
+
+    return yearly_balances[0].tolist(), yearly_expenses.tolist()
@@ -0,0 +1,234 @@
+import numpy as np
+
+### How much is withdrawn every year ###
+# The planned expenses grow with inflation from the first year's. A policy turns
+# them and the state of every path into the year's withdrawals, over all the paths
+# at once. Each policy takes the state as keyword arrays (corpora x paths):
+# balance (after the year's growth), start_balance (at the start of the year),
+# planned_expense, previous_withdrawal, inflation (the planned expense over the
+# year before's), initial_rate (first year's expense over the corpus), rate (the
+# withdrawal rate used) and the parameters of WITHDRAWAL_DEFAULTS, in %
+
+
+# The planned expenses themselves, as the simulations have always withdrawn
+def constant_real_withdrawals(planned_expense, **state):
+    return planned_expense
+
+
+# A fixed share of the balance, so the withdrawals rise and fall with the markets
+def percent_of_balance_withdrawals(balance, rate, **state):
+    return rate * np.maximum(balance, 0)
+
+
+# Guyton-Klinger guardrails: last year's withdrawal grows with inflation, except
+# after a year the portfolio lost value. When that withdrawal is more than
+# guardrail % above the initial rate of the balance it is cut by
+# guardrail_adjustment %, when it is more than guardrail % below it is raised by it
+def guardrails_withdrawals(
+    balance,
+    start_balance,
+    previous_withdrawal,
+    inflation,
+    initial_rate,
+    guardrail,
+    guardrail_adjustment,
+    **state,
+):
+    withdrawal = np.where(
+        balance < start_balance, previous_withdrawal, previous_withdrawal * inflation
+    )
+    current_rate = np.divide(
+        withdrawal, balance, out=np.full(withdrawal.shape, np.inf), where=balance > 0
+    )
+    adjustment = np.where(
+        current_rate > initial_rate * (1 + guardrail / 100),
+        1 - guardrail_adjustment / 100,
+        np.where(
+            current_rate < initial_rate * (1 - guardrail / 100),
+            1 + guardrail_adjustment / 100,
+            1.0,
+        ),
+    )
+    return withdrawal * adjustment
+
+
+# A share of the balance kept between withdrawal_floor % and withdrawal_ceiling %
+# of the planned expense
+def floor_ceiling_withdrawals(
+    balance, planned_expense, rate, withdrawal_floor, withdrawal_ceiling, **state
+):
+    return np.clip(
+        rate * np.maximum(balance, 0),
+        withdrawal_floor / 100 * planned_expense,
+        withdrawal_ceiling / 100 * planned_expense,
+    )
+
+
+WITHDRAWAL_POLICIES = dict(
+    constant_real=constant_real_withdrawals,
+    percent_of_balance=percent_of_balance_withdrawals,
+    guardrails=guardrails_withdrawals,
+    floor_ceiling=floor_ceiling_withdrawals,
+)
+# withdrawal_rate of None withdraws at the initial rate
+WITHDRAWAL_DEFAULTS = dict(
+    withdrawal_rate=None,
+    guardrail=20.0,
+    guardrail_adjustment=10.0,
+    withdrawal_floor=90.0,
+    withdrawal_ceiling=125.0,
+)
+
+
+################################################
+
+
+### A policy stepped through the years of a drawdown ###
+# Keeps the previous withdrawals of every path, the years are stepped through by
+# the drawdown loops, which call withdraw once a year
+class PolicyWithdrawals:
+    def __init__(
+        self, withdrawal_policy, initial_corpora, first_expense, withdrawal_params=None
+    ):
+        if withdrawal_policy not in WITHDRAWAL_POLICIES:
+            raise ValueError(
+                f"Unknown withdrawal_policy {withdrawal_policy!r}, expected one of "
+                f"{', '.join(WITHDRAWAL_POLICIES)}"
+            )
+        withdrawal_params = withdrawal_params or {}
+        unknown = set(withdrawal_params) - set(WITHDRAWAL_DEFAULTS)
+        if unknown:
+            raise ValueError(
+                f"Unknown withdrawal parameters: {', '.join(sorted(unknown))}"
+            )
+        self.policy = WITHDRAWAL_POLICIES[withdrawal_policy]
+        self.params = dict(WITHDRAWAL_DEFAULTS, **withdrawal_params)
+        if self.params["withdrawal_floor"] > self.params["withdrawal_ceiling"]:
+            raise ValueError("The withdrawal floor must not be above the ceiling")
+
+        initial_corpora = np.asarray(initial_corpora, dtype=float)
+        self.previous_withdrawal = np.broadcast_to(
+            first_expense, initial_corpora.shape
+        ).astype(float)
+        self.initial_rate = np.divide(
+            self.previous_withdrawal,
+            initial_corpora,
+            out=np.zeros(initial_corpora.shape),
+            where=initial_corpora > 0,
+        )
+        withdrawal_rate = self.params.pop("withdrawal_rate")
+        self.rate = (
+            self.initial_rate if withdrawal_rate is None else withdrawal_rate / 100
+        )
+
+    # This year's withdrawals, from the balances after its growth
+    def withdraw(self, balance, start_balance, planned_expense, inflation):
+        withdrawal = self.policy(
+            balance=balance,
+            start_balance=start_balance,
+            planned_expense=planned_expense,
+            previous_withdrawal=self.previous_withdrawal,
+            inflation=inflation,
+            initial_rate=self.initial_rate,
+            rate=self.rate,
+            **self.params,
+        )
+        self.previous_withdrawal = np.broadcast_to(withdrawal, balance.shape)
+        return withdrawal
+
+
+# The planned expense of every year over the year before's (years x paths), 1 for
+# the first year, on (years x paths) planned expenses
+def expense_inflation(yearly_expenses):
+    inflation = np.ones(yearly_expenses.shape)
+    np.divide(
+        yearly_expenses[1:],
+        yearly_expenses[:-1],
+        out=inflation[1:],
+        where=yearly_expenses[:-1] > 0,
+    )
+    return inflation
+
+
+################################################
+
+
+### Year by year drawdown with a withdrawal policy ###
+# As calc_drawdown_balances (utils.py), with the planned yearly_expenses (per year,
+# or paths x years) withdrawn as withdrawal_policy has it. payment_factor (paths x
+# years) scales what is paid when it is paid monthly, see in_year_payment_factor.
+# Returns the balances and the withdrawals, both (corpora x paths x years). The
+# withdrawal of a first year without expenses is the planned one, not paid
+def calc_policy_drawdown_balances(
+    initial_corpora,
+    yearly_growth,
+    yearly_expenses,
+    withdrawal_policy,
+    withdrawal_params=None,
+    ignore_first_year_expense=True,
+    payment_factor=None,
+):
+    n_paths, n_years_in_retire = yearly_growth.shape
+    initial_corpora = np.asarray(initial_corpora, dtype=float)
+    paths_shape = np.broadcast_shapes(initial_corpora.shape, (n_paths,))
+    initial_corpora = np.broadcast_to(initial_corpora, paths_shape)
+
+    # Year-wise (years x paths)
+    yearly_growth = yearly_growth.T
+    yearly_expenses = np.broadcast_to(
+        np.asarray(yearly_expenses, dtype=float), (n_paths, n_years_in_retire)
+    ).T
+    inflation = expense_inflation(yearly_expenses)
+    if payment_factor is not None:
+        payment_factor = np.broadcast_to(payment_factor, (n_paths, n_years_in_retire)).T
+
+    withdrawals = PolicyWithdrawals(
+        withdrawal_policy, initial_corpora, yearly_expenses[0], withdrawal_params
+    )
+    yearly_balances = np.empty((n_years_in_retire,) + paths_shape)
+    yearly_withdrawals = np.empty((n_years_in_retire,) + paths_shape)
+    balances_in_retirement = initial_corpora
+    for i in range(n_years_in_retire):
+        if i == 0 and ignore_first_year_expense:
+            yearly_balances[i] = initial_corpora
+            yearly_withdrawals[i] = yearly_expenses[i]
+            continue
+        grown = balances_in_retirement * yearly_growth[i]
+        withdrawal = withdrawals.withdraw(
+            grown, balances_in_retirement, yearly_expenses[i], inflation[i]
+        )
+        paid = withdrawal if payment_factor is None else withdrawal * payment_factor[i]
+        balances_in_retirement = grown - paid
+
+        yearly_balances[i] = balances_in_retirement
+        yearly_withdrawals[i] = withdrawal
+
+    yearly_balances[yearly_balances <= 0] = 0
+    return np.moveaxis(yearly_balances, 0, -1), np.moveaxis(yearly_withdrawals, 0, -1)
+
+
+################################################
+
+
+### Years every path lasted ###
+# (corpora x paths) from the balances and withdrawals of the drawdowns: the years
+# until the balance ran out or, with a policy other than constant_real, until the
+# withdrawals first fell short of what the policy is meant to pay, the planned
+# yearly_expenses (withdrawal_floor % of them with floor_ceiling). A path lasting
+# every year is a success. Withdrawals within SHORTFALL_TOLERANCE of it are not
+# short, they only differ by the rounding of the inflation steps
+SHORTFALL_TOLERANCE = 1e-9
+
+
+def calc_years_lasted(
+    balances, withdrawals, yearly_expenses, withdrawal_policy, withdrawal_params=None
+):
+    if withdrawal_policy == "constant_real":
+        return np.count_nonzero(balances > 0, axis=-1)
+
+    params = dict(WITHDRAWAL_DEFAULTS, **(withdrawal_params or {}))
+    required = np.asarray(yearly_expenses, dtype=float)
+    if withdrawal_policy == "floor_ceiling":
+        required = params["withdrawal_floor"] / 100 * required
+    funded = (balances > 0) & (withdrawals >= required * (1 - SHORTFALL_TOLERANCE))
+    return np.count_nonzero(np.logical_and.accumulate(funded, axis=-1), axis=-1)
@@ -0,0 +1,207 @@
+import argparse
+import json
+import math
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from planner_core.calculations import (
+    calc_specific_values_on_input,
+    calculate_yearly_values,
+)
+from planner_core.parallel import bucket_strategy_simulator_parallel, default_workers
+from planner_core.profiles import (
+    bucket_simulator_kwargs,
+    profile_inputs,
+    specific_values,
+    yearly_values,
+)
+from planner_core.simulation_stats import FAN_CHART_PERCENTILES
+from planner_core.utils import calc_retirement_balances_n_expenses_batch
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+CORPUS_NAMES = ("assumed_corpus", "3_pct_rule", "4_pct_rule")
+
+
+# NaN and infinite numbers are not JSON, they are sent as null
+def to_json_value(value):
+    if isinstance(value, dict):
+        return {k: to_json_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return to_json_value(value.tolist())
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+### Endpoints, each taking one profile ###
+# The calculations go through the memoized functions, so every request thread
+# shares the same result cache
+def specific_values_endpoint(profile, max_workers):
+    return specific_values(profile_inputs(profile))
+
+
+def yearly_values_endpoint(profile, max_workers):
+    inputs = profile_inputs(profile)
+    return yearly_values(inputs, specific_values(inputs))
+
+
+# Success rate and percentiles of the bucket strategy for the entered corpus and
+# the 3% and 4% rule corpora, all on the same simulated returns
+def simulation_endpoint(profile, max_workers):
+    inputs = profile_inputs(profile)
+    values = specific_values(inputs)
+    simulator_kwargs = bucket_simulator_kwargs(inputs, values)
+
+    all_stats = bucket_strategy_simulator_parallel(
+        num_simulations=inputs["num_simulations"],
+        seed=inputs["simulation_seed"],
+        max_workers=max_workers,
+        **simulator_kwargs,
+    )
+    _, yearly_expenses = calc_retirement_balances_n_expenses_batch(
+        initial_corpora=0,
+        inital_expense=values["current_expenses_at_retirement"],
+        inflation=inputs["inflation_after_retirement"],
+        returns=inputs["net_rate_return_expected_after_retire"],
+        n_years_in_retire=inputs["estimated_years_retirement"],
+    )
+
+    result = dict(yearly_expenses=yearly_expenses)
+    for name, corpus, stats in zip(
+        CORPUS_NAMES, simulator_kwargs["initial_corpus"], all_stats
+    ):
+        result[name] = dict(
+            corpus=corpus,
+            success_rate=stats.success_rate if stats.n_years else None,
+            percentiles=dict(
+                zip(
+                    map(str, FAN_CHART_PERCENTILES),
+                    stats.percentiles(FAN_CHART_PERCENTILES),
+                )
+            ),
+        )
+    return result
+
+
+ENDPOINTS = {
+    "/specific_values": specific_values_endpoint,
+    "/yearly_values": yearly_values_endpoint,
+    "/simulation": simulation_endpoint,
+}
+
+
+################################################
+
+
+### JSON over HTTP ###
+# POST a profile to an endpoint to get its result, or {"profiles": [...]} to get
+# {"results": [...]} in the same order. GET /cache_info reports the shared caches
+class PlannerRequestHandler(BaseHTTPRequestHandler):
+    max_workers = 1
+
+    def send_json(self, status, body):
+        payload = json.dumps(to_json_value(body), allow_nan=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/cache_info":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self.send_json(
+            200,
+            {
+                func.__name__: func.cache_info()._asdict()
+                for func in [
+                    calc_specific_values_on_input,
+                    calculate_yearly_values,
+                    bucket_strategy_simulator_parallel,
+                ]
+            },
+        )
+
+    def do_POST(self):
+        endpoint = ENDPOINTS.get(self.path)
+        if endpoint is None:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self.send_json(413, {"error": "Request body is too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Expected a JSON object")
+            if "profiles" in body:
+                result = {
+                    "results": [
+                        endpoint(profile, self.max_workers)
+                        for profile in body["profiles"]
+                    ]
+                }
+            else:
+                result = endpoint(body, self.max_workers)
+        except (ValueError, TypeError, KeyError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            # Anything else is a bug, logged, and the client still gets an answer
+            traceback.print_exc()
+            self.send_json(500, {"error": f"Internal error: {error!r}"})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8000, max_workers=None, verbose=False):
+    handler = type(
+        "ConfiguredPlannerRequestHandler",
+        (PlannerRequestHandler,),
+        {"max_workers": max_workers or default_workers()},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the retirement planner calculations as JSON over HTTP"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers(),
+        help="Worker processes for large simulations (default: the number of CPUs)",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.workers, args.verbose)
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
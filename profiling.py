@@ -0,0 +1,86 @@
+import time
+from collections import deque
+
+import pandas as pd
+
+# Number of past reruns kept for the timings panel
+STAGE_TIMINGS_HISTORY = 10
+
+
+### Wall time per stage of a script run ###
+# Every lap books the time since the previous lap (or the start) to the named stage,
+# along with the cache hits and misses of the memoized functions in that time, so
+# the script only needs one line at the end of each stage. When disabled, lap
+# returns straight away and nothing is measured
+class StageTimer:
+    def __init__(self, enabled=False, cached_functions=()):
+        self.enabled = enabled
+        self.cached_functions = cached_functions
+        self.stages = {}
+        self.finished = False
+        if enabled:
+            self.last_time = time.perf_counter()
+            self.last_cache_counts = self.cache_counts()
+
+    def cache_counts(self):
+        infos = [func.cache_info() for func in self.cached_functions]
+        return sum(info.hits for info in infos), sum(info.misses for info in infos)
+
+    # Restarts the clock without booking the time to any stage, for fragments of
+    # the script that also rerun on their own. Once the script run is finished, a
+    # fragment rerunning on its own starts a run of its own
+    def start(self):
+        if not self.enabled:
+            return
+        if self.finished:
+            self.stages = {}
+        self.last_time = time.perf_counter()
+        self.last_cache_counts = self.cache_counts()
+
+    def lap(self, stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        hits, misses = self.cache_counts()
+        record = self.stages.setdefault(
+            stage, dict(wall_ms=0.0, calls=0, cache_hits=0, cache_misses=0)
+        )
+        record["wall_ms"] += (now - self.last_time) * 1000
+        record["calls"] += 1
+        record["cache_hits"] += hits - self.last_cache_counts[0]
+        record["cache_misses"] += misses - self.last_cache_counts[1]
+        # The cache counts are read after the clock, so reading them is not timed
+        self.last_time = time.perf_counter()
+        self.last_cache_counts = (hits, misses)
+
+    # Adds a copy of the stages to the history, so later laps leave it as it is
+    def finish(self, history):
+        if not self.enabled:
+            return
+        history.append({stage: dict(record) for stage, record in self.stages.items()})
+        self.finished = True
+
+    # At the end of a fragment, which is a run of its own when it reran on its own
+    def finish_fragment(self, history):
+        if self.finished:
+            self.finish(history)
+
+    def frame(self):
+        return pd.DataFrame.from_dict(self.stages, orient="index").rename_axis("stage")
+
+
+# The stage timings of the last runs, oldest first, kept in session state
+def timings_history(session_state, key="stage_timings_history"):
+    if key not in session_state:
+        session_state[key] = deque(maxlen=STAGE_TIMINGS_HISTORY)
+    return session_state[key]
+
+
+# Wall time of every stage (columns) in each of the runs (rows)
+def history_frame(history):
+    return pd.DataFrame(
+        [
+            {stage: record["wall_ms"] for stage, record in stages.items()}
+            for stages in history
+        ]
+    ).rename_axis("run")
@@ -11,8 +11,13 @@ import plotly.express as px
 import plotly.graph_objects as go
 import os
 
-from utils import *
-from calculations import *
+from planner_core.utils import *
+from planner_core.calculations import *
+from planner_core.parallel import bucket_strategy_simulator_parallel, default_workers
+from planner_core.historical import DEFAULT_BLOCK_LENGTH, open_historical_returns
+from planner_core.scenarios import correlation_cholesky
+from charts import set_inr_yaxis, simulation_fan_chart
+from profiling import StageTimer, history_frame, timings_history
 
 # st.set_page_config(layout="wide")
 
@@ -31,6 +36,17 @@ Copyright (c) 2024 Sharath M S
 """,
     },
 )
+# Opt-in timings of each stage of the script, set from the sidebar
+stage_timer = StageTimer(
+    enabled=st.session_state.get("show_stage_timings", False),
+    cached_functions=[
+        calc_specific_values_on_input,
+        calculate_yearly_values,
+        bucket_strategy_simulator_parallel,
+        solve_min_corpus_for_success_rate,
+    ],
+)
+
 # Heading
 
 st.title("Retirement Planner & Simulator")
@@ -55,11 +71,14 @@ st.info(
     "Disclaimer: This is not investment advice! Users are urged to consult registered financial advisors for actual planning. This tool is for DIY educational purposes only. Past performance may not be representative of future results",
     icon=None,
 )
+stage_timer.lap("Page header")
 
 
 # Basic Inputs
 st.header("Inputs")
 
+CASH_FLOW_STEPS_PER_YEAR = {"Yearly": 1, "Monthly": 12}
+
 col1, col2, col3 = st.columns(3)
 
 
@@ -177,7 +196,14 @@ with col3:
         value=10.0,
         step=0.1,
     )
+    # Cash flow related, the tables and charts stay year by year either way
+    cash_flow_frequency = st.selectbox(
+        label="Investments and expenses are paid",
+        options=list(CASH_FLOW_STEPS_PER_YEAR),
+    )
+    steps_per_year = CASH_FLOW_STEPS_PER_YEAR[cash_flow_frequency]
 
+stage_timer.lap("Inputs")
 
 # Calculations
 (
@@ -201,8 +227,10 @@ with col3:
     net_rate_return_expected,
     net_rate_return_expected_after_retire,
     annual_increase_investments,
+    steps_per_year=steps_per_year,
 )
 ##
+stage_timer.lap("calc_specific_values_on_input")
 
 
 ###########################################################################################3
@@ -241,6 +269,7 @@ with col3:
         label=f"Monthly investments to start now assuming yearly step-up of {annual_increase_investments}%",
         value=f"{format_to_inr((yearly_corpus/12))}",
     )
+stage_timer.lap("Result metrics")
 
 
 #####################################################################
@@ -262,31 +291,33 @@ df_dict = calculate_yearly_values(
     current_expenses_at_retirement=current_expenses_at_retirement,
     total_retirement_corpus=total_retirement_corpus,
     yearly_corpus=yearly_corpus,
+    steps_per_year=steps_per_year,
 )
+stage_timer.lap("calculate_yearly_values")
 
 st.header("Graphical and Tabular Results Depiction")
 col1, col2, col3 = st.columns([5.5, 0.5, 3])
 
-col3.dataframe(pd.DataFrame(df_dict).set_index("age"))  # , height=2500)
+# Amounts are shown in lakh/crore grouping, a column at a time
+col3.dataframe(
+    pd.DataFrame(df_dict).set_index("age").apply(format_to_inr_array)
+)  # , height=2500)
+stage_timer.lap("Yearly DataFrame")
 
 
-age = df_dict["age"]
-yearly_corpus_value = df_dict["retirement_corpus"]
-amt_invested_yearly_till_retire = df_dict["investment_amount"]
+age = np.append(df_dict["age"], df_dict["age"][-1] + 1)
+yearly_corpus_value = np.append(df_dict["retirement_corpus"], 0)
+amt_invested_yearly_till_retire = np.append(df_dict["investment_amount"], 0)
 full_yearly_expenses = df_dict["expenses"]
 
-age.append(age[-1] + 1)
-yearly_corpus_value.append(0)
-amt_invested_yearly_till_retire.append(0)
-
 
-x_axis = np.array(age)
+x_axis = age
 
 fig = go.Figure()
 fig.add_trace(
     go.Scatter(
         x=x_axis[: (retire_age - current_age)],
-        y=np.array(yearly_corpus_value[: (retire_age - current_age)]),
+        y=yearly_corpus_value[: (retire_age - current_age)],
         mode="lines+markers",
         name="Accumulated Corpus",
     )
@@ -296,7 +327,7 @@ fig.add_trace(
 fig.add_trace(
     go.Scatter(
         x=x_axis[(retire_age - current_age) :],
-        y=np.array(yearly_corpus_value[(retire_age - current_age) :]),
+        y=yearly_corpus_value[(retire_age - current_age) :],
         mode="lines+markers",
         line={"color": "teal"},
         name="Remaining Retirement Corpus",
@@ -306,7 +337,7 @@ fig.add_trace(
 fig.add_trace(
     go.Scatter(
         x=x_axis,
-        y=np.array(full_yearly_expenses),
+        y=full_yearly_expenses,
         mode="lines+markers",
         line={"color": "red"},
         name="Expenses",
@@ -315,7 +346,7 @@ fig.add_trace(
 fig.add_trace(
     go.Scatter(
         x=x_axis,
-        y=np.array(amt_invested_yearly_till_retire),
+        y=amt_invested_yearly_till_retire,
         mode="lines+markers",
         line={"color": "pink"},
         name="Amount Invested",
@@ -327,7 +358,9 @@ fig.update_layout(
     yaxis_title="Amount",
     legend_title="Legend Title",
 )
+set_inr_yaxis(fig)
 col1.plotly_chart(fig)
+stage_timer.lap("Portfolio figure")
 
 
 #####
@@ -336,668 +369,970 @@ col1.plotly_chart(fig)
 st.divider()
 st.header("Simulations")
 
-col1, col_1_2, col2, col3 = st.columns([1.5, 0.5, 1, 1])
+retirement_corpus_3_pct_rule = 100 / 3 * current_expenses_at_retirement
+retirement_corpus_4_pct_rule = 100 / 4 * current_expenses_at_retirement
+
+
+# Rows and columns of the correlation matrix, as in scenarios.SCENARIO_VARIABLES
+SCENARIO_LABELS = ["Debt", "Hybrid", "Large Cap", "Small-Mid Cap", "Inflation"]
+# How the buckets are run, see planner_core.buckets.BUCKET_MODES
+BUCKET_MODE_LABELS = {
+    "Rebalanced to the allocations every year": "rebalance",
+    "Spent in turn and refilled from the longer term buckets": "refill",
+}
+# How the yearly withdrawals follow the portfolio, see planner_core.withdrawals
+WITHDRAWAL_POLICY_LABELS = {
+    "The expenses, growing with inflation": "constant_real",
+    "A fixed % of the portfolio": "percent_of_balance",
+    "Guardrails (Guyton-Klinger)": "guardrails",
+    "A % of the portfolio between a floor and a ceiling": "floor_ceiling",
+}
+SCENARIO_SOURCES = [
+    "Normal returns around the assumptions above",
+    "Blocks of years from a historical returns file",
+]
+
+
+### Assumptions for the simulations, in the sidebar ###
+# A fragment, so editing them only reruns the sidebar. Each simulation section
+# picks up the values when its "Run simulation" button is pressed
+@st.experimental_fragment
+def simulation_assumptions():
+    st.header(
+        "Default Assumptions for overall Returns and Volatility (used for Simulations)"
+    )
 
-with col1:
-    assumed_retirement_corpus = st.number_input(
-        label="Enter the corpus amount that you can invest for retirement or think will fund your retirment",
+    st.number_input(
+        "% Return for Fixed Deposits/Instruments ",
         min_value=0.0,
-        max_value=1e10,
-        value=1e8,
-        step=1e5,
+        max_value=100.0,
+        value=8.0,
+        step=0.1,
+        key="fixed_deposit_returns",
     )
-with col2:
-    if total_retirement_corpus > assumed_retirement_corpus:
-        st.metric(
-            label=f"This is lesser than the required retirement corpus by",
-            value=f"{format_to_inr(total_retirement_corpus-assumed_retirement_corpus)}",
-        )
-    else:
-        st.write(
-            "The corpus is more than sufficcient for retirement based on your expenses and other factors provided"
-        )
 
-balances_assumed_corpus, yearly_expenses_in_retirement = (
-    calc_retirement_balances_n_expenses(
-        initial_corpus=assumed_retirement_corpus,
-        inital_expense=current_expenses_at_retirement,
-        inflation=inflation_after_retirement,
-        returns=net_rate_return_expected_after_retire,
-        n_years_in_retire=estimated_years_retirement,
+    st.number_input(
+        "% Return for Debt Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=9.0,
+        step=0.1,
+        key="debt_fund_returns",
+    )
+    st.number_input(
+        "% Volatility for Debt Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=3.0,
+        step=0.1,
+        key="debt_fund_volatility",
     )
-)
-
-lasting_years = sum(np.array(balances_assumed_corpus) > 0)
-
-with col3:
-    if total_retirement_corpus > assumed_retirement_corpus:
-
-        st.metric(
-            label=f"Based on the expenses, this corpus will last",
-            value=f"{lasting_years} years",
-        )
-    else:
-        st.write(
-            f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
-        )
-
-
-tab1, tab2 = st.tabs(
-    [
-        "Results based on the newly entered retirement corpus ",
-        "Simulation using the Bucket Strategy",
-    ]
-)
-
-with tab1:
-
-    col1, col2, col3 = st.columns([5.5, 0.5, 3])
-
-    with col1:
-        fig = go.Figure()
-
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(balances_assumed_corpus),
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Remaining Retirement corpus",
-            )
-        )
-
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
-            )
-        )
-
-        fig.update_layout(
-            title="Retirement Profile for the Entered Corpus Amount",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
-        )
-        st.plotly_chart(fig)
-
-    with col3:
-
-        st.dataframe(
-            pd.DataFrame(
-                dict(
-                    age=range(retire_age, retire_age + estimated_years_retirement),
-                    expenses=yearly_expenses_in_retirement,
-                    retirement_corpus=np.round(balances_assumed_corpus),
-                )
-            ).set_index("age")
-        )
 
+    st.number_input(
+        "% Return for Hybrid Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=10.0,
+        step=0.1,
+        key="hybrid_fund_returns",
+    )
+    st.number_input(
+        "% Volatility for Hybrid Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=10.0,
+        step=0.1,
+        key="hybrid_fund_volatility",
+    )
 
-with tab2:
+    st.number_input(
+        "% Return for Large Cap Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=12.0,
+        step=0.1,
+        key="large_cap_returns",
+    )
+    st.number_input(
+        "% Volatility for Large Cap Funds",
+        min_value=0.0,
+        max_value=100.0,
+        value=20.0,
+        step=0.1,
+        key="large_cap_volatility",
+    )
 
-    st.info(
-        "Note: Change the defaults for various types of funds in the sidebar if you wish to",
-        icon=None,
+    st.number_input(
+        "% Return for Small-Mid Cap Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=15.0,
+        step=0.1,
+        key="mid_cap_returns",
+    )
+    st.number_input(
+        "% Volatility for Small-Mid  Cap Funds",
+        min_value=0.0,
+        max_value=100.0,
+        value=30.0,
+        step=0.1,
+        key="mid_cap_volatility",
     )
 
-    with st.sidebar:
-        st.header(
-            "Default Assumptions for overall Returns and Volatility (used for Simulations)"
-        )
+    st.number_input(
+        "% Allocation for Fixed Deposits/Instruments ",
+        min_value=0.0,
+        max_value=100.0,
+        value=50.0,
+        step=0.1,
+        key="alloc_fixed",
+    )
+    st.number_input(
+        "% Allocation for Debt Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=10.0,
+        step=0.1,
+        key="alloc_debt",
+    )
+    st.number_input(
+        "% Allocation for Hybrid Instruments/Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=20.0,
+        step=0.1,
+        key="alloc_hybrid",
+    )
+    st.number_input(
+        "% Allocation for  Large Cap Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=10.0,
+        step=0.1,
+        key="alloc_large_cap",
+    )
+    st.number_input(
+        "% Allocation for  Small-Mid Cap Funds ",
+        min_value=0.0,
+        max_value=100.0,
+        value=10.0,
+        step=0.1,
+        key="alloc_mid_cap",
+    )
 
-        fixed_deposit_returns = st.number_input(
-            "% Return for Fixed Deposits/Instruments ",
-            min_value=0.0,
+    # Fixed deposits are the short term bucket, debt and hybrid funds the medium
+    # term one and large and small-mid cap funds the long term one
+    bucket_mode_label = st.selectbox(
+        "How the buckets are managed", BUCKET_MODE_LABELS, key="bucket_mode_label"
+    )
+    refill_threshold = 0.0
+    equity_glide = 0.0
+    if BUCKET_MODE_LABELS[bucket_mode_label] == "rebalance":
+        # A glide path, the allocations above are those at retirement
+        equity_glide = st.number_input(
+            "Yearly change in the % allocated to equity (-1 moves 1% of the corpus out of equity every year)",
+            min_value=-100.0,
             max_value=100.0,
-            value=8.0,
-            step=0.1,
+            value=0.0,
+            step=0.5,
+            key="equity_glide_input",
         )
-
-        debt_fund_returns = st.number_input(
-            "% Return for Debt Instruments/Funds ",
-            min_value=0.0,
+    else:
+        refill_threshold = st.number_input(
+            "% Return of the long term bucket at or above which it refills the others",
+            min_value=-100.0,
             max_value=100.0,
-            value=9.0,
-            step=0.1,
+            value=0.0,
+            step=0.5,
+            key="refill_threshold_input",
+        )
+    st.session_state["bucket_mode"] = BUCKET_MODE_LABELS[bucket_mode_label]
+    st.session_state["refill_threshold"] = refill_threshold
+    st.session_state["equity_glide"] = equity_glide
+
+    withdrawal_policy_label = st.selectbox(
+        "How much is withdrawn every year",
+        WITHDRAWAL_POLICY_LABELS,
+        key="withdrawal_policy_label",
+    )
+    withdrawal_policy = WITHDRAWAL_POLICY_LABELS[withdrawal_policy_label]
+    if withdrawal_policy != "constant_real":
+        st.caption(
+            "A simulation only counts as a success when the withdrawals never fall below the expenses (below the floor with a floor and a ceiling) and the corpus lasts"
         )
-        debt_fund_volatility = st.number_input(
-            "% Volatility for Debt Instruments/Funds ",
+    withdrawal_params = {}
+    if withdrawal_policy in ("percent_of_balance", "floor_ceiling"):
+        # 0 withdraws at the rate of the first year's expenses
+        withdrawal_rate = st.number_input(
+            "% of the portfolio withdrawn every year (0 for the first year's expenses over the corpus)",
             min_value=0.0,
             max_value=100.0,
-            value=3.0,
+            value=0.0,
             step=0.1,
+            key="withdrawal_rate_input",
         )
-
-        hybrid_fund_returns = st.number_input(
-            "% Return for Hybrid Instruments/Funds ",
+        withdrawal_params["withdrawal_rate"] = withdrawal_rate or None
+    if withdrawal_policy == "guardrails":
+        withdrawal_params["guardrail"] = st.number_input(
+            "% the withdrawal rate may drift from the initial rate before the withdrawals are cut or raised",
             min_value=0.0,
             max_value=100.0,
-            value=10.0,
-            step=0.1,
+            value=20.0,
+            step=1.0,
+            key="guardrail_input",
         )
-        hybrid_fund_volatility = st.number_input(
-            "% Volatility for Hybrid Instruments/Funds ",
+        withdrawal_params["guardrail_adjustment"] = st.number_input(
+            "% the withdrawals are cut or raised by",
             min_value=0.0,
             max_value=100.0,
             value=10.0,
-            step=0.1,
+            step=1.0,
+            key="guardrail_adjustment_input",
         )
-
-        large_cap_returns = st.number_input(
-            "% Return for Large Cap Funds ",
+    if withdrawal_policy == "floor_ceiling":
+        withdrawal_params["withdrawal_floor"] = st.number_input(
+            "Floor of the withdrawals, in % of the expenses",
             min_value=0.0,
-            max_value=100.0,
-            value=12.0,
-            step=0.1,
+            max_value=1000.0,
+            value=90.0,
+            step=1.0,
+            key="withdrawal_floor_input",
         )
-        large_cap_volatility = st.number_input(
-            "% Volatility for Large Cap Funds",
-            min_value=0.0,
-            max_value=100.0,
-            value=20.0,
-            step=0.1,
+        withdrawal_params["withdrawal_ceiling"] = st.number_input(
+            "Ceiling of the withdrawals, in % of the expenses",
+            min_value=withdrawal_params["withdrawal_floor"],
+            max_value=1000.0,
+            value=max(125.0, withdrawal_params["withdrawal_floor"]),
+            step=1.0,
+            key="withdrawal_ceiling_input",
         )
+    st.session_state["withdrawal_policy"] = withdrawal_policy
+    st.session_state["withdrawal_params"] = withdrawal_params
 
-        mid_cap_returns = st.number_input(
-            "% Return for Small-Mid Cap Funds ",
-            min_value=0.0,
-            max_value=100.0,
-            value=15.0,
-            step=0.1,
+    st.number_input(
+        "% Volatility of Inflation post-retirement (0 keeps it fixed)",
+        min_value=0.0,
+        max_value=100.0,
+        value=0.0,
+        step=0.1,
+        key="inflation_volatility",
+    )
+    # Only the correlations below the diagonal are read, the matrix is mirrored
+    st.write("Correlations of the fund returns and inflation")
+    edited_correlation = st.data_editor(
+        pd.DataFrame(
+            np.eye(len(SCENARIO_LABELS)), index=SCENARIO_LABELS, columns=SCENARIO_LABELS
+        ),
+        key="scenario_correlation_editor",
+    ).to_numpy()
+    lower_correlation = np.tril(edited_correlation, -1)
+    correlation = lower_correlation + lower_correlation.T + np.eye(len(SCENARIO_LABELS))
+    try:
+        correlation_cholesky(correlation)
+    except ValueError as error:
+        st.error(f"{error}, the simulations treat them as independent")
+        correlation = np.eye(len(SCENARIO_LABELS))
+    st.session_state["scenario_correlation"] = correlation.tolist()
+
+    # The fund returns (and inflation, when the file has it) can instead be taken
+    # from history, the fixed deposit returns and the allocations still apply
+    scenario_source = st.selectbox(
+        "Returns used in the simulations", SCENARIO_SOURCES, key="scenario_source"
+    )
+    historical_returns = None
+    block_length = DEFAULT_BLOCK_LENGTH
+    if scenario_source == SCENARIO_SOURCES[1]:
+        historical_returns_path = st.text_input(
+            "Historical returns file (.npy of yearly % returns, see the README)",
+            key="historical_returns_path",
         )
-        mid_cap_volatility = st.number_input(
-            "% Volatility for Small-Mid  Cap Funds",
-            min_value=0.0,
-            max_value=100.0,
-            value=30.0,
-            step=0.1,
+        block_length = st.number_input(
+            "Years in each block of history",
+            min_value=1,
+            max_value=50,
+            value=DEFAULT_BLOCK_LENGTH,
+            step=1,
+            key="block_length_input",
         )
+        try:
+            open_historical_returns(historical_returns_path)
+            historical_returns = historical_returns_path
+        except ValueError as error:
+            st.error(f"{error}, the simulations use normal returns")
+    st.session_state["historical_returns"] = historical_returns
+    st.session_state["block_length"] = block_length
+
+    st.number_input(
+        "Number of times you want to run simulations",
+        min_value=1,
+        max_value=1000000,
+        value=10,
+        step=1,
+        key="num_simulations",
+    )
+    st.number_input(
+        "Random seed for simulations (the same seed repeats the same scenarios)",
+        min_value=0,
+        max_value=2**32 - 1,
+        value=0,
+        step=1,
+        key="simulation_seed",
+    )
+    st.number_input(
+        "Worker processes for large simulations",
+        min_value=1,
+        max_value=256,
+        value=default_workers(),
+        step=1,
+        key="simulation_workers",
+    )
+    # Only these paths are kept from the simulations, the charts show the
+    # percentiles of all of them
+    st.number_input(
+        "Number of simulated paths to draw on the charts",
+        min_value=0,
+        max_value=1000,
+        value=100,
+        step=10,
+        key="simulation_paths_plotted",
+    )
 
-        alloc_fixed = (
-            st.number_input(
-                "% Allocation for Fixed Deposits/Instruments ",
-                min_value=0.0,
-                max_value=100.0,
-                value=50.0,
-                step=0.1,
-            )
-            / 100
-        )
-        alloc_debt = (
-            st.number_input(
-                "% Allocation for Debt Instruments/Funds ",
-                min_value=0.0,
-                max_value=100.0,
-                value=10.0,
-                step=0.1,
-            )
-            / 100
-        )
-        alloc_hybrid = (
-            st.number_input(
-                "% Allocation for Hybrid Instruments/Funds ",
-                min_value=0.0,
-                max_value=100.0,
-                value=20.0,
-                step=0.1,
-            )
-            / 100
+
+with st.sidebar:
+    simulation_assumptions()
+    ########## Stop of sidebar Inputs
+
+
+SIMULATION_FUND_ASSUMPTIONS = (
+    "fixed_deposit_returns",
+    "debt_fund_returns",
+    "debt_fund_volatility",
+    "hybrid_fund_returns",
+    "hybrid_fund_volatility",
+    "large_cap_returns",
+    "large_cap_volatility",
+    "mid_cap_returns",
+    "mid_cap_volatility",
+)
+SIMULATION_ALLOCATIONS = (
+    "alloc_fixed",
+    "alloc_debt",
+    "alloc_hybrid",
+    "alloc_large_cap",
+    "alloc_mid_cap",
+)
+SIMULATION_SCENARIO_ASSUMPTIONS = (
+    "inflation_volatility",
+    "scenario_correlation",
+    "historical_returns",
+    "block_length",
+    "bucket_mode",
+    "refill_threshold",
+    "equity_glide",
+    "withdrawal_policy",
+    "withdrawal_params",
+)
+SIMULATION_SETTINGS = (
+    "num_simulations",
+    "simulation_seed",
+    "simulation_workers",
+    "simulation_paths_plotted",
+)
+
+
+# The sidebar assumptions a section last ran with, along with the section_inputs
+# (keys of its own input widgets) that feed its simulations. They are taken afresh
+# when its "Run simulation" button is pressed, or the first time the section runs
+def applied_simulation_assumptions(section, section_inputs=()):
+    key = f"{section}_simulation_assumptions"
+    if (
+        st.button("Run simulation", key=f"{section}_run_simulation", type="primary")
+        or key not in st.session_state
+    ):
+        st.session_state[key] = {
+            name: st.session_state[name]
+            for name in SIMULATION_FUND_ASSUMPTIONS
+            + SIMULATION_ALLOCATIONS
+            + SIMULATION_SCENARIO_ASSUMPTIONS
+            + SIMULATION_SETTINGS
+            + tuple(section_inputs)
+        }
+    return st.session_state[key]
+
+
+# Fund returns, volatilities, allocations and the correlations between them and
+# inflation as bucket_strategy_simulator takes them. Without correlations the
+# returns are drawn independently, as they always were, which keeps the scenarios
+def bucket_fund_assumptions(assumptions):
+    correlation = assumptions["scenario_correlation"]
+    if np.array_equal(correlation, np.eye(len(SCENARIO_LABELS))):
+        correlation = None
+    return dict(
+        **{name: assumptions[name] for name in SIMULATION_FUND_ASSUMPTIONS},
+        **{name: assumptions[name] / 100 for name in SIMULATION_ALLOCATIONS},
+        inflation_volatility=assumptions["inflation_volatility"],
+        correlation=correlation,
+        historical_returns=assumptions["historical_returns"],
+        block_length=assumptions["block_length"],
+        bucket_mode=assumptions["bucket_mode"],
+        refill_threshold=assumptions["refill_threshold"],
+        equity_glide=assumptions["equity_glide"],
+        withdrawal_policy=assumptions["withdrawal_policy"],
+        withdrawal_params=assumptions["withdrawal_params"],
+    )
+
+
+stage_timer.lap("Simulation inputs")
+
+
+### The entered corpus, drawn down and simulated ###
+# A fragment, so changing the corpus or the target success rate or running the
+# simulation reruns only this section. The corpus is drawn down as it is typed,
+# the simulation and the goal seek take it and the target when Run is pressed
+ENTERED_CORPUS_SIMULATION_INPUTS = ("assumed_retirement_corpus", "target_success_rate")
+
+
+@st.experimental_fragment
+def entered_corpus_section():
+    stage_timer.start()
+    # The target input comes after the Run button, its value has to be there first
+    st.session_state.setdefault("target_success_rate", 90.0)
+
+    col1, col_1_2, col2, col3 = st.columns([1.5, 0.5, 1, 1])
+
+    with col1:
+        assumed_retirement_corpus = st.number_input(
+            label="Enter the corpus amount that you can invest for retirement or think will fund your retirment",
+            min_value=0.0,
+            max_value=1e10,
+            value=1e8,
+            step=1e5,
+            key="assumed_retirement_corpus",
         )
-        alloc_large_cap = (
-            st.number_input(
-                "% Allocation for  Large Cap Funds ",
-                min_value=0.0,
-                max_value=100.0,
-                value=10.0,
-                step=0.1,
+    with col2:
+        if total_retirement_corpus > assumed_retirement_corpus:
+            st.metric(
+                label=f"This is lesser than the required retirement corpus by",
+                value=f"{format_to_inr(total_retirement_corpus-assumed_retirement_corpus)}",
             )
-            / 100
-        )
-        alloc_mid_cap = (
-            st.number_input(
-                "% Allocation for  Small-Mid Cap Funds ",
-                min_value=0.0,
-                max_value=100.0,
-                value=10.0,
-                step=0.1,
+        else:
+            st.write(
+                "The corpus is more than sufficcient for retirement based on your expenses and other factors provided"
             )
-            / 100
-        )
 
-        num_simulations = int(
-            st.number_input(
-                "Number of times you want to run simulations",
-                min_value=1,
-                max_value=1000,
-                value=10,
-                step=1,
-            )
+    balances_assumed_corpus, yearly_expenses_in_retirement = (
+        calc_retirement_balances_n_expenses(
+            initial_corpus=assumed_retirement_corpus,
+            inital_expense=current_expenses_at_retirement,
+            inflation=inflation_after_retirement,
+            returns=net_rate_return_expected_after_retire,
+            n_years_in_retire=estimated_years_retirement,
+            steps_per_year=steps_per_year,
         )
-        ########## Stop of sidebar Inputs
+    )
 
-    balances_results, expenses = bucket_strategy_simulator(
-        initial_corpus=assumed_retirement_corpus,
-        inital_expense=current_expenses_at_retirement,
-        inflation=inflation_after_retirement,
-        returns=net_rate_return_expected_after_retire,
-        n_years_in_retire=estimated_years_retirement,
-        fixed_deposit_returns=fixed_deposit_returns,
-        debt_fund_returns=debt_fund_returns,
-        debt_fund_volatility=debt_fund_volatility,
-        hybrid_fund_returns=hybrid_fund_returns,
-        hybrid_fund_volatility=hybrid_fund_volatility,
-        large_cap_returns=large_cap_returns,
-        large_cap_volatility=large_cap_volatility,
-        mid_cap_returns=mid_cap_returns,
-        mid_cap_volatility=mid_cap_volatility,
-        alloc_fixed=alloc_fixed,
-        alloc_debt=alloc_debt,
-        alloc_hybrid=alloc_hybrid,
-        alloc_large_cap=alloc_large_cap,
-        alloc_mid_cap=alloc_mid_cap,
-        num_simulations=num_simulations,
-    )
-
-    balances_results = np.array(balances_results)
-    mean_retirement_balance_simulation = np.median(balances_results, axis=0)
-    success_rate_bucket_strategy = (
-        np.sum((balances_results[:, -1] > 0)) / num_simulations * 100
-    )
-
-    col1, col2, col3 = st.columns([5.5, 0.5, 3])
+    stage_timer.lap("Drawdown of the entered corpus")
+    lasting_years = sum(np.array(balances_assumed_corpus) > 0)
 
-    with col1:
+    with col3:
+        if total_retirement_corpus > assumed_retirement_corpus:
 
-        st.metric(
-            label=f"Success rate for the entered retirement corpus based on the bucket strategy and based on the expenses",
-            value=f"{success_rate_bucket_strategy} %",
-        )
-        fig = go.Figure()
-
-        # fig.add_trace(
-        #     go.Scatter(
-        #         x=x_axis[(retire_age - current_age) :],
-        #         y=np.array(balances_assumed_corpus),
-        #         mode="lines+markers",
-        #         name="Retirement corpus (based on previous calculations)",
-        #     )
-        # )
-
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
+            st.metric(
+                label=f"Based on the expenses, this corpus will last",
+                value=f"{lasting_years} years",
             )
-        )
-
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=mean_retirement_balance_simulation,
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Mean Corpus from Bucket Strategy",
+        else:
+            st.write(
+                f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
             )
-        )
 
-        fig.update_layout(
-            title="Retirement Portfolio Profile Simulations based on the Bucket Strategy",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
-        )
+    tab1, tab2 = st.tabs(
+        [
+            "Results based on the newly entered retirement corpus ",
+            "Simulation using the Bucket Strategy",
+        ]
+    )
+
+    with tab1:
 
-        for i in range(num_simulations):
+        col1, col2, col3 = st.columns([5.5, 0.5, 3])
+
+        with col1:
+            fig = go.Figure()
 
             fig.add_trace(
                 go.Scatter(
                     x=x_axis[(retire_age - current_age) :],
-                    y=np.array(balances_results[i]),
-                    mode="lines",
-                    opacity=0.3,
-                    showlegend=False,
+                    y=np.array(balances_assumed_corpus),
+                    mode="lines+markers",
+                    line={"color": "teal"},
+                    name="Remaining Retirement corpus",
                 )
             )
 
-        st.plotly_chart(fig)
-
-    with col3:
-        st.metric(
-            label=f"Using the bucket strategy, this corpus may likely last",
-            value=f"{np.sum(mean_retirement_balance_simulation>0)} years",
-        )
-        st.dataframe(
-            pd.DataFrame(
-                dict(
-                    age=range(retire_age, retire_age + estimated_years_retirement),
-                    expenses=yearly_expenses_in_retirement,
-                    retirement_corpus=np.round(mean_retirement_balance_simulation),
+            fig.add_trace(
+                go.Scatter(
+                    x=x_axis[(retire_age - current_age) :],
+                    y=np.array(yearly_expenses_in_retirement),
+                    mode="lines+markers",
+                    line={"color": "red"},
+                    name="Expenses",
                 )
-            ).set_index("age")
-        )
+            )
 
+            fig.update_layout(
+                title="Retirement Profile for the Entered Corpus Amount",
+                xaxis_title="Age",
+                yaxis_title="Amount",
+                legend_title="Legend Title",
+            )
+            set_inr_yaxis(fig)
+            st.plotly_chart(fig)
+
+        with col3:
+
+            st.dataframe(
+                pd.DataFrame(
+                    dict(
+                        age=range(retire_age, retire_age + estimated_years_retirement),
+                        expenses=yearly_expenses_in_retirement,
+                        retirement_corpus=np.round(balances_assumed_corpus),
+                    )
+                )
+                .set_index("age")
+                .apply(format_to_inr_array)
+            )
+    stage_timer.lap("Entered corpus figure and DataFrame")
 
-#################################################################################################################################################
-st.divider()
-st.subheader("Simulation using Percentage Rule")
-tab1, tab2 = st.tabs(
-    [
-        "Results based on the Percentage Rule ",
-        "Simulation using the Bucket Strategy on Corpus obtained from the Percentage Rule ",
-    ]
-)
-with tab1:
+    with tab2:
 
-    col1, col2 = st.columns(2)
+        st.info(
+            "Note: Change the defaults for various types of funds in the sidebar, the corpus or the target success rate and press Run simulation to use them",
+            icon=None,
+        )
+        assumptions = applied_simulation_assumptions(
+            "entered_corpus", ENTERED_CORPUS_SIMULATION_INPUTS
+        )
 
-    with col1:
-        #
-        st.subheader("Simulations using 3% Rule ")
+        bucket_stats = bucket_strategy_simulator_parallel(
+            num_simulations=assumptions["num_simulations"],
+            seed=assumptions["simulation_seed"],
+            max_workers=assumptions["simulation_workers"],
+            keep_paths=assumptions["simulation_paths_plotted"],
+            initial_corpus=assumptions["assumed_retirement_corpus"],
+            inital_expense=current_expenses_at_retirement,
+            inflation=inflation_after_retirement,
+            returns=net_rate_return_expected_after_retire,
+            n_years_in_retire=estimated_years_retirement,
+            steps_per_year=steps_per_year,
+            **bucket_fund_assumptions(assumptions),
+        )
 
-        retirement_corpus_3_pct_rule = 100 / 3 * current_expenses_at_retirement
+        stage_timer.lap("bucket_strategy_simulator_parallel")
 
-        st.metric(
-            label=f"Based on Expenses at the start of retirement {format_to_inr(current_expenses_at_retirement)} & based on the 3% rule, you would require ",
-            value=f"{format_to_inr(round(retirement_corpus_3_pct_rule))}",
-        )
+        median_retirement_balance_simulation = bucket_stats.median()
+        success_rate_bucket_strategy = bucket_stats.success_rate
 
-        balances_3_pct_corpus, yearly_expenses_in_retirement = (
-            calc_retirement_balances_n_expenses(
-                initial_corpus=retirement_corpus_3_pct_rule,
-                inital_expense=current_expenses_at_retirement,
-                inflation=inflation_after_retirement,
-                returns=net_rate_return_expected_after_retire,
-                n_years_in_retire=estimated_years_retirement,
-            )
-        )
+        col1, col2, col3 = st.columns([5.5, 0.5, 3])
 
-        lasting_years_3_pct = sum(np.array(balances_3_pct_corpus) > 0)
+        with col1:
 
-        if total_retirement_corpus > retirement_corpus_3_pct_rule:
+            st.metric(
+                label=f"Success rate for the entered retirement corpus based on the bucket strategy and based on the expenses",
+                value=f"{success_rate_bucket_strategy} %",
+            )
+            fig = simulation_fan_chart(
+                x=x_axis[(retire_age - current_age) :],
+                stats=bucket_stats,
+                yearly_expenses=yearly_expenses_in_retirement,
+                title="Retirement Portfolio Profile Simulations based on the Bucket Strategy",
+                n_sample_paths=assumptions["simulation_paths_plotted"],
+            )
+            st.plotly_chart(fig)
 
+        with col3:
             st.metric(
-                label=f"Based on the expenses and 3% Withdrawal Rule, this corpus will last",
-                value=f"{lasting_years_3_pct} years",
+                label=f"Using the bucket strategy, this corpus may likely last",
+                value=f"{np.sum(median_retirement_balance_simulation>0)} years",
             )
-        else:
-            st.write(
-                f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
+            st.dataframe(
+                pd.DataFrame(
+                    dict(
+                        age=range(retire_age, retire_age + estimated_years_retirement),
+                        expenses=yearly_expenses_in_retirement,
+                        retirement_corpus=np.round(
+                            median_retirement_balance_simulation
+                        ),
+                    )
+                )
+                .set_index("age")
+                .apply(format_to_inr_array)
             )
+        stage_timer.lap("Bucket strategy figure and DataFrame")
 
-        fig = go.Figure()
+        # Goal seek on (at most) the first few thousand of the same simulated scenarios
+        max_simulations_goal_seek = 10000
 
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(balances_3_pct_corpus),
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Remaining Retirement corpus",
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.number_input(
+                label="Target success rate (%) for the bucket strategy",
+                min_value=1.0,
+                max_value=100.0,
+                step=1.0,
+                key="target_success_rate",
             )
+        target_success_rate = assumptions["target_success_rate"]
+
+        min_corpus_for_target = solve_min_corpus_for_success_rate(
+            target_success_rate=target_success_rate,
+            inital_expense=current_expenses_at_retirement,
+            inflation=inflation_after_retirement,
+            n_years_in_retire=estimated_years_retirement,
+            num_simulations=min(
+                assumptions["num_simulations"], max_simulations_goal_seek
+            ),
+            seed=assumptions["simulation_seed"],
+            steps_per_year=steps_per_year,
+            **bucket_fund_assumptions(assumptions),
         )
 
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
+        stage_timer.lap("solve_min_corpus_for_success_rate")
+
+        with col2:
+            st.metric(
+                label=f"Smallest corpus with a {target_success_rate}% success rate based on the bucket strategy",
+                value=(
+                    format_to_inr(round(min_corpus_for_target))
+                    if np.isfinite(min_corpus_for_target)
+                    else "Not reachable"
+                ),
             )
-        )
+        with col3:
+            st.metric(
+                label=f"Total Retirement Corpus required (based on the inputs)",
+                value=f"{format_to_inr(total_retirement_corpus)}",
+            )
+    stage_timer.finish_fragment(timings_history(st.session_state))
 
-        fig.update_layout(
-            title="Retirement Profile based on Amount Obtained from 3 % Rule",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
-        )
-        st.plotly_chart(fig)
 
-    with col2:
-        #
-        st.subheader("Simulations using 4% Rule ")
+entered_corpus_section()
 
-        retirement_corpus_4_pct_rule = 100 / 4 * current_expenses_at_retirement
 
-        st.metric(
-            label=f"Based on Expenses at the start of retirement {format_to_inr(current_expenses_at_retirement)} & based on the 4% rule, you would require ",
-            value=f"{format_to_inr(round(retirement_corpus_4_pct_rule))}",
-        )
+#################################################################################################################################################
+st.divider()
+st.subheader("Simulation using Percentage Rule")
 
-        balances_4_pct_corpus, yearly_expenses_in_retirement = (
-            calc_retirement_balances_n_expenses(
-                initial_corpus=retirement_corpus_4_pct_rule,
-                inital_expense=current_expenses_at_retirement,
-                inflation=inflation_after_retirement,
-                returns=net_rate_return_expected_after_retire,
-                n_years_in_retire=estimated_years_retirement,
-            )
-        )
 
-        lasting_years_4_pct = sum(np.array(balances_4_pct_corpus) > 0)
+### The corpora from the 3% and 4% rules, drawn down and simulated ###
+# A fragment, so running its simulation reruns only this section. Both corpora
+# are simulated on the same returns as the entered corpus (same seed)
+@st.experimental_fragment
+def percentage_rule_section():
+    stage_timer.start()
 
-        if total_retirement_corpus > retirement_corpus_4_pct_rule:
+    (
+        (balances_3_pct_corpus, balances_4_pct_corpus),
+        yearly_expenses_in_retirement,
+    ) = calc_retirement_balances_n_expenses_batch(
+        initial_corpora=[retirement_corpus_3_pct_rule, retirement_corpus_4_pct_rule],
+        inital_expense=current_expenses_at_retirement,
+        inflation=inflation_after_retirement,
+        returns=net_rate_return_expected_after_retire,
+        n_years_in_retire=estimated_years_retirement,
+        steps_per_year=steps_per_year,
+    )
 
-            st.metric(
-                label=f"Based on the expenses and 4% Withdrawal Rule, this corpus will last",
-                value=f"{lasting_years_4_pct} years",
-            )
-        else:
-            st.write(
-                f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
-            )
+    tab1, tab2, tab3 = st.tabs(
+        [
+            "Results based on the Percentage Rule ",
+            "Simulation using the Bucket Strategy on Corpus obtained from the Percentage Rule ",
+            "Backtest of the Percentage Rule on every year of history ",
+        ]
+    )
+    with tab1:
 
-        fig = go.Figure()
+        col1, col2 = st.columns(2)
 
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(balances_4_pct_corpus),
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Remaining Retirement corpus",
-            )
-        )
+        with col1:
+            #
+            st.subheader("Simulations using 3% Rule ")
 
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
+            st.metric(
+                label=f"Based on Expenses at the start of retirement {format_to_inr(current_expenses_at_retirement)} & based on the 3% rule, you would require ",
+                value=f"{format_to_inr(round(retirement_corpus_3_pct_rule))}",
             )
-        )
 
-        fig.update_layout(
-            title="Retirement Profile based on Amount Obtained from 4 % Rule",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
-        )
-        st.plotly_chart(fig)
+            lasting_years_3_pct = sum(np.array(balances_3_pct_corpus) > 0)
 
+            if total_retirement_corpus > retirement_corpus_3_pct_rule:
 
-with tab2:
+                st.metric(
+                    label=f"Based on the expenses and 3% Withdrawal Rule, this corpus will last",
+                    value=f"{lasting_years_3_pct} years",
+                )
+            else:
+                st.write(
+                    f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
+                )
 
-    col1, col2 = st.columns(2)
+            fig = go.Figure()
 
-    with col1:
-        bucket_results_3pct, expenses = bucket_strategy_simulator(
-            initial_corpus=retirement_corpus_3_pct_rule,
-            inital_expense=current_expenses_at_retirement,
-            inflation=inflation_after_retirement,
-            returns=net_rate_return_expected_after_retire,
-            n_years_in_retire=estimated_years_retirement,
-            fixed_deposit_returns=fixed_deposit_returns,
-            debt_fund_returns=debt_fund_returns,
-            debt_fund_volatility=debt_fund_volatility,
-            hybrid_fund_returns=hybrid_fund_returns,
-            hybrid_fund_volatility=hybrid_fund_volatility,
-            large_cap_returns=large_cap_returns,
-            large_cap_volatility=large_cap_volatility,
-            mid_cap_returns=mid_cap_returns,
-            mid_cap_volatility=mid_cap_volatility,
-            alloc_fixed=alloc_fixed,
-            alloc_debt=alloc_debt,
-            alloc_hybrid=alloc_hybrid,
-            alloc_large_cap=alloc_large_cap,
-            alloc_mid_cap=alloc_mid_cap,
-            num_simulations=num_simulations,
-        )
+            fig.add_trace(
+                go.Scatter(
+                    x=x_axis[(retire_age - current_age) :],
+                    y=np.array(balances_3_pct_corpus),
+                    mode="lines+markers",
+                    line={"color": "teal"},
+                    name="Remaining Retirement corpus",
+                )
+            )
 
-        bucket_results_3pct = np.array(bucket_results_3pct)
-        mean_retirement_balance_simulation_3pct = np.median(bucket_results_3pct, axis=0)
-        success_rate_bucket_strategy_3pct = (
-            np.sum((bucket_results_3pct[:, -1] > 0)) / num_simulations * 100
-        )
+            fig.add_trace(
+                go.Scatter(
+                    x=x_axis[(retire_age - current_age) :],
+                    y=np.array(yearly_expenses_in_retirement),
+                    mode="lines+markers",
+                    line={"color": "red"},
+                    name="Expenses",
+                )
+            )
 
-        st.metric(
-            label=f"Success rate for the corpus obtained from 3% rule based on the bucket strategy and based on the expenses",
-            value=f"{success_rate_bucket_strategy_3pct} %",
-        )
-        fig = go.Figure()
-
-        # fig.add_trace(
-        #     go.Scatter(
-        #         x=x_axis[(retire_age - current_age) :],
-        #         y=np.array(balances_assumed_corpus),
-        #         mode="lines+markers",
-        #         name="Retirement corpus (based on previous calculations)",
-        #     )
-        # )
-
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
+            fig.update_layout(
+                title="Retirement Profile based on Amount Obtained from 3 % Rule",
+                xaxis_title="Age",
+                yaxis_title="Amount",
+                legend_title="Legend Title",
             )
-        )
+            set_inr_yaxis(fig)
+            st.plotly_chart(fig)
 
-        fig.add_trace(
-            go.Scatter(
-                x=x_axis[(retire_age - current_age) :],
-                y=mean_retirement_balance_simulation_3pct,
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Mean Corpus from Bucket Strategy",
+        with col2:
+            #
+            st.subheader("Simulations using 4% Rule ")
+
+            st.metric(
+                label=f"Based on Expenses at the start of retirement {format_to_inr(current_expenses_at_retirement)} & based on the 4% rule, you would require ",
+                value=f"{format_to_inr(round(retirement_corpus_4_pct_rule))}",
             )
-        )
 
-        fig.update_layout(
-            title="Retirement Portfolio Profile Simulations based on the Bucket Strategy for 3% Rule",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
-        )
+            lasting_years_4_pct = sum(np.array(balances_4_pct_corpus) > 0)
 
-        for i in range(num_simulations):
+            if total_retirement_corpus > retirement_corpus_4_pct_rule:
+
+                st.metric(
+                    label=f"Based on the expenses and 4% Withdrawal Rule, this corpus will last",
+                    value=f"{lasting_years_4_pct} years",
+                )
+            else:
+                st.write(
+                    f"The corpus is likely to last more than {estimated_years_retirement} years based on your expenses and other factors provided"
+                )
+
+            fig = go.Figure()
 
             fig.add_trace(
                 go.Scatter(
                     x=x_axis[(retire_age - current_age) :],
-                    y=np.array(bucket_results_3pct[i]),
-                    mode="lines",
-                    opacity=0.3,
-                    showlegend=False,
+                    y=np.array(balances_4_pct_corpus),
+                    mode="lines+markers",
+                    line={"color": "teal"},
+                    name="Remaining Retirement corpus",
                 )
             )
 
-        st.plotly_chart(fig)
+            fig.add_trace(
+                go.Scatter(
+                    x=x_axis[(retire_age - current_age) :],
+                    y=np.array(yearly_expenses_in_retirement),
+                    mode="lines+markers",
+                    line={"color": "red"},
+                    name="Expenses",
+                )
+            )
 
-    with col2:
-        bucket_results_4pct, expenses = bucket_strategy_simulator(
-            initial_corpus=retirement_corpus_4_pct_rule,
+            fig.update_layout(
+                title="Retirement Profile based on Amount Obtained from 4 % Rule",
+                xaxis_title="Age",
+                yaxis_title="Amount",
+                legend_title="Legend Title",
+            )
+            set_inr_yaxis(fig)
+            st.plotly_chart(fig)
+    stage_timer.lap("Percentage rule figures")
+
+    with tab2:
+
+        assumptions = applied_simulation_assumptions("percentage_rule")
+
+        # Both rule corpora run on the same simulated returns
+        bucket_stats_3pct, bucket_stats_4pct = bucket_strategy_simulator_parallel(
+            num_simulations=assumptions["num_simulations"],
+            seed=assumptions["simulation_seed"],
+            max_workers=assumptions["simulation_workers"],
+            keep_paths=assumptions["simulation_paths_plotted"],
+            initial_corpus=[
+                retirement_corpus_3_pct_rule,
+                retirement_corpus_4_pct_rule,
+            ],
             inital_expense=current_expenses_at_retirement,
             inflation=inflation_after_retirement,
             returns=net_rate_return_expected_after_retire,
             n_years_in_retire=estimated_years_retirement,
-            fixed_deposit_returns=fixed_deposit_returns,
-            debt_fund_returns=debt_fund_returns,
-            debt_fund_volatility=debt_fund_volatility,
-            hybrid_fund_returns=hybrid_fund_returns,
-            hybrid_fund_volatility=hybrid_fund_volatility,
-            large_cap_returns=large_cap_returns,
-            large_cap_volatility=large_cap_volatility,
-            mid_cap_returns=mid_cap_returns,
-            mid_cap_volatility=mid_cap_volatility,
-            alloc_fixed=alloc_fixed,
-            alloc_debt=alloc_debt,
-            alloc_hybrid=alloc_hybrid,
-            alloc_large_cap=alloc_large_cap,
-            alloc_mid_cap=alloc_mid_cap,
-            num_simulations=num_simulations,
+            steps_per_year=steps_per_year,
+            **bucket_fund_assumptions(assumptions),
         )
 
-        bucket_results_4pct = np.array(bucket_results_4pct)
-        mean_retirement_balance_simulation_4pct = np.median(bucket_results_4pct, axis=0)
-        success_rate_bucket_strategy_4pct = (
-            np.sum((bucket_results_4pct[:, -1] > 0)) / num_simulations * 100
-        )
+        stage_timer.lap("bucket_strategy_simulator_parallel (percentage rules)")
 
-        st.metric(
-            label=f"Success rate for the corpus obtained from 4% rule based on the bucket strategy and based on the expenses",
-            value=f"{success_rate_bucket_strategy_4pct} %",
-        )
-        fig = go.Figure()
-
-        # fig.add_trace(
-        #     go.Scatter(
-        #         x=x_axis[(retire_age - current_age) :],
-        #         y=np.array(balances_assumed_corpus),
-        #         mode="lines+markers",
-        #         name="Retirement corpus (based on previous calculations)",
-        #     )
-        # )
-
-        fig.add_trace(
-            go.Scatter(
+        col1, col2 = st.columns(2)
+
+        with col1:
+            success_rate_bucket_strategy_3pct = bucket_stats_3pct.success_rate
+
+            st.metric(
+                label=f"Success rate for the corpus obtained from 3% rule based on the bucket strategy and based on the expenses",
+                value=f"{success_rate_bucket_strategy_3pct} %",
+            )
+            fig = simulation_fan_chart(
                 x=x_axis[(retire_age - current_age) :],
-                y=np.array(yearly_expenses_in_retirement),
-                mode="lines+markers",
-                line={"color": "red"},
-                name="Expenses",
+                stats=bucket_stats_3pct,
+                yearly_expenses=yearly_expenses_in_retirement,
+                title="Retirement Portfolio Profile Simulations based on the Bucket Strategy for 3% Rule",
+                n_sample_paths=assumptions["simulation_paths_plotted"],
             )
-        )
+            st.plotly_chart(fig)
 
-        fig.add_trace(
-            go.Scatter(
+        with col2:
+            success_rate_bucket_strategy_4pct = bucket_stats_4pct.success_rate
+
+            st.metric(
+                label=f"Success rate for the corpus obtained from 4% rule based on the bucket strategy and based on the expenses",
+                value=f"{success_rate_bucket_strategy_4pct} %",
+            )
+            fig = simulation_fan_chart(
                 x=x_axis[(retire_age - current_age) :],
-                y=mean_retirement_balance_simulation_4pct,
-                mode="lines+markers",
-                line={"color": "teal"},
-                name="Mean Corpus from Bucket Strategy",
+                stats=bucket_stats_4pct,
+                yearly_expenses=yearly_expenses_in_retirement,
+                title="Retirement Portfolio Profile Simulations based on the Bucket Strategy for 4% Rule",
+                n_sample_paths=assumptions["simulation_paths_plotted"],
             )
+            st.plotly_chart(fig)
+    stage_timer.lap("Percentage rule bucket strategy figures")
+
+    with tab3:
+        historical_cohort_section(assumptions)
+    stage_timer.lap("Percentage rule historical backtest")
+    stage_timer.finish_fragment(timings_history(st.session_state))
+
+
+### Both rule corpora retiring in every year of the historical returns file ###
+# On the fund assumptions applied to the bucket strategy simulations
+def historical_cohort_section(assumptions):
+    if assumptions["historical_returns"] is None:
+        st.info(
+            "Choose a historical returns file in the sidebar to see how the corpora would have fared retiring in each year of it"
         )
+        return
 
-        fig.update_layout(
-            title="Retirement Portfolio Profile Simulations based on the Bucket Strategy for 4% Rule",
-            xaxis_title="Age",
-            yaxis_title="Amount",
-            legend_title="Legend Title",
+    first_year = st.number_input(
+        "Year of the first row of the historical returns file",
+        value=1990,
+        step=1,
+        key="historical_first_year",
+    )
+    try:
+        cohort_balances, _, cohort_years_lasted = historical_cohort_backtest(
+            initial_corpus=[
+                retirement_corpus_3_pct_rule,
+                retirement_corpus_4_pct_rule,
+            ],
+            inital_expense=current_expenses_at_retirement,
+            inflation=inflation_after_retirement,
+            n_years_in_retire=estimated_years_retirement,
+            historical_returns=assumptions["historical_returns"],
+            steps_per_year=steps_per_year,
+            bucket_mode=assumptions["bucket_mode"],
+            refill_threshold=assumptions["refill_threshold"],
+            equity_glide=assumptions["equity_glide"],
+            withdrawal_policy=assumptions["withdrawal_policy"],
+            withdrawal_params=assumptions["withdrawal_params"],
+            **{name: assumptions[name] for name in SIMULATION_FUND_ASSUMPTIONS},
+            **{name: assumptions[name] / 100 for name in SIMULATION_ALLOCATIONS},
         )
+    except ValueError as error:
+        st.error(error)
+        return
+
+    start_years = first_year + np.arange(cohort_balances.shape[1])
+    # Depleted at retire_age + years lasted, or never within the retirement
+    depletion_ages = np.where(
+        cohort_years_lasted < estimated_years_retirement,
+        retire_age + cohort_years_lasted,
+        np.nan,
+    )
 
-        for i in range(num_simulations):
+    col1, col2 = st.columns(2)
+    for col, rule, years_lasted, ages in zip(
+        (col1, col2), ("3%", "4%"), cohort_years_lasted, depletion_ages
+    ):
+        with col:
+            worst = np.argmin(years_lasted)
+            st.metric(
+                label=f"Retiring in the worst year of history ({start_years[worst]}), the corpus from the {rule} rule lasts",
+                value=f"{years_lasted[worst]} years",
+            )
+            st.metric(
+                label=f"Retirement years of history in which the corpus from the {rule} rule lasts all {estimated_years_retirement} years",
+                value=f"{np.mean(np.isnan(ages)) * 100:.1f} %",
+            )
 
+            fig = go.Figure()
             fig.add_trace(
-                go.Scatter(
-                    x=x_axis[(retire_age - current_age) :],
-                    y=np.array(bucket_results_4pct[i]),
-                    mode="lines",
-                    opacity=0.3,
-                    showlegend=False,
+                go.Bar(
+                    x=start_years,
+                    y=years_lasted,
+                    marker={"color": "teal"},
+                    name="Years lasted",
                 )
             )
+            fig.update_layout(
+                title=f"Years the corpus from the {rule} rule lasts, by year of retirement",
+                xaxis_title="Year of retirement",
+                yaxis_title="Years lasted",
+            )
+            st.plotly_chart(fig)
+
+    st.dataframe(
+        pd.DataFrame(
+            dict(
+                year_of_retirement=start_years,
+                years_lasted_3_pct_rule=cohort_years_lasted[0],
+                depletion_age_3_pct_rule=depletion_ages[0],
+                years_lasted_4_pct_rule=cohort_years_lasted[1],
+                depletion_age_4_pct_rule=depletion_ages[1],
+            )
+        ).set_index("year_of_retirement")
+    )
+
 
-        st.plotly_chart(fig)
+percentage_rule_section()
+
+
+#################################################################################################################################################
+#### Stage timings
+with st.sidebar:
+    st.checkbox("Show stage timings", key="show_stage_timings")
+    if stage_timer.enabled:
+        stage_timings = timings_history(st.session_state)
+        stage_timer.finish(stage_timings)
+        with st.expander("Stage timings", expanded=True):
+            stage_frame = stage_timer.frame()
+            st.metric(
+                label="Wall time of this run",
+                value=f"{stage_frame['wall_ms'].sum():.0f} ms",
+            )
+            st.dataframe(stage_frame.round(1))
+            st.caption(f"Wall time (ms) of the last {len(stage_timings)} runs")
+            st.dataframe(history_frame(stage_timings).round(1))
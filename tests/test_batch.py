@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from batch_planner import run_batch
+from planner_core.profiles import SUMMARY_FIELDS, plan_profile, plan_profiles
+
+PROFILES = [
+    dict(profile_id="ok-1", num_simulations=20),
+    dict(profile_id="same-ages", current_age=40, retire_age=40),
+    dict(profile_id="bad-policy", num_simulations=20, withdrawal_policy="nope"),
+    dict(profile_id="ok-2", num_simulations=20, current_age=45),
+]
+
+
+def test_summary_fields_match_plan_profile():
+    summary, _ = plan_profile(dict(profile_id="a", num_simulations=5))
+    assert tuple(summary) == SUMMARY_FIELDS
+
+
+def test_failed_profiles_do_not_stop_the_others():
+    summaries, yearly = plan_profiles(PROFILES, include_yearly=True)
+
+    assert [summary["profile_id"] for summary in summaries] == [
+        profile["profile_id"] for profile in PROFILES
+    ]
+    assert summaries[0]["error"] is None and summaries[3]["error"] is None
+    assert summaries[1]["error"].startswith("ValueError: retire_age")
+    assert summaries[2]["error"].startswith("ValueError: Unknown withdrawal_policy")
+    assert set(yearly["profile_id"]) == {"ok-1", "ok-2"}
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet"])
+def test_batch_records_errors_and_carries_on(tmp_path, suffix):
+    profiles_path = tmp_path / "profiles.jsonl"
+    pd.DataFrame(PROFILES).to_json(profiles_path, orient="records", lines=True)
+    output_path = str(tmp_path / f"summary{suffix}")
+
+    # Chunks of one, so some chunks have only failed profiles
+    n_profiles, n_failed, _ = run_batch(
+        str(profiles_path), output_path, max_workers=1, chunk_size=1
+    )
+
+    summary = (
+        pd.read_csv(output_path) if suffix == ".csv" else pd.read_parquet(output_path)
+    )
+    assert (n_profiles, n_failed) == (4, 2)
+    assert list(summary.columns) == list(SUMMARY_FIELDS)
+    assert summary["error"].notna().tolist() == [False, True, True, False]
+    assert summary["lasting_years_assumed_corpus"].notna().tolist() == [
+        True,
+        False,
+        False,
+        True,
+    ]
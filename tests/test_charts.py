@@ -0,0 +1,45 @@
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from charts import set_inr_yaxis
+from planner_core.utils import format_to_inr_array
+
+
+def tick_text(high):
+    fig = set_inr_yaxis(go.Figure(go.Scatter(y=[0, high])))
+    return list(fig.layout.yaxis.ticktext)
+
+
+def test_ticks_of_a_2_5_step_are_shown_exactly():
+    assert tick_text(1.4e7) == [
+        "₹ 0",
+        "₹ 25 L",
+        "₹ 50 L",
+        "₹ 75 L",
+        "₹ 1 Cr",
+        "₹ 1.25 Cr",
+        "₹ 1.5 Cr",
+    ]
+
+
+@pytest.mark.parametrize("high", [7, 3.3e3, 99999, 4.4e5, 1.4e7, 1.9e7, 1.8e8, 2.2e8])
+def test_tick_labels_are_distinct(high):
+    labels = tick_text(high)
+    assert len(set(labels)) == len(labels)
+
+
+@pytest.mark.parametrize(
+    "number, text",
+    [
+        (99999, "₹ 1 L"),
+        (-99999, "₹ -1 L"),
+        (999.96, "₹ 1 K"),
+        (999.94, "₹ 999.9"),
+        (9.999e6, "₹ 1 Cr"),
+        (1.25e7, "₹ 1.2 Cr"),
+        (5e6, "₹ 50 L"),
+    ],
+)
+def test_compact_unit_is_chosen_after_rounding(number, text):
+    assert format_to_inr_array(np.array([number]), compact=True)[0] == text
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from planner_core.utils import (
+    calc_retirement_balances_n_expenses,
+    calc_retirement_balances_n_expenses_batch,
+)
+
+from .test_yearly_values import compound_returns
+
+N_YEARS = 30
+
+
+# The drawdown of one corpus on one path of yearly returns, a year at a time
+def scalar_drawdown(initial_corpus, inital_expense, inflation, returns):
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+    balances = []
+    balance = initial_corpus
+    for i, corpus_returns in enumerate(returns.tolist()):
+        corpus_returns = (
+            corpus_returns / 100 if corpus_returns > 1.0 else corpus_returns
+        )
+        balance = balance * (1 + corpus_returns) - compound_returns(
+            inital_expense, inflation, i
+        )
+        if i == 0:
+            balance = initial_corpus
+        balances.append(max(balance, 0))
+    return balances
+
+
+@pytest.mark.parametrize("corpora_shape", [(3,), (3, 1)])
+def test_every_corpus_is_drawn_down_on_every_path(corpora_shape):
+    corpora = np.array([1.5e7, 3e7, 6e7]).reshape(corpora_shape)
+    returns = np.random.default_rng(4).normal(8, 12, (1000, N_YEARS))
+
+    balances, expenses = calc_retirement_balances_n_expenses_batch(
+        corpora, 1.2e6, 6.0, returns, N_YEARS
+    )
+
+    assert balances.shape == (3, 1000, N_YEARS)
+    np.testing.assert_array_equal(
+        expenses, [compound_returns(1.2e6, 0.06, i) for i in range(N_YEARS)]
+    )
+    for corpus, corpus_balances in zip(corpora.ravel(), balances):
+        for path in (0, 1, 517, 999):
+            np.testing.assert_array_equal(
+                corpus_balances[path],
+                scalar_drawdown(corpus, 1.2e6, 6.0, returns[path]),
+            )
+
+
+def test_a_single_path_keeps_one_row_per_corpus():
+    balances, _ = calc_retirement_balances_n_expenses_batch(
+        [1.5e7, 3e7], 1.2e6, 6.0, 8.0, N_YEARS
+    )
+    assert balances.shape == (2, N_YEARS)
+    for corpus, corpus_balances in zip([1.5e7, 3e7], balances):
+        np.testing.assert_array_equal(
+            corpus_balances,
+            scalar_drawdown(corpus, 1.2e6, 6.0, np.full(N_YEARS, 8.0)),
+        )
+    np.testing.assert_array_equal(
+        calc_retirement_balances_n_expenses(3e7, 1.2e6, 6.0, 8.0, N_YEARS)[0],
+        balances[1],
+    )
+
+
+def test_policy_withdrawals_are_shaped_as_the_balances():
+    returns = np.random.default_rng(5).normal(8, 12, (200, N_YEARS))
+    balances, withdrawals = calc_retirement_balances_n_expenses_batch(
+        [1.5e7, 3e7], 1.2e6, 6.0, returns, N_YEARS, withdrawal_policy="guardrails"
+    )
+    assert balances.shape == withdrawals.shape == (2, 200, N_YEARS)
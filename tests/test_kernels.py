@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from planner_core import kernels
+from planner_core.calculations import bucket_strategy_simulator
+from planner_core.utils import (
+    calc_drawdown_balances,
+    calc_retirement_balances_n_expenses_batch,
+)
+
+from .test_simulations import SIMULATOR_KWARGS, N_YEARS
+
+
+# The kernels as plain Python, in place of Numba compiling them, which checks the
+# loops themselves give the NumPy code's bits whether or not Numba is installed
+@pytest.fixture
+def run_kernels(monkeypatch):
+    def run(use_numba, func, *args, **kwargs):
+        monkeypatch.setattr(kernels, "use_numba", use_numba)
+        for name in ("drawdown_loops", "bucket_drawdown_loops"):
+            monkeypatch.setitem(kernels.compiled_kernels, name, getattr(kernels, name))
+        return func(*args, **kwargs)
+
+    return run
+
+
+@pytest.mark.parametrize("ignore_first_year_expense", [True, False])
+@pytest.mark.parametrize("initial_corpus", [1.2e8, [8e7, 1.2e8, 2e8]])
+def test_bucket_kernel_is_bit_identical(
+    run_kernels, initial_corpus, ignore_first_year_expense
+):
+    kwargs = dict(
+        SIMULATOR_KWARGS,
+        initial_corpus=initial_corpus,
+        ignore_first_year_expense=ignore_first_year_expense,
+        num_simulations=200,
+        seed=5,
+    )
+    simulate = bucket_strategy_simulator.__wrapped__
+    for expected, result in zip(
+        run_kernels(False, simulate, **kwargs), run_kernels(True, simulate, **kwargs)
+    ):
+        np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("ignore_first_year_expense", [True, False])
+def test_drawdown_kernel_is_bit_identical(run_kernels, ignore_first_year_expense):
+    returns = np.random.default_rng(1).normal(6, 9, (50, N_YEARS))
+    for initial_corpora in (np.linspace(1e7, 3e7, 50), 2e7):
+        args = (initial_corpora, 1e6, 6, returns, N_YEARS, ignore_first_year_expense)
+        np.testing.assert_array_equal(
+            run_kernels(True, calc_retirement_balances_n_expenses_batch, *args)[0],
+            run_kernels(False, calc_retirement_balances_n_expenses_batch, *args)[0],
+        )
+
+    args = (
+        np.array([[1e7], [2e7]]),
+        1 + returns / 100,
+        np.arange(N_YEARS) * 1e5,
+        ignore_first_year_expense,
+    )
+    np.testing.assert_array_equal(
+        run_kernels(True, calc_drawdown_balances, *args),
+        run_kernels(False, calc_drawdown_balances, *args),
+    )
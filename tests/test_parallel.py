@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+from planner_core import parallel
+
+
+@pytest.fixture
+def fresh_pool():
+    parallel.shutdown_process_pool()
+    yield
+    parallel.shutdown_process_pool()
+
+
+def test_other_sizes_never_cancel_running_work(fresh_pool):
+    slow = parallel.submit_to_process_pool(1, time.sleep, 1.0)
+    small_pool = parallel.get_process_pool(1)
+
+    # A bigger pool replaces it, the work already sent still finishes
+    bigger_pool = parallel.get_process_pool(2)
+    assert bigger_pool is not small_pool
+    assert slow.result(timeout=60) is None
+    assert not slow.cancelled()
+
+    # Fewer workers share the bigger pool
+    assert parallel.get_process_pool(1) is bigger_pool
+    assert parallel.submit_to_process_pool(1, abs, -3).result(timeout=60) == 3
@@ -0,0 +1,34 @@
+from profiling import StageTimer
+
+
+def test_fragment_reruns_are_runs_of_their_own():
+    history = []
+    timer = StageTimer(enabled=True)
+    timer.lap("Inputs")
+    # A fragment within the script run is booked to the run
+    timer.start()
+    timer.lap("Fragment")
+    timer.finish_fragment(history)
+    assert history == []
+    timer.finish(history)
+    script_run = {stage: dict(record) for stage, record in history[0].items()}
+
+    # The fragment rerunning on its own
+    timer.start()
+    timer.lap("Fragment")
+    timer.finish_fragment(history)
+
+    assert history[0] == script_run
+    assert list(history[0]) == ["Inputs", "Fragment"]
+    assert list(history[1]) == ["Fragment"]
+    assert history[1]["Fragment"]["calls"] == 1
+
+
+def test_disabled_timer_records_nothing():
+    history = []
+    timer = StageTimer()
+    timer.start()
+    timer.lap("Inputs")
+    timer.finish(history)
+    timer.finish_fragment(history)
+    assert history == [] and timer.stages == {}
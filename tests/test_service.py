@@ -0,0 +1,77 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import planner_service
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = planner_service.make_server(port=0, max_workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+@pytest.mark.parametrize(
+    "profile",
+    [
+        dict(retire_age=35, current_age=35),
+        dict(num_simulations=0),
+        dict(inflation_after_retirement="inf"),
+        dict(unknown_field=1),
+        [1, 2],
+    ],
+)
+def test_invalid_profiles_are_bad_requests(server_url, profile):
+    status, body = post(server_url + "/simulation", profile)
+    assert status == 400
+    assert body["error"]
+
+
+def test_unexpected_errors_are_json_500s(server_url, monkeypatch):
+    def failing_endpoint(profile, max_workers):
+        return 1 / 0
+
+    monkeypatch.setitem(planner_service.ENDPOINTS, "/simulation", failing_endpoint)
+    status, body = post(server_url + "/simulation", {})
+    assert status == 500
+    assert "ZeroDivisionError" in body["error"]
+
+
+def test_step_up_as_fast_as_the_returns(server_url):
+    status, body = post(
+        server_url + "/specific_values",
+        dict(annual_increase_investments=12.0, net_rate_return_expected=12.0),
+    )
+    assert status == 200
+    assert body["yearly_corpus"] > 0
+
+
+def test_results_are_strict_json(server_url):
+    status, body = post(
+        server_url + "/simulation",
+        dict(estimated_years_retirement=0, num_simulations=10),
+    )
+    assert status == 200
+    assert body["assumed_corpus"]["success_rate"] is None
+
+
+def test_nan_is_sent_as_null():
+    assert planner_service.to_json_value(
+        dict(a=float("nan"), b=[1.0, float("inf")])
+    ) == dict(a=None, b=[1.0, None])
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from planner_core.calculations import bucket_strategy_simulator
+from planner_core.parallel import bucket_strategy_simulator_parallel, simulate_shard
+
+from .test_withdrawals import FUND_KWARGS
+
+N_YEARS = 25
+SIMULATOR_KWARGS = dict(
+    initial_corpus=1.2e8,
+    inital_expense=5e6,
+    inflation=6.0,
+    returns=8.0,
+    n_years_in_retire=N_YEARS,
+    **FUND_KWARGS,
+)
+CORRELATION = [
+    [1.0, 0.3, 0.1, 0.1, 0.0],
+    [0.3, 1.0, 0.5, 0.4, 0.0],
+    [0.1, 0.5, 1.0, 0.8, -0.1],
+    [0.1, 0.4, 0.8, 1.0, -0.1],
+    [0.0, 0.0, -0.1, -0.1, 1.0],
+]
+SCENARIOS = dict(
+    normal={},
+    monthly=dict(steps_per_year=12),
+    correlated=dict(correlation=CORRELATION, inflation_volatility=1.5),
+    refill=dict(bucket_mode="refill", refill_threshold=5.0),
+    glide=dict(equity_glide=-1.0),
+    guardrails=dict(withdrawal_policy="guardrails"),
+)
+
+
+@pytest.fixture(params=list(SCENARIOS) + ["historical"])
+def scenario(request, tmp_path):
+    if request.param != "historical":
+        return SCENARIOS[request.param]
+    path = str(tmp_path / "returns.npy")
+    rng = np.random.default_rng(11)
+    np.save(path, rng.normal([8, 10, 12, 14, 6], [2, 8, 18, 25, 2], size=(40, 5)))
+    return dict(historical_returns=path, block_length=4)
+
+
+def simulate(num_simulations, first_simulation=0, **kwargs):
+    return bucket_strategy_simulator.__wrapped__(
+        **dict(SIMULATOR_KWARGS, **kwargs),
+        num_simulations=num_simulations,
+        seed=2024,
+        first_simulation=first_simulation,
+    )
+
+
+def test_paths_do_not_depend_on_the_chunks(scenario):
+    balances, expenses, years_lasted = simulate(300, **scenario)
+
+    bounds = [0, 1, 37, 64, 200, 300]
+    chunks = [
+        simulate(last - first, first_simulation=first, **scenario)
+        for first, last in zip(bounds[:-1], bounds[1:])
+    ]
+    np.testing.assert_array_equal(
+        np.concatenate([chunk[0] for chunk in chunks]), balances
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([np.broadcast_to(chunk[1], chunk[0].shape) for chunk in chunks]),
+        np.broadcast_to(expenses, balances.shape),
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([chunk[2] for chunk in chunks]), years_lasted
+    )
+
+
+def test_same_seed_gives_the_same_paths():
+    np.testing.assert_array_equal(simulate(50)[0], simulate(50)[0])
+    assert not np.array_equal(simulate(50)[0], simulate(50, first_simulation=50)[0])
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        dict(initial_corpus=1.2e8),
+        dict(initial_corpus=[1.2e8, 9e7], bucket_mode="refill"),
+    ],
+)
+def test_parallel_statistics_equal_a_single_run(kwargs):
+    simulator_kwargs = dict(SIMULATOR_KWARGS, **kwargs)
+    single = simulate_shard(simulator_kwargs, 7, 0, 1001, keep_paths=True)
+    parallel = bucket_strategy_simulator_parallel.__wrapped__(
+        num_simulations=1001,
+        seed=7,
+        max_workers=3,
+        keep_paths=True,
+        min_simulations_for_pool=0,
+        **simulator_kwargs,
+    )
+
+    if not isinstance(single, list):
+        single, parallel = [single], [parallel]
+    for single_stats, parallel_stats in zip(single, parallel):
+        assert parallel_stats.num_simulations == single_stats.num_simulations
+        np.testing.assert_array_equal(parallel_stats.balances, single_stats.balances)
+        np.testing.assert_array_equal(
+            parallel_stats.success_counts, single_stats.success_counts
+        )
+        np.testing.assert_array_equal(parallel_stats.histogram, single_stats.histogram)
+        np.testing.assert_allclose(
+            parallel_stats.mean_balances, single_stats.mean_balances, rtol=1e-12
+        )
+        np.testing.assert_array_equal(
+            parallel_stats.percentiles([5, 50, 95]),
+            single_stats.percentiles([5, 50, 95]),
+        )
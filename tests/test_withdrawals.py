@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+from planner_core.buckets import BUCKET_MODES
+from planner_core.calculations import (
+    bucket_strategy_simulator,
+    solve_min_corpus_for_success_rate,
+)
+from planner_core.withdrawals import calc_years_lasted
+
+FUND_KWARGS = dict(
+    fixed_deposit_returns=7.0,
+    debt_fund_returns=7.0,
+    debt_fund_volatility=2.0,
+    hybrid_fund_returns=9.0,
+    hybrid_fund_volatility=8.0,
+    large_cap_returns=11.0,
+    large_cap_volatility=15.0,
+    mid_cap_returns=13.0,
+    mid_cap_volatility=22.0,
+    alloc_fixed=0.1,
+    alloc_debt=0.2,
+    alloc_hybrid=0.2,
+    alloc_large_cap=0.3,
+    alloc_mid_cap=0.2,
+)
+EXPENSE = 5e6
+N_YEARS = 30
+N_SIMULATIONS = 2000
+
+
+def success_rate(corpus, withdrawal_policy, **kwargs):
+    _, _, years_lasted = bucket_strategy_simulator.__wrapped__(
+        initial_corpus=corpus,
+        inital_expense=EXPENSE,
+        inflation=6.0,
+        returns=8.0,
+        n_years_in_retire=N_YEARS,
+        num_simulations=N_SIMULATIONS,
+        seed=3,
+        withdrawal_policy=withdrawal_policy,
+        **FUND_KWARGS,
+        **kwargs,
+    )
+    return np.count_nonzero(years_lasted == N_YEARS) / N_SIMULATIONS * 100
+
+
+def solve(withdrawal_policy, target_success_rate=90, **kwargs):
+    return solve_min_corpus_for_success_rate.__wrapped__(
+        target_success_rate=target_success_rate,
+        inital_expense=EXPENSE,
+        inflation=6.0,
+        n_years_in_retire=N_YEARS,
+        num_simulations=N_SIMULATIONS,
+        seed=3,
+        withdrawal_policy=withdrawal_policy,
+        **FUND_KWARGS,
+        **kwargs,
+    )
+
+
+def test_years_lasted_stop_at_the_first_shortfall():
+    balances = np.array([[10.0, 8.0, 6.0, 4.0, 2.0]])
+    withdrawals = np.array([[1.0, 1.0, 0.5, 1.0, 1.0]])
+    expenses = np.ones(5)
+    assert calc_years_lasted(balances, withdrawals, expenses, "constant_real") == 5
+    assert calc_years_lasted(balances, withdrawals, expenses, "guardrails") == 2
+    assert (
+        calc_years_lasted(
+            balances,
+            withdrawals,
+            expenses,
+            "floor_ceiling",
+            dict(withdrawal_floor=50.0),
+        )
+        == 5
+    )
+    # A balance that runs out ends the years too
+    balances[0, 3:] = 0
+    assert calc_years_lasted(balances, np.ones((1, 5)), expenses, "guardrails") == 3
+
+
+def test_shortfalls_are_failures_even_with_money_left():
+    # At the initial rate the withdrawals fall behind the expenses after a year
+    # that does not beat inflation, and guardrails freeze them after a losing
+    # year, however large the corpus
+    for withdrawal_policy in ("percent_of_balance", "guardrails"):
+        for bucket_mode in BUCKET_MODES:
+            assert (
+                success_rate(1000 * EXPENSE, withdrawal_policy, bucket_mode=bucket_mode)
+                < 90
+            )
+            assert np.isinf(solve(withdrawal_policy, bucket_mode=bucket_mode))
+
+
+@pytest.mark.parametrize(
+    "withdrawal_policy, withdrawal_params, target_success_rate",
+    [
+        ("constant_real", None, 90),
+        ("percent_of_balance", None, 40),
+        ("percent_of_balance", dict(withdrawal_rate=4.0), 90),
+        ("guardrails", None, 40),
+        ("floor_ceiling", None, 90),
+    ],
+)
+def test_solver_corpus_reaches_the_target_and_no_less_does(
+    withdrawal_policy, withdrawal_params, target_success_rate
+):
+    corpus = solve(
+        withdrawal_policy, target_success_rate, withdrawal_params=withdrawal_params
+    )
+    assert np.isfinite(corpus)
+    # Far more than a few years of spending
+    assert corpus > 15 * EXPENSE
+    assert (
+        success_rate(corpus, withdrawal_policy, withdrawal_params=withdrawal_params)
+        >= target_success_rate
+    )
+    assert (
+        success_rate(
+            corpus - 2000, withdrawal_policy, withdrawal_params=withdrawal_params
+        )
+        < target_success_rate
+    )
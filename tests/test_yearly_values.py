@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+
+from planner_core.profiles import profile_inputs, specific_values, yearly_values
+
+
+### The yearly table as it was built year by year, before it was built from arrays ###
+def compound_returns(p, r, t):
+    r = r / 100 if r > 1.0 else r
+    return round(p * ((1 + r) ** t))
+
+
+def reference_retirement_balances_n_expenses(
+    initial_corpus, inital_expense, inflation, returns, n_years_in_retire
+):
+    yearly_expenses = []
+    yearly_balances = []
+    inflation = inflation / 100 if inflation > 1.0 else inflation
+    returns = returns / 100 if returns > 1.0 else returns
+    balances_in_retirement = initial_corpus
+    for i in range(n_years_in_retire):
+        inflation_adjusted_expenses = compound_returns(inital_expense, inflation, i)
+        balances_in_retirement = (
+            balances_in_retirement * (1 + returns) - inflation_adjusted_expenses
+        )
+        if i == 0:
+            balances_in_retirement = initial_corpus
+        yearly_balances.append(max(balances_in_retirement, 0))
+        yearly_expenses.append(inflation_adjusted_expenses)
+    return yearly_balances, yearly_expenses
+
+
+def reference_yearly_values(inputs, values):
+    current_age = inputs["current_age"]
+    retire_age = inputs["retire_age"]
+    estimated_years_retirement = inputs["estimated_years_retirement"]
+    years_to_retire = round(retire_age - current_age)
+
+    balances_in_retirement, yearly_expenses_in_retirement = (
+        reference_retirement_balances_n_expenses(
+            values["total_retirement_corpus"],
+            values["current_expenses_at_retirement"],
+            inputs["inflation_after_retirement"],
+            inputs["net_rate_return_expected_after_retire"],
+            estimated_years_retirement,
+        )
+    )
+    full_yearly_expenses = [
+        compound_returns(
+            values["current_safe_monthly_expense"] * 12,
+            inputs["inflation_before_retirement"],
+            i,
+        )
+        for i in range(years_to_retire)
+    ] + yearly_expenses_in_retirement
+
+    amt_invested_yearly_till_retire = [
+        round(
+            values["yearly_corpus"]
+            * (1 + inputs["annual_increase_investments"] / 100) ** i
+        )
+        for i in range(years_to_retire + 1)
+    ] + [0] * (estimated_years_retirement - 1)
+
+    yearly_sip_values = []
+    yearly_sip_value = 0
+    for i in range(years_to_retire):
+        yearly_sip_value = (yearly_sip_value + amt_invested_yearly_till_retire[i]) * (
+            1 + inputs["net_rate_return_expected"] / 100
+        )
+        yearly_sip_values.append(yearly_sip_value)
+
+    yearly_corpus_value = [
+        round(
+            compound_returns(
+                inputs["current_investments"], inputs["return_current_investments"], i
+            )
+            + yearly_sip_values[i]
+        )
+        for i in range(years_to_retire)
+    ] + balances_in_retirement
+
+    return dict(
+        age=list(range(current_age, retire_age + estimated_years_retirement)),
+        expenses=full_yearly_expenses,
+        investment_amount=amt_invested_yearly_till_retire,
+        retirement_corpus=yearly_corpus_value,
+    )
+
+
+################################################
+
+
+PROFILES = [
+    dict(),
+    dict(current_age=25, retire_age=70, estimated_years_retirement=30),
+    dict(current_age=59, retire_age=60, estimated_years_retirement=1),
+    dict(annual_increase_investments=0.0, net_rate_return_expected=0.5),
+    dict(annual_increase_investments=12.0, net_rate_return_expected=12.0),
+    dict(current_investments=0.0, inflation_before_retirement=0.8),
+    dict(current_investments=5e7, net_rate_return_expected_after_retire=2.0),
+    dict(current_monthly_expenses=250000, estimated_years_retirement=50),
+]
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_yearly_values_are_identical_to_the_year_by_year_table(profile):
+    inputs = profile_inputs(profile)
+    values = specific_values(inputs, cached=False)
+
+    reference = reference_yearly_values(inputs, values)
+    table = yearly_values(inputs, values, cached=False)
+
+    for column, expected in reference.items():
+        np.testing.assert_array_equal(table[column], np.array(expected), err_msg=column)
+
+
+# Round amounts and rates in half percents land exactly on half rupees often enough
+# to catch growth factors an ulp away from Python's pow
+def random_profiles(n_profiles, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_profiles):
+        current_age = int(rng.integers(20, 55))
+        yield dict(
+            current_age=current_age,
+            retire_age=current_age + int(rng.integers(1, 30)),
+            estimated_years_retirement=int(rng.integers(1, 40)),
+            current_monthly_expenses=float(rng.integers(1, 50) * 5000),
+            other_annual_expenses=float(rng.integers(0, 20) * 10000),
+            current_investments=float(rng.integers(0, 1000) * 10000),
+            inflation_before_retirement=float(rng.integers(4, 40) / 2),
+            inflation_after_retirement=float(rng.integers(4, 40) / 2),
+            return_current_investments=float(rng.integers(4, 40) / 2),
+            net_rate_return_expected=float(rng.integers(4, 40) / 2),
+            net_rate_return_expected_after_retire=float(rng.integers(4, 40) / 2),
+            annual_increase_investments=float(rng.integers(0, 40) / 2),
+        )
+
+
+def test_yearly_values_are_identical_on_random_profiles():
+    for profile in random_profiles(3000):
+        inputs = profile_inputs(profile)
+        values = specific_values(inputs, cached=False)
+        reference = reference_yearly_values(inputs, values)
+        table = yearly_values(inputs, values, cached=False)
+        for column, expected in reference.items():
+            np.testing.assert_array_equal(
+                table[column], np.array(expected), err_msg=f"{column} of {profile}"
+            )